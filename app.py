@@ -1,7 +1,14 @@
 import logging
+from dotenv import load_dotenv
+
+# Before the service imports, which read their configuration from the environment
+load_dotenv()
+
 from flask import Flask
 from flask_cors import CORS
 from routes import routes_bp
+from services.profiling import init_profiling
+from services.tracing import init_tracing
 
 def create_app():
     app = Flask(__name__, instance_relative_config=False)
@@ -15,6 +22,14 @@ def create_app():
     )
 
     app.register_blueprint(routes_bp)
+    # On-demand (X-Profile-Token) and sampled request profiling, if configured
+    init_profiling(app)
+    # OpenTelemetry spans exported over OTLP, if OTEL_EXPORTER_OTLP_ENDPOINT is set
+    init_tracing(app)
+
+    # Report compaction and partition maintenance run in their own process
+    # (python -m services.maintenance), as does scheduled report pre-generation
+    # (python -m services.report_scheduler)
 
     return app
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Import-time profile of the API's entry points.
+
+Each entry point is imported in a fresh interpreter with `python -X importtime`.
+The report shows the median wall time (interpreter start-up included), the
+slowest modules by self time, and which heavy optional SDKs were loaded.
+The heavy SDKs should only be imported on first use.
+
+Usage:
+    python benchmarks/import_time.py [--repeat 5] [--top 10]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, working directory, code)
+ENTRY_POINTS = [
+    ("app", ROOT, "import app"),
+    ("wsgi (app + create_app)", ROOT, "import wsgi"),
+    ("health check", os.path.join(ROOT, "data_access"), "import check_db_connection"),
+    ("ingestion CLI", ROOT, "import services.ingestion"),
+]
+# Modules that should not be loaded until they are needed
+HEAVY_MODULES = ["openai", "tiktoken", "pyarrow"]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile(cwd: str, code: str) -> Tuple[float, List[Tuple[int, int, str]], List[str]]:
+    """
+    Import code in a fresh interpreter.
+
+    Returns:
+        Tuple of (wall time in ms, (self us, cumulative us, module) rows, heavy modules loaded)
+    """
+    check = f"{code}\nimport sys\nprint(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", check],
+        cwd=cwd, env=env, capture_output=True, text=True, check=False
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    rows = [
+        (int(m.group(1)), int(m.group(2)), m.group(4))
+        for m in map(IMPORT_LINE.match, process.stderr.splitlines()) if m
+    ]
+    heavy = [m for m in process.stdout.strip().split(",") if m]
+    return wall_ms, rows, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile import time of the API entry points")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per entry point (median reported)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    args = parser.parse_args()
+
+    for name, cwd, code in ENTRY_POINTS:
+        runs = [profile(cwd, code) for _ in range(args.repeat)]
+        wall = statistics.median(r[0] for r in runs)
+        # Module timings from the fastest run (least disturbed by noise)
+        _, rows, heavy = min(runs, key=lambda r: r[0])
+
+        print(f"\n{name}: {wall:.0f} ms wall (median of {args.repeat}), {len(rows)} modules")
+        print(f"  heavy modules loaded: {', '.join(heavy) or 'none'}")
+        print(f"  {'self ms':>8}  {'cumul ms':>8}  module")
+        for self_us, cumulative_us, module in sorted(rows, reverse=True)[:args.top]:
+            print(f"  {self_us / 1000:8.1f}  {cumulative_us / 1000:8.1f}  {module}")
+
+
+if __name__ == "__main__":
+    main()
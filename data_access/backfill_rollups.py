@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Script to create or update the daily_nutrient_rollups table, its triggers, and
+backfill it from existing food transactions.
+
+Usage:
+    python data_access/backfill_rollups.py               # apply schema and backfill everything
+    python data_access/backfill_rollups.py --patient-id 3  # recompute one patient's rollups
+"""
+import os
+import sys
+import argparse
+from main import get_db_connection, refresh_daily_nutrient_rollups
+import psycopg2
+
+ROLLUPS_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "initdb", "rollups.sql")
+
+
+def apply_rollups_schema():
+    print(f"Applying {ROLLUPS_SQL}...")
+    with open(ROLLUPS_SQL, "r") as f:
+        sql = f.read()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    conn.commit()
+    cursor.execute("SELECT COUNT(*) FROM daily_nutrient_rollups")
+    print(f"daily_nutrient_rollups has {cursor.fetchone()[0]} rows")
+    cursor.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill daily nutrient rollups")
+    parser.add_argument("--patient-id", type=int, help="Only recompute rollups for this patient")
+    args = parser.parse_args()
+
+    try:
+        if args.patient_id is not None:
+            refreshed = refresh_daily_nutrient_rollups(args.patient_id)
+            print(f"Refreshed {refreshed} days for patient {args.patient_id}")
+        else:
+            apply_rollups_schema()
+    except psycopg2.Error as e:
+        print(f"Backfill failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
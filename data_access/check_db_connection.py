@@ -5,7 +5,7 @@ and populated with sample data.
 """
 import os
 import sys
-from main import get_db_connection
+from main import get_db_connection, get_table_row_estimates
 import psycopg2
 
 def check_connection():
@@ -21,17 +21,22 @@ def check_connection():
 def check_tables(conn):
     print("\nChecking database tables...")
     tables = ['patients', 'allergies', 'nutrition_reference', 'food_transactions', 'nutrient_targets']
-    cursor = conn.cursor()
-    
+
+    # Planner estimates instead of COUNT(*), which scans the whole table
+    try:
+        estimates = get_table_row_estimates(conn, tables)
+    except psycopg2.Error as e:
+        print(f"Error reading table statistics: {e}")
+        return
+
     for table in tables:
-        try:
-            cursor.execute(f"SELECT COUNT(*) FROM {table}")
-            count = cursor.fetchone()[0]
-            print(f"Table '{table}' exists with {count} rows")
-        except psycopg2.Error as e:
-            print(f"Error with table '{table}': {e}")
-    
-    cursor.close()
+        rows = estimates.get(table)
+        if table not in estimates:
+            print(f"Table '{table}' is missing")
+        elif rows is None:
+            print(f"Table '{table}' exists (not analyzed yet)")
+        else:
+            print(f"Table '{table}' exists with about {rows} rows")
 
 def main():
     conn = check_connection()
@@ -17,6 +17,36 @@ CREATE TABLE patients (
     created_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- Case-insensitive name prefix search for the paginated /clients listing
+CREATE INDEX idx_patients_first_name_prefix ON patients (lower(first_name) text_pattern_ops);
+CREATE INDEX idx_patients_last_name_prefix ON patients (lower(last_name) text_pattern_ops);
+
+-- A version per table, bumped by every statement that changes it, so /clients
+-- can answer a conditional request (and stamp Last-Modified, edits included)
+-- without running its page query, and stored reports notice allergy edits
+CREATE TABLE table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    modified_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO table_versions (table_name, version, modified_at)
+    VALUES (TG_TABLE_NAME, 1, NOW())
+    ON CONFLICT (table_name)
+    DO UPDATE SET version = table_versions.version + 1, modified_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER patients_table_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON patients
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+INSERT INTO table_versions (table_name) VALUES ('patients');
+
 -- Allergies Table
 CREATE TABLE allergies (
     id SERIAL PRIMARY KEY,
@@ -30,6 +60,13 @@ CREATE TABLE allergies (
         ON DELETE CASCADE
 );
 
+-- Rows can be edited or deleted without a trace in the table itself
+CREATE TRIGGER allergies_table_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON allergies
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+INSERT INTO table_versions (table_name) VALUES ('allergies');
+
 -- Nutrition Reference Table
 CREATE TABLE nutrition_reference (
     id SERIAL PRIMARY KEY,
@@ -44,13 +81,18 @@ CREATE TABLE nutrition_reference (
 );
 
 -- Food Transactions Table
+-- Range partitioned by month on consumption_date. Date-bounded queries only
+-- scan the matching partitions, and old months can be detached and archived
+-- (see data_access/manage_partitions.py). The partition key has to be part of
+-- the primary key.
 CREATE TABLE food_transactions (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     patient_id INT NOT NULL,
     nutrition_ref_id INT NOT NULL,
     servings DECIMAL(4,2) NOT NULL,
     consumption_date DATE NOT NULL,
     created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, consumption_date),
     CONSTRAINT fk_ft_patient
         FOREIGN KEY(patient_id)
         REFERENCES patients(id)
@@ -59,6 +101,74 @@ CREATE TABLE food_transactions (
         FOREIGN KEY(nutrition_ref_id)
         REFERENCES nutrition_reference(id)
         ON DELETE CASCADE
+) PARTITION BY RANGE (consumption_date);
+
+-- Created on every partition, including ones added later
+CREATE INDEX idx_food_transactions_patient_date ON food_transactions (patient_id, consumption_date);
+
+-- Catches rows for a month whose partition has not been created yet, so an
+-- insert never fails for want of one; ensure_food_transaction_partitions
+-- moves them out when it creates the month's partition
+CREATE TABLE food_transactions_default PARTITION OF food_transactions DEFAULT;
+
+-- Create the monthly partitions food_transactions_YYYY_MM covering
+-- first_day..last_day (inclusive) that do not exist yet; returns how many
+-- were created. Rows of those months already in the default partition are
+-- moved into the new partition.
+CREATE OR REPLACE FUNCTION ensure_food_transaction_partitions(first_day DATE, last_day DATE)
+RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', first_day)::DATE;
+    month_end DATE;
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    -- Concurrent callers creating the same partition would otherwise collide
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_food_transaction_partitions'));
+    WHILE month_start <= last_day LOOP
+        month_end := (month_start + INTERVAL '1 month')::DATE;
+        partition_name := format('food_transactions_%s', to_char(month_start, 'YYYY_MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            -- Without a partition for the month, its rows can only be in the
+            -- default one, which must not hold them once the partition exists.
+            -- Both statements go through food_transactions so the rollup
+            -- triggers see the rows leave and come back.
+            IF EXISTS (SELECT 1 FROM food_transactions WHERE consumption_date >= month_start AND consumption_date < month_end) THEN
+                CREATE TEMP TABLE moved_transactions (LIKE food_transactions) ON COMMIT DROP;
+                WITH moved AS (
+                    DELETE FROM food_transactions
+                    WHERE consumption_date >= month_start AND consumption_date < month_end
+                    RETURNING *
+                )
+                INSERT INTO moved_transactions SELECT * FROM moved;
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF food_transactions FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_end
+            );
+            IF to_regclass('pg_temp.moved_transactions') IS NOT NULL THEN
+                INSERT INTO food_transactions SELECT * FROM moved_transactions;
+                DROP TABLE moved_transactions;
+            END IF;
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for the sample data through three months from now; later months
+-- are created by the API's partition maintenance (services/partitions.py)
+SELECT ensure_food_transaction_partitions(DATE '2025-01-01', (CURRENT_DATE + INTERVAL '3 months')::DATE);
+
+-- Ingestion Batches Table
+-- One row per bulk-loaded batch so client retries are idempotent
+CREATE TABLE ingestion_batches (
+    batch_id VARCHAR(255) PRIMARY KEY,
+    source VARCHAR(255),
+    row_count INT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
 -- Nutrient Targets Table
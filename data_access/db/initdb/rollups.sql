@@ -0,0 +1,172 @@
+-- Daily nutrient rollups
+-- Runs after init.sql on a fresh database and is safe to re-run against an
+-- existing one (see data_access/backfill_rollups.py).
+
+-- One row per patient per day with nutrient totals for that day
+CREATE TABLE IF NOT EXISTS daily_nutrient_rollups (
+    patient_id INT NOT NULL,
+    rollup_date DATE NOT NULL,
+    calories DECIMAL(10,2) NOT NULL DEFAULT 0,
+    protein_g DECIMAL(10,2) NOT NULL DEFAULT 0,
+    fat_g DECIMAL(10,2) NOT NULL DEFAULT 0,
+    carbs_g DECIMAL(10,2) NOT NULL DEFAULT 0,
+    fiber_g DECIMAL(10,2) NOT NULL DEFAULT 0,
+    sodium_mg DECIMAL(12,2) NOT NULL DEFAULT 0,
+    transaction_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (patient_id, rollup_date),
+    CONSTRAINT fk_dnr_patient
+        FOREIGN KEY(patient_id)
+        REFERENCES patients(id)
+        ON DELETE CASCADE
+);
+
+-- Recompute the rollup rows for a set of (patient_id, day) pairs from the
+-- transactions of those days only
+CREATE OR REPLACE FUNCTION refresh_daily_nutrient_rollups(patient_ids INT[], days DATE[])
+RETURNS VOID AS $$
+BEGIN
+    -- Serialize concurrent refreshes of the same day; each later statement
+    -- takes a fresh snapshot, so it sees rows committed by the lock holder
+    PERFORM pg_advisory_xact_lock(k.patient_id, k.rollup_date - DATE '2000-01-01')
+    FROM (
+        SELECT DISTINCT patient_id, rollup_date
+        FROM unnest(patient_ids, days) AS u(patient_id, rollup_date)
+        ORDER BY patient_id, rollup_date
+    ) k;
+
+    INSERT INTO daily_nutrient_rollups (
+        patient_id, rollup_date, calories, protein_g, fat_g, carbs_g, fiber_g, sodium_mg, transaction_count
+    )
+    SELECT
+        ft.patient_id,
+        ft.consumption_date,
+        COALESCE(SUM(nr.calories * ft.servings), 0),
+        COALESCE(SUM(nr.protein_g * ft.servings), 0),
+        COALESCE(SUM(nr.fat_g * ft.servings), 0),
+        COALESCE(SUM(nr.carbs_g * ft.servings), 0),
+        COALESCE(SUM(nr.fiber_g * ft.servings), 0),
+        COALESCE(SUM(nr.sodium_mg * ft.servings), 0),
+        COUNT(*)
+    FROM (SELECT DISTINCT patient_id, rollup_date FROM unnest(patient_ids, days) AS u(patient_id, rollup_date)) k
+    JOIN food_transactions ft
+        ON ft.patient_id = k.patient_id AND ft.consumption_date = k.rollup_date
+    JOIN nutrition_reference nr ON nr.id = ft.nutrition_ref_id
+    GROUP BY ft.patient_id, ft.consumption_date
+    ON CONFLICT (patient_id, rollup_date) DO UPDATE SET
+        calories = EXCLUDED.calories,
+        protein_g = EXCLUDED.protein_g,
+        fat_g = EXCLUDED.fat_g,
+        carbs_g = EXCLUDED.carbs_g,
+        fiber_g = EXCLUDED.fiber_g,
+        sodium_mg = EXCLUDED.sodium_mg,
+        transaction_count = EXCLUDED.transaction_count,
+        updated_at = NOW();
+
+    -- Days whose last transaction was removed
+    DELETE FROM daily_nutrient_rollups r
+    USING unnest(patient_ids, days) AS k(patient_id, rollup_date)
+    WHERE r.patient_id = k.patient_id
+      AND r.rollup_date = k.rollup_date
+      AND NOT EXISTS (
+          SELECT 1 FROM food_transactions ft
+          WHERE ft.patient_id = k.patient_id AND ft.consumption_date = k.rollup_date
+      );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level triggers so bulk loads refresh each affected day once
+CREATE OR REPLACE FUNCTION food_transactions_rollup_insert() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_daily_nutrient_rollups(
+        ARRAY(SELECT patient_id FROM new_rows), ARRAY(SELECT consumption_date FROM new_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION food_transactions_rollup_update() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_daily_nutrient_rollups(
+        ARRAY(SELECT patient_id FROM old_rows UNION ALL SELECT patient_id FROM new_rows),
+        ARRAY(SELECT consumption_date FROM old_rows UNION ALL SELECT consumption_date FROM new_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION food_transactions_rollup_delete() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_daily_nutrient_rollups(
+        ARRAY(SELECT patient_id FROM old_rows), ARRAY(SELECT consumption_date FROM old_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Nutrient values of a food changed: refresh every day it was eaten
+CREATE OR REPLACE FUNCTION nutrition_reference_rollup_update() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_daily_nutrient_rollups(
+        ARRAY(SELECT ft.patient_id FROM food_transactions ft JOIN new_rows n ON n.id = ft.nutrition_ref_id),
+        ARRAY(SELECT ft.consumption_date FROM food_transactions ft JOIN new_rows n ON n.id = ft.nutrition_ref_id));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_food_transactions_rollup_insert ON food_transactions;
+CREATE TRIGGER trg_food_transactions_rollup_insert
+    AFTER INSERT ON food_transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION food_transactions_rollup_insert();
+
+DROP TRIGGER IF EXISTS trg_food_transactions_rollup_update ON food_transactions;
+CREATE TRIGGER trg_food_transactions_rollup_update
+    AFTER UPDATE ON food_transactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION food_transactions_rollup_update();
+
+DROP TRIGGER IF EXISTS trg_food_transactions_rollup_delete ON food_transactions;
+CREATE TRIGGER trg_food_transactions_rollup_delete
+    AFTER DELETE ON food_transactions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION food_transactions_rollup_delete();
+
+DROP TRIGGER IF EXISTS trg_nutrition_reference_rollup_update ON nutrition_reference;
+CREATE TRIGGER trg_nutrition_reference_rollup_update
+    AFTER UPDATE ON nutrition_reference
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION nutrition_reference_rollup_update();
+
+-- Backfill from existing transactions
+INSERT INTO daily_nutrient_rollups (
+    patient_id, rollup_date, calories, protein_g, fat_g, carbs_g, fiber_g, sodium_mg, transaction_count
+)
+SELECT
+    ft.patient_id,
+    ft.consumption_date,
+    COALESCE(SUM(nr.calories * ft.servings), 0),
+    COALESCE(SUM(nr.protein_g * ft.servings), 0),
+    COALESCE(SUM(nr.fat_g * ft.servings), 0),
+    COALESCE(SUM(nr.carbs_g * ft.servings), 0),
+    COALESCE(SUM(nr.fiber_g * ft.servings), 0),
+    COALESCE(SUM(nr.sodium_mg * ft.servings), 0),
+    COUNT(*)
+FROM food_transactions ft
+JOIN nutrition_reference nr ON nr.id = ft.nutrition_ref_id
+GROUP BY ft.patient_id, ft.consumption_date
+ON CONFLICT (patient_id, rollup_date) DO UPDATE SET
+    calories = EXCLUDED.calories,
+    protein_g = EXCLUDED.protein_g,
+    fat_g = EXCLUDED.fat_g,
+    carbs_g = EXCLUDED.carbs_g,
+    fiber_g = EXCLUDED.fiber_g,
+    sodium_mg = EXCLUDED.sodium_mg,
+    transaction_count = EXCLUDED.transaction_count,
+    updated_at = NOW();
+
+-- Remove rollups for days that no longer have transactions
+DELETE FROM daily_nutrient_rollups r
+WHERE NOT EXISTS (
+    SELECT 1 FROM food_transactions ft
+    WHERE ft.patient_id = r.patient_id AND ft.consumption_date = r.rollup_date
+);
+
+SELECT 'Daily nutrient rollups ready!' AS message;
@@ -1,12 +1,59 @@
 import psycopg2
+import psycopg2.errors
 from psycopg2.extras import DictCursor
 
+import io
 import os
+import math
+import time
 import logging
+import threading
+
+
+# Primary database; DATABASE_URL takes precedence over DB_HOST when set
+DATABASE_URL = os.environ.get("DATABASE_URL")
+# Comma-separated DSNs of read replicas for read-only queries
+DATABASE_REPLICA_URLS = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# round_robin or least_latency
+REPLICA_SELECTION = os.environ.get("REPLICA_SELECTION", "round_robin")
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "10"))
+# How often a replica's replication lag is re-measured
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.environ.get("REPLICA_CHECK_INTERVAL_SECONDS", "5"))
+# How long an unreachable or lagging replica is skipped before it is tried again
+REPLICA_RETRY_SECONDS = float(os.environ.get("REPLICA_RETRY_SECONDS", "30"))
+REPLICA_CONNECT_TIMEOUT_SECONDS = int(os.environ.get("REPLICA_CONNECT_TIMEOUT_SECONDS", "2"))
+
+# Seconds of replay lag; zero when the WAL receiver is streaming and everything
+# received has been replayed (an idle primary would otherwise look like growing
+# lag). A replica whose receiver is not streaming stops advancing both LSNs, so
+# it is measured by its last replayed transaction instead, and never reads as
+# current. pg_stat_wal_receiver.status needs pg_monitor or pg_read_all_stats.
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming')
+            THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity'::float8)
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 0)
+    END
+"""
+
+
+# Connection class for new connections (None for psycopg2's own); services.tracing sets a traced one
+_connection_factory = None
+
+
+def set_connection_factory(factory):
+    """Use a psycopg2 connection subclass for every new connection."""
+    global _connection_factory
+    _connection_factory = factory
 
 
 def get_db_connection():
     # Connect to the PostgreSQL database
+    if DATABASE_URL:
+        return psycopg2.connect(DATABASE_URL, connection_factory=_connection_factory)
+
     # Get host from environment variable or default to localhost for local development
     db_host = os.environ.get("DB_HOST", "postgres")
     
@@ -15,13 +62,176 @@ def get_db_connection():
         user="postgres",
         password="pass",
         host=db_host,  # Use Docker service name in container, localhost outside
-        port="5432"
+        port="5432",
+        connection_factory=_connection_factory
     )
     return conn
 
 
+class Replica:
+    """Health, lag and latency of one read replica."""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.latency = None  # moving average of connect time, seconds
+        self.lag = None
+        self.checked_at = 0.0
+        self.skip_until = 0.0
+        self.reads = 0
+        self.failures = 0
+
+
+class ReplicaRouter:
+    """
+    Routes read-only queries to replicas and falls back to the primary.
+
+    Replicas are tried in round-robin or lowest-latency order. One that cannot
+    be reached, or whose replication lag exceeds max_lag, is skipped for
+    retry_seconds and then tried again, so it rejoins automatically once it
+    recovers. With no usable replica, reads go to the primary.
+    """
+
+    def __init__(self, dsns, selection=REPLICA_SELECTION, max_lag=REPLICA_MAX_LAG_SECONDS,
+                 check_interval=REPLICA_CHECK_INTERVAL_SECONDS, retry_seconds=REPLICA_RETRY_SECONDS,
+                 primary_connect=None):
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self.selection = selection
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_seconds = retry_seconds
+        self.primary_connect = primary_connect or get_db_connection
+        self.primary_reads = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _candidates(self, now):
+        with self._lock:
+            available = [r for r in self.replicas if r.skip_until <= now]
+            if self.selection == "least_latency":
+                # Unmeasured replicas first so every replica gets a latency sample
+                return sorted(available, key=lambda r: -1 if r.latency is None else r.latency)
+            start = self._next % len(available) if available else 0
+            self._next += 1
+            return available[start:] + available[:start]
+
+    def _skip(self, replica, reason):
+        with self._lock:
+            replica.failures += 1
+            replica.checked_at = 0.0
+            replica.skip_until = time.monotonic() + self.retry_seconds
+        logging.warning(f"Skipping read replica for {self.retry_seconds:.0f}s: {reason}")
+
+    def connect(self):
+        """Open a connection for read-only queries."""
+        for replica in self._candidates(time.monotonic()):
+            started = time.monotonic()
+            try:
+                conn = psycopg2.connect(replica.dsn, connect_timeout=REPLICA_CONNECT_TIMEOUT_SECONDS,
+                                        connection_factory=_connection_factory)
+            except psycopg2.Error as e:
+                self._skip(replica, str(e).strip())
+                continue
+            elapsed = time.monotonic() - started
+
+            if started - replica.checked_at >= self.check_interval:
+                try:
+                    cur = conn.cursor()
+                    cur.execute(REPLICA_LAG_QUERY)
+                    replica.lag = float(cur.fetchone()[0])
+                    cur.close()
+                    conn.rollback()
+                    replica.checked_at = started
+                except psycopg2.Error as e:
+                    conn.close()
+                    self._skip(replica, str(e).strip())
+                    continue
+                if replica.lag > self.max_lag:
+                    conn.close()
+                    if math.isinf(replica.lag):
+                        self._skip(replica, "WAL receiver is not streaming and nothing has been replayed")
+                    else:
+                        self._skip(replica, f"replication lag {replica.lag:.1f}s exceeds {self.max_lag:.0f}s")
+                    continue
+
+            with self._lock:
+                replica.latency = elapsed if replica.latency is None else 0.8 * replica.latency + 0.2 * elapsed
+                replica.reads += 1
+            return conn
+
+        with self._lock:
+            self.primary_reads += 1
+        return self.primary_connect()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "selection": self.selection,
+                "primary_reads": self.primary_reads,
+                "replicas": [
+                    {
+                        "available": r.skip_until <= now,
+                        # None until measured, or when the replica's freshness is unknown
+                        "lag_seconds": r.lag if r.lag is not None and math.isfinite(r.lag) else None,
+                        "latency_ms": round(r.latency * 1000, 1) if r.latency is not None else None,
+                        "reads": r.reads,
+                        "failures": r.failures,
+                    }
+                    for r in self.replicas
+                ],
+            }
+
+
+_replica_router = ReplicaRouter(DATABASE_REPLICA_URLS)
+
+
+def get_read_connection():
+    """Connection for read-only queries: a healthy replica if configured, otherwise the primary."""
+    if not _replica_router.replicas:
+        return get_db_connection()
+    return _replica_router.connect()
+
+
+def get_replica_stats():
+    """Per-replica routing counters, lag and latency."""
+    return _replica_router.stats()
+
+
+
+def get_table_row_estimates(conn, tables):
+    """
+    Planner row-count estimates (pg_class.reltuples) without scanning the tables.
+
+    Partitioned tables report the sum of their partitions' estimates.
+
+    Args:
+        conn: Open database connection
+        tables: Table names in the public schema
+
+    Returns:
+        Dictionary of table name to estimated rows (None if never analyzed);
+        tables that do not exist are left out
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT p.relname,
+            CASE WHEN p.relkind = 'p' THEN (
+                SELECT SUM(c.reltuples) FILTER (WHERE c.reltuples >= 0)
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = p.oid
+            ) ELSE NULLIF(p.reltuples, -1) END::bigint
+        FROM pg_class p
+        WHERE p.relname = ANY(%s) AND p.relnamespace = 'public'::regnamespace AND p.relkind IN ('r', 'p')
+        """,
+        (list(tables),),
+    )
+    estimates = dict(cur.fetchall())
+    cur.close()
+    return {table: estimates[table] for table in tables if table in estimates}
+
 def get_patients(patient_id=None):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=DictCursor)
     if patient_id:
         cur.execute("SELECT * FROM patients WHERE id = %s", (patient_id,))
@@ -42,8 +252,83 @@ def get_patients(patient_id=None):
     conn.close()
     return [dict(row) for row in patients]
 
+# Columns needed by the client picker; avoids shipping measurements the UI never shows
+PATIENT_LIST_COLUMNS = ("id", "first_name", "last_name", "date_of_birth", "gender", "created_at")
+
+
+def get_patients_page(cursor=None, limit=50, name_prefix=None, gender=None):
+    """
+    Keyset-paginated patient listing ordered by id.
+
+    Args:
+        cursor: Only return patients with an id greater than this value
+        limit: Maximum number of patients to return
+        name_prefix: Case-insensitive prefix matched against first or last name
+        gender: Optional exact gender filter
+
+    Returns:
+        Tuple of (list of patient dictionaries, next cursor or None)
+    """
+    conditions = []
+    params = []
+    if cursor is not None:
+        conditions.append("id > %s")
+        params.append(cursor)
+    if name_prefix:
+        # Escape LIKE wildcards so the prefix is matched literally and the
+        # text_pattern_ops indexes on lower(first_name)/lower(last_name) apply
+        escaped = name_prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("(lower(first_name) LIKE %s OR lower(last_name) LIKE %s)")
+        params.extend([escaped + "%", escaped + "%"])
+    if gender:
+        conditions.append("gender = %s")
+        params.append(gender)
+
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = (
+        f"SELECT {', '.join(PATIENT_LIST_COLUMNS)} FROM patients {where_clause} "
+        "ORDER BY id LIMIT %s"
+    )
+    # Fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=DictCursor)
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    patients = [dict(row) for row in rows[:limit]]
+    next_cursor = patients[-1]["id"] if len(rows) > limit else None
+    logging.info(f"Retrieved page of {len(patients)} patients (cursor={cursor}, next={next_cursor})")
+    return patients, next_cursor
+
+def get_table_version(table_name):
+    """
+    Change counter of a table, bumped by a trigger on every statement that modifies it.
+
+    Args:
+        table_name: Table tracked in table_versions, e.g. "patients"
+
+    Returns:
+        Tuple of (version, modified_at), or None if the table is not tracked
+        (e.g. a database created before table_versions existed)
+    """
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT version, modified_at FROM table_versions WHERE table_name = %s", (table_name,))
+        row = cur.fetchone()
+        cur.close()
+    except psycopg2.errors.UndefinedTable:
+        return None
+    finally:
+        conn.close()
+    return (row[0], row[1]) if row else None
+
 def get_allergies(patient_id=None):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=DictCursor)
     if patient_id:
         cur.execute("SELECT * FROM allergies WHERE patient_id = %s", (patient_id,))
@@ -56,7 +341,7 @@ def get_allergies(patient_id=None):
 
 def get_nutrition_reference(food_name=None):
     import logging
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=DictCursor)
     if food_name:
         cur.execute("SELECT * FROM nutrition_reference WHERE food_name = %s", (food_name,))
@@ -76,17 +361,72 @@ def get_nutrition_reference(food_name=None):
         
     return result_list
 
-# TODO: Get only transactions within the date range
-def get_food_transactions(patient_id=None):
-    import logging
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=DictCursor)
+# Seconds the in-process copy of nutrition_reference is reused
+NUTRITION_REFERENCE_CACHE_SECONDS = int(os.environ.get("NUTRITION_REFERENCE_CACHE_SECONDS", "300"))
+_nutrition_reference_cache = {"rows": None, "loaded_at": 0.0, "version": 0}
+_nutrition_reference_lock = threading.Lock()
+
+
+def get_cached_nutrition_reference():
+    """
+    Get all nutrition references, cached in process.
+
+    Concurrent callers on a cold or expired cache share a single query.
+
+    Returns:
+        List of nutrition reference dictionaries
+    """
+    with _nutrition_reference_lock:
+        cache = _nutrition_reference_cache
+        if cache["rows"] is None or time.monotonic() - cache["loaded_at"] > NUTRITION_REFERENCE_CACHE_SECONDS:
+            cache["rows"] = get_nutrition_reference()
+            cache["loaded_at"] = time.monotonic()
+            cache["version"] += 1
+        return cache["rows"]
+
+
+def get_nutrition_reference_version():
+    """Counter bumped each time the cached nutrition references are reloaded."""
+    get_cached_nutrition_reference()
+    return _nutrition_reference_cache["version"]
+
+
+def invalidate_nutrition_reference_cache():
+    """Drop the cached nutrition references so the next read reloads them."""
+    with _nutrition_reference_lock:
+        _nutrition_reference_cache["rows"] = None
+
+def get_food_transactions(patient_id=None, start_date=None, end_date=None):
+    """
+    Get food transactions, optionally limited to an inclusive date range.
+
+    food_transactions is partitioned by month, so bounding consumption_date
+    lets the planner skip every partition outside the range.
+
+    Args:
+        patient_id: Optional patient to filter by
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        List of food transaction dictionaries
+    """
+    query = "SELECT * FROM food_transactions WHERE TRUE"
+    params = []
     if patient_id:
-        cur.execute("SELECT * FROM food_transactions WHERE patient_id = %s", (patient_id,))
-        logging.info(f"Querying food transactions for patient_id: {patient_id}")
-    else:
-        cur.execute("SELECT * FROM food_transactions")
-        logging.info("Querying all food transactions")
+        query += " AND patient_id = %s"
+        params.append(patient_id)
+    if start_date:
+        query += " AND consumption_date >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND consumption_date <= %s"
+        params.append(end_date)
+
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=DictCursor)
+    cur.execute(query, params)
+    logging.info(f"Querying food transactions for patient_id={patient_id} from {start_date} to {end_date}")
     
     results = cur.fetchall()
     cur.close()
@@ -100,8 +440,167 @@ def get_food_transactions(patient_id=None):
     
     return result_list
 
+# Rows fetched from the server per round trip when streaming
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "5000"))
+
+
+def _stream_query(name, query, params, batch_size):
+    """Yield result rows as dictionaries through a server-side cursor."""
+    conn = get_read_connection()
+    try:
+        # A named cursor keeps the result set on the server. Plain tuples
+        # zipped with the column names are much cheaper per row than DictCursor
+        cur = conn.cursor(name=name)
+        cur.itersize = batch_size
+        cur.execute(query, params)
+        columns = None
+        for row in cur:
+            if columns is None:
+                columns = [column.name for column in cur.description]
+            yield dict(zip(columns, row))
+        cur.close()
+    finally:
+        conn.close()
+
+
+def _patient_date_filters(patient_column, date_column, patient_ids, start_date, end_date):
+    clauses = []
+    params = []
+    if patient_ids:
+        clauses.append(f" AND {patient_column} = ANY(%s)")
+        params.append(list(patient_ids))
+    if start_date:
+        clauses.append(f" AND {date_column} >= %s")
+        params.append(start_date)
+    if end_date:
+        clauses.append(f" AND {date_column} <= %s")
+        params.append(end_date)
+    return "".join(clauses), params
+
+def get_database_time():
+    """
+    The database clock, as of the data a read connection sees.
+
+    On the primary this is now(). A replica only shows what it has replayed, so
+    there it is the commit time of the last replayed transaction, which is
+    never later than the replica's data.
+
+    Returns:
+        Timezone-aware datetime
+    """
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT CASE WHEN pg_is_in_recovery() "
+        "THEN LEAST(COALESCE(pg_last_xact_replay_timestamp(), now()), now()) ELSE now() END"
+    )
+    database_time = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return database_time
+
+
+def get_latest_transaction_created_at(patient_id, start_date=None, end_date=None):
+    """
+    When a patient's transactions in a date range were last written.
+
+    Args:
+        patient_id: ID of the patient
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        The latest created_at as a timezone-aware datetime (comparable with
+        get_database_time), or None if there are no transactions
+    """
+    filters, params = _patient_date_filters("patient_id", "consumption_date", [patient_id], start_date, end_date)
+    conn = get_read_connection()
+    cur = conn.cursor()
+    # created_at is a TIMESTAMP written in the database's time zone
+    cur.execute("SELECT MAX(created_at)::timestamptz FROM food_transactions WHERE TRUE" + filters, params)
+    latest = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return latest
+
+
+def stream_food_transactions(patient_ids=None, start_date=None, end_date=None, batch_size=STREAM_BATCH_SIZE,
+                             order_by_date=False):
+    """
+    Stream food transactions joined with their nutrition values.
+
+    Rows are read through a server-side cursor in batches of batch_size, so
+    memory use does not grow with the size of the result. Nutrient columns
+    are totals for the transaction (per-serving value times servings), as floats.
+
+    Args:
+        patient_ids: Optional list of patient IDs to include
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+        batch_size: Rows fetched per round trip
+        order_by_date: Order by date, patient and id instead of patient, date and id
+
+    Yields:
+        Transaction dictionaries
+    """
+    filters, params = _patient_date_filters("ft.patient_id", "ft.consumption_date", patient_ids, start_date, end_date)
+    order = "ft.consumption_date, ft.patient_id" if order_by_date else "ft.patient_id, ft.consumption_date"
+    query = f"""
+        SELECT
+            ft.id AS transaction_id,
+            ft.patient_id,
+            ft.consumption_date,
+            ft.nutrition_ref_id,
+            nr.food_name,
+            ft.servings::float8 AS servings,
+            (nr.calories * ft.servings)::float8 AS calories,
+            (nr.protein_g * ft.servings)::float8 AS protein_g,
+            (nr.fat_g * ft.servings)::float8 AS fat_g,
+            (nr.carbs_g * ft.servings)::float8 AS carbs_g,
+            (nr.fiber_g * ft.servings)::float8 AS fiber_g,
+            (nr.sodium_mg * ft.servings)::float8 AS sodium_mg
+        FROM food_transactions ft
+        JOIN nutrition_reference nr ON nr.id = ft.nutrition_ref_id
+        WHERE TRUE{filters}
+        ORDER BY {order}, ft.id
+    """
+    return _stream_query("stream_food_transactions", query, params, batch_size)
+
+
+def stream_daily_nutrient_rollups(patient_ids=None, start_date=None, end_date=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream daily nutrient rollups ordered by date and patient.
+
+    Args:
+        patient_ids: Optional list of patient IDs to include
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+        batch_size: Rows fetched per round trip
+
+    Yields:
+        Rollup dictionaries with float nutrient totals
+    """
+    filters, params = _patient_date_filters("patient_id", "rollup_date", patient_ids, start_date, end_date)
+    query = f"""
+        SELECT
+            patient_id,
+            rollup_date,
+            calories::float8 AS calories,
+            protein_g::float8 AS protein_g,
+            fat_g::float8 AS fat_g,
+            carbs_g::float8 AS carbs_g,
+            fiber_g::float8 AS fiber_g,
+            sodium_mg::float8 AS sodium_mg,
+            transaction_count
+        FROM daily_nutrient_rollups
+        WHERE TRUE{filters}
+        ORDER BY rollup_date, patient_id
+    """
+    return _stream_query("stream_daily_nutrient_rollups", query, params, batch_size)
+
+
 def get_nutrient_targets(patient_id=None):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=DictCursor)
     if patient_id:
         cur.execute("SELECT * FROM nutrient_targets WHERE patient_id = %s", (patient_id,))
@@ -110,4 +609,289 @@ def get_nutrient_targets(patient_id=None):
     results = cur.fetchall()
     cur.close()
     conn.close()
-    return [dict(row) for row in results]
\ No newline at end of file
+    return [dict(row) for row in results]
+
+# Nutrients with both a rollup column and a nutrient_targets column
+COHORT_NUTRIENTS = {
+    "calories": ("calories", "calories_target"),
+    "protein": ("protein_g", "protein_target"),
+    "fat": ("fat_g", "fat_target"),
+    "carbs": ("carbs_g", "carbs_target"),
+    "fiber": ("fiber_g", "fiber_target"),
+    "sodium": ("sodium_mg", "sodium_target"),
+}
+
+
+def get_cohort_adherence(start_date, end_date, patient_ids=None):
+    """
+    Per-patient average daily intake as a percentage of target, from daily rollups.
+
+    Averages are over the days with logged intake in the range. Adherence is
+    None where a patient has no logged days or no target for a nutrient.
+
+    Args:
+        start_date: Inclusive start date (YYYY-MM-DD)
+        end_date: Inclusive end date (YYYY-MM-DD)
+        patient_ids: Optional list of patients to limit the query to
+
+    Returns:
+        List of dictionaries with patient_id, first_name, last_name, days_logged
+        and one <nutrient>_adherence value per COHORT_NUTRIENTS entry
+    """
+    averages = ",\n".join(
+        f"AVG(r.{column}) AS {column}" for column, _ in COHORT_NUTRIENTS.values()
+    )
+    adherence = ",\n".join(
+        f"ROUND(100 * a.{column} / NULLIF(t.{target}, 0), 1)::float8 AS {name}_adherence"
+        for name, (column, target) in COHORT_NUTRIENTS.items()
+    )
+    query = f"""
+        WITH averages AS (
+            SELECT p.id AS patient_id, p.first_name, p.last_name,
+                COUNT(r.rollup_date) AS days_logged,
+                {averages}
+            FROM patients p
+            LEFT JOIN daily_nutrient_rollups r
+                ON r.patient_id = p.id AND r.rollup_date BETWEEN %(start)s AND %(end)s
+            WHERE %(patient_ids)s::int[] IS NULL OR p.id = ANY(%(patient_ids)s::int[])
+            GROUP BY p.id
+        )
+        SELECT a.patient_id, a.first_name, a.last_name, a.days_logged,
+            {adherence}
+        FROM averages a
+        LEFT JOIN LATERAL (
+            SELECT * FROM nutrient_targets nt WHERE nt.patient_id = a.patient_id ORDER BY nt.id DESC LIMIT 1
+        ) t ON TRUE
+        ORDER BY a.patient_id
+    """
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=DictCursor)
+    cur.execute(query, {
+        "start": start_date,
+        "end": end_date,
+        "patient_ids": list(patient_ids) if patient_ids is not None else None,
+    })
+    results = cur.fetchall()
+    cur.close()
+    conn.close()
+    return [dict(row) for row in results]
+
+
+
+def get_food_transactions_for_foods(nutrition_ref_ids, patient_ids=None, start_date=None, end_date=None):
+    """
+    Get food transactions of specific foods, optionally for specific patients and dates.
+
+    Args:
+        nutrition_ref_ids: Nutrition reference IDs to include
+        patient_ids: Optional list of patient IDs to include
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        List of food transaction dictionaries ordered by patient and date
+    """
+    if not nutrition_ref_ids:
+        return []
+    filters, params = _patient_date_filters("patient_id", "consumption_date", patient_ids, start_date, end_date)
+    query = (
+        "SELECT * FROM food_transactions WHERE nutrition_ref_id = ANY(%s)"
+        + filters
+        + " ORDER BY patient_id, consumption_date, id"
+    )
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=DictCursor)
+    cur.execute(query, [list(nutrition_ref_ids)] + params)
+    results = cur.fetchall()
+    cur.close()
+    conn.close()
+    return [dict(row) for row in results]
+
+def get_daily_food_items(patient_id, start_date=None, end_date=None):
+    """
+    Get a patient's servings of each food per day, aggregated in the database.
+
+    Args:
+        patient_id: ID of the patient
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        List of dictionaries (consumption_date, nutrition_ref_id, servings, entries) ordered by date
+    """
+    filters, params = _patient_date_filters("patient_id", "consumption_date", [patient_id], start_date, end_date)
+    query = (
+        "SELECT consumption_date, nutrition_ref_id, SUM(servings) AS servings, COUNT(*) AS entries"
+        " FROM food_transactions WHERE TRUE"
+        + filters
+        + " GROUP BY consumption_date, nutrition_ref_id"
+        " ORDER BY consumption_date, nutrition_ref_id"
+    )
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=DictCursor)
+    cur.execute(query, params)
+    results = cur.fetchall()
+    cur.close()
+    conn.close()
+    return [dict(row) for row in results]
+
+def get_daily_nutrient_rollups(patient_id, start_date=None, end_date=None):
+    """
+    Get pre-aggregated daily nutrient totals for a patient.
+
+    Args:
+        patient_id: ID of the patient
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        List of rollup dictionaries ordered by date
+    """
+    query = "SELECT * FROM daily_nutrient_rollups WHERE patient_id = %s"
+    params = [patient_id]
+    if start_date:
+        query += " AND rollup_date >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND rollup_date <= %s"
+        params.append(end_date)
+    query += " ORDER BY rollup_date"
+
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=DictCursor)
+    cur.execute(query, params)
+    results = cur.fetchall()
+    cur.close()
+    conn.close()
+    return [dict(row) for row in results]
+
+
+def refresh_daily_nutrient_rollups(patient_id=None):
+    """
+    Recompute daily nutrient rollups from food_transactions.
+
+    Covers every day that has transactions or an existing rollup row, so stale
+    rows are removed as well.
+
+    Args:
+        patient_id: Optional patient to limit the refresh to
+
+    Returns:
+        Number of (patient, day) pairs refreshed
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        WITH days AS (
+            SELECT patient_id, consumption_date AS rollup_date FROM food_transactions
+            WHERE %(patient_id)s::int IS NULL OR patient_id = %(patient_id)s
+            UNION
+            SELECT patient_id, rollup_date FROM daily_nutrient_rollups
+            WHERE %(patient_id)s::int IS NULL OR patient_id = %(patient_id)s
+        )
+        SELECT refresh_daily_nutrient_rollups(array_agg(patient_id), array_agg(rollup_date)), count(*)
+        FROM days
+        """,
+        {"patient_id": patient_id}
+    )
+    refreshed = cur.fetchone()[1]
+    conn.commit()
+    cur.close()
+    conn.close()
+    logging.info(f"Refreshed {refreshed} daily nutrient rollups (patient_id={patient_id})")
+    return refreshed
+
+
+def ensure_food_transaction_partitions(first_day, last_day):
+    """
+    Create any missing monthly food_transactions partitions for a date range.
+
+    Args:
+        first_day: First date that must be insertable
+        last_day: Last date that must be insertable
+
+    Returns:
+        Number of partitions created
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT ensure_food_transaction_partitions(%s, %s)", (first_day, last_day))
+    created = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    conn.close()
+    if created:
+        logging.info(f"Created {created} food_transactions partitions for {first_day} to {last_day}")
+    return created
+
+
+def get_existing_patient_ids(patient_ids):
+    """Return the subset of patient_ids that exist in the patients table."""
+    if not patient_ids:
+        return set()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM patients WHERE id = ANY(%s)", (list(patient_ids),))
+    existing = {row[0] for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return existing
+
+
+def copy_food_transactions(rows, batch_id, source=None):
+    """
+    Bulk load food transactions with COPY, at most once per batch id.
+
+    The batch id is recorded in the same transaction as the COPY, so a retried
+    batch is either fully loaded once or skipped.
+
+    Args:
+        rows: Iterable of (patient_id, nutrition_ref_id, servings, consumption_date) tuples
+        batch_id: Client-supplied idempotency key for the batch
+        source: Optional description of where the batch came from
+
+    Returns:
+        Number of rows loaded, or None if the batch id was already loaded
+    """
+    buffer = io.StringIO()
+    row_count = 0
+    first_day = last_day = None
+    for patient_id, nutrition_ref_id, servings, consumption_date in rows:
+        buffer.write(f"{patient_id}\t{nutrition_ref_id}\t{servings}\t{consumption_date}\n")
+        row_count += 1
+        first_day = consumption_date if first_day is None else min(first_day, consumption_date)
+        last_day = consumption_date if last_day is None else max(last_day, consumption_date)
+    buffer.seek(0)
+
+    # Creating a partition locks the parent table, so do it in its own short
+    # transaction rather than while the COPY is running
+    if row_count:
+        ensure_food_transaction_partitions(first_day, last_day)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO ingestion_batches (batch_id, source, row_count) VALUES (%s, %s, %s) "
+            "ON CONFLICT (batch_id) DO NOTHING",
+            (batch_id, source, row_count)
+        )
+        if cur.rowcount == 0:
+            conn.rollback()
+            logging.info(f"Ingestion batch {batch_id} already loaded, skipping")
+            return None
+
+        cur.copy_expert(
+            "COPY food_transactions (patient_id, nutrition_ref_id, servings, consumption_date) FROM STDIN",
+            buffer
+        )
+        conn.commit()
+        logging.info(f"Loaded {row_count} food transactions in batch {batch_id}")
+        return row_count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Script to manage the monthly partitions of food_transactions.
+
+Usage:
+    python data_access/manage_partitions.py list
+    python data_access/manage_partitions.py ensure --months-ahead 3
+    python data_access/manage_partitions.py detach --before 2024-01                  # move to the archive schema
+    python data_access/manage_partitions.py detach --before 2024-01 --export-dir dir # write .csv.gz files and drop
+    python data_access/manage_partitions.py migrate   # convert an existing unpartitioned table
+
+The API creates the coming months' partitions at start-up and daily after
+that (services/partitions.py), and bulk ingestion creates the partitions its
+batches need; `ensure` does the same by hand. Rows for a month without a
+partition go to food_transactions_default and are moved into the month's
+partition when it is created.
+"""
+import os
+import re
+import sys
+import gzip
+import argparse
+from datetime import date, timedelta
+from main import ensure_food_transaction_partitions, get_db_connection
+import psycopg2
+from psycopg2 import sql
+
+INITDB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "initdb")
+INIT_SQL = os.path.join(INITDB_DIR, "init.sql")
+ROLLUPS_SQL = os.path.join(INITDB_DIR, "rollups.sql")
+
+BOUND_PATTERN = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def list_partitions(cursor):
+    """Attached partitions as (name, from, to, estimated rows), oldest first."""
+    cursor.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'food_transactions'::regclass
+        """
+    )
+    partitions = []
+    for name, bound, rows in cursor.fetchall():
+        match = BOUND_PATTERN.search(bound)
+        if match:
+            partitions.append((name, date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2)), rows))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def print_partitions():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    for name, start, end, rows in list_partitions(cursor):
+        # reltuples is -1 until the partition has been analyzed
+        print(f"{name}: {start} to {end}, ~{max(rows, 0)} rows")
+    cursor.close()
+    conn.close()
+
+
+def ensure_partitions(months_ahead):
+    today = date.today()
+    last_day = add_months(today, months_ahead + 1) - timedelta(days=1)
+    created = ensure_food_transaction_partitions(today.replace(day=1), last_day)
+    print(f"Created {created} partitions through {last_day}")
+
+
+def detach_partitions(before, archive_schema, export_dir):
+    """Detach every partition that ends on or before `before`, then archive or export it."""
+    conn = get_db_connection()
+    # DETACH ... CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    old_partitions = [p for p in list_partitions(cursor) if p[2] <= before]
+    if not old_partitions:
+        print(f"No partitions end before {before}")
+    if archive_schema and not export_dir:
+        cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(archive_schema)))
+
+    for name, start, end, _ in old_partitions:
+        print(f"Detaching {name} ({start} to {end})...")
+        cursor.execute(sql.SQL("ALTER TABLE food_transactions DETACH PARTITION {} CONCURRENTLY").format(sql.Identifier(name)))
+        # Rollups mirror the live table, so archived days drop out of reports
+        cursor.execute(
+            "DELETE FROM daily_nutrient_rollups WHERE rollup_date >= %s AND rollup_date < %s",
+            (start, end)
+        )
+
+        if export_dir:
+            os.makedirs(export_dir, exist_ok=True)
+            path = os.path.join(export_dir, f"{name}.csv.gz")
+            with gzip.open(path, "wb") as f:
+                cursor.copy_expert(
+                    sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(name)).as_string(conn),
+                    f
+                )
+            cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+            print(f"Exported {name} to {path} and dropped it")
+        else:
+            cursor.execute(
+                sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(sql.Identifier(name), sql.Identifier(archive_schema))
+            )
+            print(f"Moved {name} to schema {archive_schema}")
+
+    cursor.close()
+    conn.close()
+
+
+def migrate_to_partitioned():
+    """Copy an unpartitioned food_transactions into a partitioned one, keeping the old table."""
+    with open(INIT_SQL, "r") as f:
+        function_sql = re.search(
+            r"CREATE OR REPLACE FUNCTION ensure_food_transaction_partitions.*?\$\$ LANGUAGE plpgsql;",
+            f.read(), re.DOTALL
+        ).group(0)
+    with open(ROLLUPS_SQL, "r") as f:
+        rollups_sql = f.read()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'food_transactions'::regclass")
+    if cursor.fetchone()[0] == "p":
+        print("food_transactions is already partitioned")
+        return
+
+    print("Migrating food_transactions to monthly partitions...")
+    cursor.execute(
+        """
+        LOCK TABLE food_transactions IN ACCESS EXCLUSIVE MODE;
+        ALTER TABLE food_transactions RENAME TO food_transactions_unpartitioned;
+        ALTER TABLE food_transactions_unpartitioned RENAME CONSTRAINT food_transactions_pkey TO food_transactions_unpartitioned_pkey;
+        ALTER INDEX IF EXISTS idx_food_transactions_patient_date RENAME TO idx_food_transactions_unpartitioned_patient_date;
+        DROP TRIGGER IF EXISTS trg_food_transactions_rollup_insert ON food_transactions_unpartitioned;
+        DROP TRIGGER IF EXISTS trg_food_transactions_rollup_update ON food_transactions_unpartitioned;
+        DROP TRIGGER IF EXISTS trg_food_transactions_rollup_delete ON food_transactions_unpartitioned;
+
+        CREATE TABLE food_transactions (
+            LIKE food_transactions_unpartitioned INCLUDING DEFAULTS,
+            PRIMARY KEY (id, consumption_date),
+            CONSTRAINT fk_ft_patient FOREIGN KEY(patient_id) REFERENCES patients(id) ON DELETE CASCADE,
+            CONSTRAINT fk_ft_nutrition_ref FOREIGN KEY(nutrition_ref_id) REFERENCES nutrition_reference(id) ON DELETE CASCADE
+        ) PARTITION BY RANGE (consumption_date);
+        CREATE INDEX idx_food_transactions_patient_date ON food_transactions (patient_id, consumption_date);
+        CREATE TABLE food_transactions_default PARTITION OF food_transactions DEFAULT;
+        ALTER SEQUENCE food_transactions_id_seq OWNED BY food_transactions.id;
+        """
+    )
+    cursor.execute(function_sql)
+    cursor.execute(
+        """
+        SELECT ensure_food_transaction_partitions(
+            LEAST(MIN(consumption_date), CURRENT_DATE),
+            (GREATEST(MAX(consumption_date), CURRENT_DATE) + INTERVAL '3 months')::DATE
+        )
+        FROM food_transactions_unpartitioned
+        """
+    )
+    print(f"Created {cursor.fetchone()[0]} partitions")
+    cursor.execute("INSERT INTO food_transactions SELECT * FROM food_transactions_unpartitioned")
+    print(f"Copied {cursor.rowcount} transactions")
+    # Recreate the rollup triggers on the new table
+    cursor.execute(rollups_sql)
+    conn.commit()
+    print("Done. Drop food_transactions_unpartitioned once the new table has been checked.")
+    cursor.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage food_transactions partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List attached partitions")
+    ensure_parser = subparsers.add_parser("ensure", help="Create partitions for the coming months")
+    ensure_parser.add_argument("--months-ahead", type=int, default=3)
+    detach_parser = subparsers.add_parser("detach", help="Detach and archive old partitions")
+    detach_parser.add_argument("--before", required=True, help="YYYY-MM; partitions ending by this month are detached")
+    detach_parser.add_argument("--archive-schema", default="archive", help="Schema detached partitions are moved to")
+    detach_parser.add_argument("--export-dir", help="Write detached partitions to .csv.gz files and drop them instead")
+    subparsers.add_parser("migrate", help="Convert an existing unpartitioned food_transactions table")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            print_partitions()
+        elif args.command == "ensure":
+            ensure_partitions(args.months_ahead)
+        elif args.command == "detach":
+            before = date.fromisoformat(f"{args.before}-01")
+            detach_partitions(before, args.archive_schema, args.export_dir)
+        elif args.command == "migrate":
+            migrate_to_partitioned()
+    except psycopg2.Error as e:
+        print(f"Partition maintenance failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,25 @@
 const API_BASE_URL = window.API_URL || 'http://localhost:5174';
 
 /**
- * Fetch list of clients/patients
- * @returns {Promise<Array>} Array of patient objects
+ * Fetch a page of clients/patients
+ *
+ * The browser cache revalidates pages with If-None-Match, so repeat loads
+ * are answered with a 304 by the API.
+ *
+ * @param {Object} options - Paging and filter options
+ * @param {number} [options.cursor] - Id of the last client on the previous page
+ * @param {string} [options.search] - Name prefix filter
+ * @param {number} [options.limit] - Page size
+ * @returns {Promise<Object>} Object with clients array and next_cursor
  */
-export async function fetchClients() {
+export async function fetchClients({ cursor = null, search = null, limit = null } = {}) {
     try {
-        const response = await fetch(`${API_BASE_URL}/clients`, {
+        const params = new URLSearchParams();
+        if (cursor !== null) params.append('cursor', cursor);
+        if (search) params.append('search', search);
+        if (limit) params.append('limit', limit);
+
+        const response = await fetch(`${API_BASE_URL}/clients?${params}`, {
             mode: 'cors',
         });
         if (!response.ok) {
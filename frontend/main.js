@@ -3,6 +3,8 @@ import { marked } from 'https://cdn.jsdelivr.net/npm/marked@9.0.3/lib/marked.esm
 
 // DOM Elements
 const clientSelect = document.getElementById('clientSelect');
+const clientSearchInput = document.getElementById('clientSearch');
+const loadMoreClientsBtn = document.getElementById('loadMoreClients');
 const startDateInput = document.getElementById('startDate');
 const endDateInput = document.getElementById('endDate');
 const generateReportBtn = document.getElementById('generateReport');
@@ -29,12 +31,44 @@ downloadPdfBtn.style.backgroundColor = '#e74c3c';
 generateReportBtn.parentNode.appendChild(downloadPdfBtn);
 downloadPdfBtn.classList.add('hidden');
 
+// Client list state: the current search and the cursor of the next page
+let clientSearch = '';
+let nextClientsCursor = null;
+// Only the latest search's pages are shown if responses arrive out of order
+let clientsRequestId = 0;
+
+// Load one page of clients; further pages are loaded on demand
+async function loadClients({ reset = false } = {}) {
+    const requestId = ++clientsRequestId;
+    const page = await fetchClients({ cursor: reset ? null : nextClientsCursor, search: clientSearch });
+    if (requestId !== clientsRequestId) return;
+    if (reset) {
+        clientSelect.length = 1;  // keep the "Select a client..." placeholder
+    }
+    populateClientSelect(page.clients);
+    nextClientsCursor = page.next_cursor;
+    loadMoreClientsBtn.classList.toggle('hidden', nextClientsCursor === null);
+}
+
+// Search by name prefix on the server, a moment after typing stops
+let clientSearchTimer = null;
+clientSearchInput.addEventListener('input', () => {
+    clearTimeout(clientSearchTimer);
+    clientSearchTimer = setTimeout(() => {
+        clientSearch = clientSearchInput.value.trim();
+        loadClients({ reset: true }).catch(() => showError('Failed to search clients. Please try again.'));
+    }, 300);
+});
+
+loadMoreClientsBtn.addEventListener('click', () => {
+    loadClients().catch(() => showError('Failed to load more clients. Please try again.'));
+});
+
 // Initialize the dashboard
 async function initializeDashboard() {
     try {
-        const clients = await fetchClients();
-
-        populateClientSelect(clients);
+        // Only the first page; "Load more clients" and search fetch the rest
+        await loadClients({ reset: true });
         
         // Set default dates to current month
         const today = new Date();
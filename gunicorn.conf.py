@@ -0,0 +1,77 @@
+"""
+Gunicorn configuration for production serving.
+
+    gunicorn wsgi:app
+
+The app is imported once in the master and forked into WEB_CONCURRENCY
+workers. Each worker warms its caches before taking traffic, is replaced
+after GUNICORN_MAX_REQUESTS requests (with jitter, so workers do not all
+restart together) or once its RSS exceeds WORKER_MAX_RSS_MB, and finishes
+in-flight requests on shutdown for up to GUNICORN_GRACEFUL_TIMEOUT seconds.
+"""
+import os
+import resource
+import multiprocessing
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5174')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Threads per worker; requests mostly wait on Postgres, the LLM or Node
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+# create_app runs once in the master and starts no threads, so workers fork
+# from a single-threaded process. Report compaction and partition maintenance
+# (python -m services.maintenance) and scheduled report pre-generation, which
+# creates LLM clients, Node subprocesses and storage locks that forked workers
+# must not inherit (python -m services.report_scheduler), run in their own processes
+preload_app = True
+
+# Report generation can wait on the LLM and Chromium
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+# Recycle a worker once its peak RSS passes this many MB (0 disables)
+WORKER_MAX_RSS_MB = int(os.environ.get("WORKER_MAX_RSS_MB", "512"))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def worker_rss_mb():
+    """Peak RSS of the calling process in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before workers are forked
+    from services.warmup import preload_modules
+    server.log.info(f"Preloaded {', '.join(preload_modules()) or 'no modules'} for workers")
+
+
+def post_worker_init(worker):
+    # Runs in the worker right before it starts accepting connections
+    from services.warmup import warm_up
+    results = warm_up()
+    failed = [name for name, result in results.items() if not result["ok"]]
+    worker.log.info(f"Worker {worker.pid} warmed up" + (f" (failed: {', '.join(failed)})" if failed else ""))
+
+
+def post_request(worker, req, environ, resp):
+    if WORKER_MAX_RSS_MB and worker.alive and worker_rss_mb() > WORKER_MAX_RSS_MB:
+        worker.log.info(f"Worker {worker.pid} RSS {worker_rss_mb():.0f} MB exceeds {WORKER_MAX_RSS_MB} MB; recycling")
+        # Stop accepting; in-flight requests finish and the master starts a replacement
+        worker.alive = False
+
+
+def worker_exit(server, worker):
+    # Export the worker's buffered spans before it goes away
+    from services.tracing import shutdown_tracing
+    shutdown_tracing()
+
+
+def on_exit(server):
+    from services.tracing import shutdown_tracing
+    shutdown_tracing()
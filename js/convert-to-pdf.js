@@ -1,17 +1,48 @@
 const puppeteer = require('puppeteer');
 const path = require('path');
 
+// When called with a TRACEPARENT (see services/tracing.py), report each phase on
+// stdout so the caller can record it as a child span of the render
+const TRACED = Boolean(process.env.TRACEPARENT);
 
-async function convertToPDF(htmlPath) {
-    
-    // Launch Chromium
-    const browser = await puppeteer.launch({
+function reportSpan(name, start, end) {
+    if (TRACED && start && end) {
+        console.log(`TRACE_SPAN ${JSON.stringify({ name, start, end })}`);
+    }
+}
+
+async function timed(name, fn) {
+    const start = Date.now();
+    try {
+        return await fn();
+    } finally {
+        reportSpan(name, start, Date.now());
+    }
+}
+
+// Page options shared by every report PDF (render-packet.js uses them too)
+const PDF_OPTIONS = {
+    printBackground: true,
+    preferCSSPageSize: true,
+    margin: {
+        top: '0.25in',
+      },
+};
+
+function launchBrowser() {
+    return timed('browser.launch', () => puppeteer.launch({
         headless: true,
         args: [
             '--no-sandbox',
             '--disable-setuid-sandbox'
           ]
-    });
+    }));
+}
+
+async function convertToPDF(htmlPath) {
+    
+    // Launch Chromium
+    const browser = await launchBrowser();
 
     console.log("HTML PATH: ", htmlPath)
 
@@ -24,24 +55,21 @@ async function convertToPDF(htmlPath) {
     const pdfPath = path.join(dirName, pdfFileName);
 
     const fileUrl = 'file://' + absoluteHtmlPath;
-    await page.goto(fileUrl, {
+    await timed('page.load', () => page.goto(fileUrl, {
         waitUntil: 'networkidle0',
-    });
+    }));
+
+    // The template records when its charts were drawn
+    const chartTiming = await page.evaluate(() => [window.chartsRenderStart, window.chartsRenderEnd]);
+    reportSpan('chart.render', chartTiming[0], chartTiming[1]);
 
     await page.emulateMediaType('screen');
 
     // Save the PDF
-    await page.pdf({
-        path: pdfPath,
-        printBackground: true,
-        preferCSSPageSize: true,
-        margin: {
-            top: '0.25in',
-          },
-    });
+    await timed('page.pdf', () => page.pdf({ ...PDF_OPTIONS, path: pdfPath }));
 
     // Close Chromium
-    await browser.close();
+    await timed('browser.close', () => browser.close());
 }
 
 // If called directly from command line
@@ -66,4 +94,4 @@ if (require.main === module) {
         });
 }
 
-module.exports = { convertToPDF }
\ No newline at end of file
+module.exports = { convertToPDF, launchBrowser, timed, reportSpan, PDF_OPTIONS }
\ No newline at end of file
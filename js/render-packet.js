@@ -0,0 +1,158 @@
+const fs = require('fs');
+const path = require('path');
+const { launchBrowser, timed, reportSpan, PDF_OPTIONS } = require('./convert-to-pdf');
+
+// pdf-lib is only needed to merge a packet into one document
+let PDFDocument = null;
+try {
+    ({ PDFDocument } = require('pdf-lib'));
+} catch (e) {
+    PDFDocument = null;
+}
+
+/*
+ * Renders many patients' reports in one browser session. The report template
+ * (and Chart.js with it) is loaded once, with reportData = null; each patient
+ * is then drawn into the same page with window.renderReport and printed, so a
+ * patient costs one re-render and one page.pdf instead of a browser launch and
+ * a page load.
+ *
+ * The manifest is a JSON file:
+ *   {
+ *     "shell": "<template HTML with reportData = null>",
+ *     "reports": [{"title": "...", "subtitle": "...", "data": {...}, "pdf": "<output path>"}],
+ *     "merged": "<output path of the combined PDF, or null for separate PDFs only>"
+ *   }
+ */
+
+function escapeHtml(value) {
+    return String(value == null ? '' : value)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;');
+}
+
+function tocHtml(entries) {
+    const rows = entries.map(entry => `
+        <tr>
+            <td>${escapeHtml(entry.title)}<div class="subtitle">${escapeHtml(entry.subtitle)}</div></td>
+            <td class="page">${entry.page}</td>
+        </tr>`).join('');
+    return `<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <style>
+        body { font-family: 'Helvetica Neue', Arial, sans-serif; color: #2c3e50; margin: 0.75in; font-size: 12pt; }
+        h1 { border-bottom: 2px solid #3498db; padding-bottom: 8px; }
+        table { width: 100%; border-collapse: collapse; }
+        td { padding: 6px 0; border-bottom: 1px solid #ecf0f1; vertical-align: top; }
+        .subtitle { color: #7f8c8d; font-size: 10pt; }
+        .page { text-align: right; width: 60px; }
+        tr { page-break-inside: avoid; }
+    </style>
+</head>
+<body>
+    <h1>CardWatch Nutrition Reports</h1>
+    <table>${rows}</table>
+</body>
+</html>`;
+}
+
+async function renderToc(browser, reports, pageCounts) {
+    const page = await browser.newPage();
+    let tocPages = 1;
+    let tocPdf = null;
+    // Page numbers depend on the length of the contents itself; a second pass settles them
+    for (let pass = 0; pass < 2; pass++) {
+        let next = tocPages + 1;
+        const entries = reports.map((report, i) => {
+            const entry = { title: report.title, subtitle: report.subtitle, page: next };
+            next += pageCounts[i];
+            return entry;
+        });
+        await page.setContent(tocHtml(entries));
+        tocPdf = await page.pdf({ printBackground: true });
+        const rendered = (await PDFDocument.load(tocPdf)).getPageCount();
+        if (rendered === tocPages) {
+            break;
+        }
+        tocPages = rendered;
+    }
+    await page.close();
+    return tocPdf;
+}
+
+async function mergePdfs(browser, reports, outputPath) {
+    const documents = [];
+    for (const report of reports) {
+        documents.push(await PDFDocument.load(fs.readFileSync(report.pdf)));
+    }
+    const toc = await PDFDocument.load(await renderToc(browser, reports, documents.map(doc => doc.getPageCount())));
+
+    const merged = await PDFDocument.create();
+    merged.setTitle('CardWatch Nutrition Reports');
+    for (const doc of [toc, ...documents]) {
+        const pages = await merged.copyPages(doc, doc.getPageIndices());
+        pages.forEach(page => merged.addPage(page));
+    }
+    fs.writeFileSync(outputPath, await merged.save());
+    return merged.getPageCount();
+}
+
+async function renderPacket(manifestPath) {
+    const manifest = JSON.parse(fs.readFileSync(manifestPath, 'utf8'));
+    if (manifest.merged && !PDFDocument) {
+        throw new Error('Merging a packet requires pdf-lib (npm install in js/)');
+    }
+
+    const browser = await launchBrowser();
+    try {
+        const page = await browser.newPage();
+        const shellUrl = 'file://' + path.resolve(manifest.shell);
+        await timed('page.load', () => page.goto(shellUrl, {
+            waitUntil: 'networkidle0',
+        }));
+        await page.emulateMediaType('screen');
+        // Every patient is printed straight after drawing, so charts must not animate
+        await page.evaluate(() => { Chart.defaults.animation = false; });
+
+        for (const report of manifest.reports) {
+            const start = Date.now();
+            await page.evaluate(data => window.renderReport(data), report.data);
+            const chartTiming = await page.evaluate(() => [window.chartsRenderStart, window.chartsRenderEnd]);
+            reportSpan('chart.render', chartTiming[0], chartTiming[1]);
+            await timed('page.pdf', () => page.pdf({ ...PDF_OPTIONS, path: report.pdf }));
+            console.log(`Rendered ${report.title} in ${Date.now() - start}ms`);
+        }
+
+        if (manifest.merged) {
+            const pages = await timed('packet.merge', () => mergePdfs(browser, manifest.reports, manifest.merged));
+            console.log(`Merged ${manifest.reports.length} reports into ${manifest.merged} (${pages} pages)`);
+        }
+    } finally {
+        await timed('browser.close', () => browser.close());
+    }
+}
+
+// If called directly from command line
+if (require.main === module) {
+
+    if (process.argv.length < 3) {
+        console.error('Please provide a packet manifest as the first argument');
+        process.exit(1);
+    }
+
+    renderPacket(process.argv[2])
+        .then(() => {
+            console.log('Packet rendering complete');
+            process.exit(0);
+        })
+        .catch(err => {
+            console.error('Packet rendering failed:', err);
+            process.exit(1);
+        });
+}
+
+module.exports = { renderPacket };
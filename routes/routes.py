@@ -8,22 +8,78 @@ Defines all API routes and endpoints for the application
 import logging
 import os
 import json
-from flask import Blueprint, jsonify, request, send_from_directory, current_app as app
-from services.aggregator import collect_reporting_data
-from services.report_service import generate_patient_report, get_reports_for_patient
+import re
+import io
+import gzip
+import mimetypes
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, jsonify, request, send_from_directory, current_app as app
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+from services.admission import PRIORITIES, AdmissionRejected, get_admission_controller, get_admission_stats
+from services.allergens import get_caseload_allergen_exposures
+from services.report_packet import PACKET_FORMATS, generate_report_packet
+from services.report_scheduler import get_report_scheduler_stats
+from services.report_service import find_reusable_report, generate_patient_report, get_reports_for_patient
+from services.report_storage import REPORTS_DIR, get_report_storage
+from services.shared_cache import get_patient_bundle, get_patient_bundle_with_read_time, get_shared_cache_stats
 from services.chat_service import process_chat_message
 from services.js_bridge_service import DateTimeEncoder
-from data_access.main import get_patients
+from services.cohort import get_cohort_summary, get_cohort_summary_stats
+from services.health import get_liveness, get_readiness
+from services.food_search import FOOD_SEARCH_DEFAULT_LIMIT, search_foods
+from services.export import EXPORT_FORMATS, export_transactions, parse_patient_ids
+from services.ingestion import IngestionError, format_for_mimetype, ingest_food_transactions, parse_records
+from services.prompt_encoding import get_prompt_encoding_stats
+from services.singleflight import get_singleflight, get_singleflight_stats
+from services.compression import (
+    COMPRESSIBLE_MIMETYPES,
+    MIN_COMPRESS_SIZE,
+    choose_encoding,
+    compress_bytes,
+    find_sidecar,
+    gzip_stream,
+    sidecar_path,
+)
+from data_access.main import get_patients_page, get_replica_stats, get_table_version
 
 # Create Blueprint for all routes
 routes_bp = Blueprint("routes", __name__)
 logger = logging.getLogger(__name__)
 
+DEFAULT_CLIENTS_PAGE_SIZE = 50
+MAX_CLIENTS_PAGE_SIZE = 500
 
-def get_patient_data(patient_id):
-    """Helper function to collect patient data."""
+# Report files are named <patient>_<type>_<YYYYmmdd_HHMMSS>.<ext> (packets packet-<digest>_<YYYYmmdd_HHMMSS>.<ext>) and never rewritten
+IMMUTABLE_REPORT_PATTERN = re.compile(r"_\d{8}_\d{6}\.(pdf|html|zip)$")
+IMMUTABLE_REPORT_MAX_AGE = 365 * 24 * 60 * 60
+COHORT_SUMMARY_DEFAULT_DAYS = int(os.environ.get("COHORT_SUMMARY_DEFAULT_DAYS", "30"))
+
+
+def get_patient_data(patient_id, start_date=None, end_date=None, with_read_time=False):
+    """
+    Helper function to collect patient data, shared by concurrent callers for the same patient.
+
+    A valid YYYY-MM-DD date range limits the transactions read to that range;
+    otherwise the patient's full history is returned. with_read_time=True
+    returns (data, time it was read from the database) instead.
+    """
     logger.info(f"Getting patient data for patient id {patient_id}")
-    return collect_reporting_data(int(patient_id))
+    patient_id = int(patient_id)
+    if not (is_iso_date(start_date) and is_iso_date(end_date)):
+        start_date = end_date = None
+    fetch = get_patient_bundle_with_read_time if with_read_time else get_patient_bundle
+    return get_singleflight("patient_data").do(
+        (patient_id, start_date, end_date, with_read_time), fetch, patient_id, start_date, end_date
+    )
+
+def is_iso_date(value):
+    """Helper function to check for a YYYY-MM-DD date string."""
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+        return True
+    except (TypeError, ValueError):
+        return False
 
 def validate_patient_id(patient_id):
     """Helper function to validate patient ID."""
@@ -36,23 +92,89 @@ def handle_exception(e, message):
     app.logger.error(f"{message}: {str(e)}")
     return jsonify({"error": message, "details": str(e)}), 500
 
+def admission_rejected(e):
+    """Helper function for requests turned away by admission control."""
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, e.status
+
 @routes_bp.route("/", methods=["GET"])
 def status():
     """Health check endpoint"""
     return jsonify(message="CardWatch Reporting API is active")
 
+@routes_bp.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness probe: the process is serving requests. Checks no dependencies."""
+    return jsonify(get_liveness())
+
+
+@routes_bp.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    Readiness probe: database connectivity, table size estimates, PDF renderer
+    and LLM circuit breaker status. Cached for a few seconds; 503 when the
+    database is unreachable.
+    """
+    readiness = get_readiness()
+    return jsonify(readiness), 503 if readiness["status"] == "unavailable" else 200
+
 @routes_bp.route("/clients", methods=["GET"])
 def get_clients():
-    """Get all clients/patients"""
-    patients = get_patients()
+    """
+    Get a page of clients/patients.
+
+    Query params:
+        cursor: id of the last patient on the previous page
+        limit: page size (default 50, max 500)
+        search: case-insensitive first/last name prefix
+        gender: optional gender filter
+
+    Responds with ETag/Last-Modified and honours If-None-Match with a 304.
+    Both come from the patients table version when it is tracked, so a
+    revalidation that finds nothing changed skips the page query.
+    """
+    try:
+        version = get_table_version("patients")
+    except Exception as e:
+        logger.warning(f"Could not read the patients table version: {str(e)}")
+        version = None
+
+    def cacheable(response):
+        if version:
+            response.set_etag(f"patients-v{version[0]}")
+            response.last_modified = version[1]
+        # Allow caching but force revalidation so new patients show up immediately
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    if version and not is_resource_modified(request.environ, etag=f"patients-v{version[0]}", last_modified=version[1]):
+        return cacheable(Response(status=304))
+
+    try:
+        cursor = request.args.get('cursor', type=int)
+        limit = min(max(request.args.get('limit', DEFAULT_CLIENTS_PAGE_SIZE, type=int), 1), MAX_CLIENTS_PAGE_SIZE)
+        patients, next_cursor = get_patients_page(
+            cursor=cursor,
+            limit=limit,
+            name_prefix=request.args.get('search'),
+            gender=request.args.get('gender')
+        )
+    except Exception as e:
+        return handle_exception(e, "Failed to retrieve clients")
 
     logger.info(f"ROUTES: Retrieved {len(patients)} clients from the database")
-    if patients:
-        logger.info(f"Sample client data: {patients[0]}")
-    else:
+    if not patients:
         logger.warning("No clients found in the database!")
 
-    return jsonify(patients)
+    response = jsonify({"clients": patients, "next_cursor": next_cursor})
+    if not version:
+        response.add_etag()
+        created = [p["created_at"] for p in patients if p.get("created_at")]
+        if created:
+            response.last_modified = max(created)
+    return cacheable(response).make_conditional(request)
 
 
 @routes_bp.route("/generate-report", methods=["GET"])
@@ -68,24 +190,103 @@ def generate_report():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     sections_param = request.args.get('sections')
-    include_ai = request.args.get('include_ai', 'true').lower() == 'true'
+    # include_ai: true (AI with local fallback), fast (local analysis only) or false
+    include_ai_param = request.args.get('include_ai', 'true').lower()
+    include_ai = 'fast' if include_ai_param == 'fast' else include_ai_param == 'true'
     sections = [s.strip() for s in sections_param.split(',')] if sections_param else None
+    # refresh=true regenerates even if a matching report was already generated
+    refresh = request.args.get('refresh', 'false').lower() == 'true'
+    # priority=batch queues behind interactive report requests and is shed first
+    priority = PRIORITIES.get(request.args.get('priority', 'interactive').lower())
+    if priority is None:
+        return jsonify({"error": f"priority must be one of {', '.join(PRIORITIES)}"}), 400
     logger.info(f"Start date: {start_date}")
     try:
-        patient_data = get_patient_data(patient_id)
-        report_result = generate_patient_report(
-            patient_data,
-            patient_id=patient_id,
-            start_date=start_date,
-            end_date=end_date,
-            sections=sections,
-            include_ai=include_ai
-        )
+        if not refresh:
+            reusable = find_reusable_report(patient_id, start_date, end_date, sections, include_ai)
+            if reusable:
+                logger.info(f"Returning stored report {reusable['filename']} for patient {patient_id}")
+                return jsonify({
+                    "status": "Report generated",
+                    "file": reusable["filename"],
+                    "path": get_report_storage().local_path(reusable["filename"]),
+                    "format": "pdf",
+                    "sections_included": sections,
+                    "generated_at": reusable["generated_at"],
+                    "cached": True,
+                })
+
+        def generate():
+            with get_admission_controller("reports").admit(priority):
+                patient_data, data_read_at = get_patient_data(patient_id, start_date, end_date, with_read_time=True)
+                return generate_patient_report(
+                    patient_data,
+                    patient_id=patient_id,
+                    start_date=start_date,
+                    end_date=end_date,
+                    sections=sections,
+                    include_ai=include_ai,
+                    data_read_at=data_read_at
+                )
+
+        # Identical concurrent report requests share one generation (and one admission
+        # slot). Admission is taken at the leader's priority, so only requests of the
+        # same priority are coalesced: an interactive one never waits in a batch queue
+        report_key = (str(patient_id), start_date, end_date, tuple(sections or ()), include_ai, priority)
+        report_result = get_singleflight("generate_report").do(report_key, generate)
 
         return jsonify(report_result)
+    except AdmissionRejected as e:
+        return admission_rejected(e)
     except Exception as e:
         return handle_exception(e, "Failed to generate report")
 
+@routes_bp.route("/generate-report-packet", methods=["GET"])
+def generate_report_packet_route():
+    """
+    Generate one packet of reports for several patients, rendered in a single
+    browser session.
+
+    Query parameters: patient_ids (comma-separated), start_date and end_date
+    (YYYY-MM-DD), format (pdf for one document with a table of contents, zip
+    for a PDF per patient), include_ai (default fast) and priority (default
+    batch).
+    """
+    try:
+        patient_ids = parse_patient_ids(request.args.get('patient_ids'))
+    except ValueError:
+        return jsonify({"error": "patient_ids must be a comma-separated list of integers"}), 400
+    if not patient_ids:
+        return jsonify({"error": "patient_ids is required"}), 400
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if any(d is not None and not is_iso_date(d) for d in (start_date, end_date)):
+        return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
+    fmt = request.args.get('format', 'pdf').lower()
+    if fmt not in PACKET_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(PACKET_FORMATS)}"}), 400
+    include_ai_param = request.args.get('include_ai', 'fast').lower()
+    include_ai = 'fast' if include_ai_param == 'fast' else include_ai_param == 'true'
+    priority = PRIORITIES.get(request.args.get('priority', 'batch').lower())
+    if priority is None:
+        return jsonify({"error": f"priority must be one of {', '.join(PRIORITIES)}"}), 400
+
+    def generate():
+        # The whole packet is one render, so it holds one reports slot
+        with get_admission_controller("reports").admit(priority):
+            return generate_report_packet(patient_ids, start_date, end_date, format=fmt, include_ai=include_ai)
+
+    try:
+        # Coalesced per priority, like /generate-report
+        packet_key = (tuple(patient_ids), start_date, end_date, fmt, include_ai, priority)
+        return jsonify(get_singleflight("report_packet").do(packet_key, generate))
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return handle_exception(e, "Failed to generate report packet")
+
 @routes_bp.route("/get-patient-reports", methods=["GET"])
 def get_patient_reports():
     """
@@ -106,10 +307,75 @@ def get_patient_reports():
 
 @routes_bp.route('/reports/<path:filename>', methods=["GET"])
 def serve_report(filename):
-    REPORTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'reports'))
+    """
+    Serve a generated report file.
+
+    Timestamped report files never change once written, so they are served with
+    long-lived immutable cache headers. Range requests are handled by
+    send_from_directory; whole-file requests use a precompressed sidecar when
+    one exists and the client accepts it. Filenames are storage keys and may
+    include shard directories.
+    """
     logger.info(f"Reports DIR: {REPORTS_DIR}")
     logger.info(f"Serving report: {filename}")
-    return send_from_directory(REPORTS_DIR, filename)
+
+    immutable = bool(IMMUTABLE_REPORT_PATTERN.search(filename))
+    max_age = IMMUTABLE_REPORT_MAX_AGE if immutable else None
+
+    encoding = None
+    path = safe_join(REPORTS_DIR, filename)
+    if immutable and path and 'Range' not in request.headers:
+        encoding = find_sidecar(path, request.accept_encodings)
+
+    if encoding:
+        response = send_from_directory(
+            REPORTS_DIR,
+            sidecar_path(filename, encoding),
+            mimetype=mimetypes.guess_type(filename)[0],
+            max_age=max_age
+        )
+        response.headers['Content-Encoding'] = encoding
+    elif path and not os.path.exists(path) and os.path.exists(sidecar_path(path, 'gzip')):
+        # Intermediate HTML compacted to its sidecar and the client can't take gzip
+        with gzip.open(sidecar_path(path, 'gzip'), 'rb') as f:
+            response = Response(f.read(), mimetype=mimetypes.guess_type(filename)[0])
+        if max_age:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+    else:
+        response = send_from_directory(REPORTS_DIR, filename, max_age=max_age)
+
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+@routes_bp.after_app_request
+def compress_response(response):
+    """Compress JSON and HTML responses when the client accepts it."""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    data = response.get_data()
+    if not encoding or len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compress_bytes(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is a different representation of the same resource
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
 
 
 @routes_bp.route("/chat", methods=["POST"])
@@ -132,13 +398,159 @@ def chat():
         return jsonify({"error": "Message is required"}), 400
 
     try:
-        patient_data = get_patient_data(patient_id)
-        chat_result = process_chat_message(
-            patient_data=patient_data,
-            patient_id=patient_id,
-            message=message,
-            chat_history=chat_history
-        )
+        with get_admission_controller("chat").admit():
+            patient_data = get_patient_data(patient_id)
+            chat_result = process_chat_message(
+                patient_data=patient_data,
+                patient_id=patient_id,
+                message=message,
+                chat_history=chat_history
+            )
         return jsonify(chat_result)
+    except AdmissionRejected as e:
+        return admission_rejected(e)
     except Exception as e:
-        return handle_exception(e, "Failed to process chat message")
\ No newline at end of file
+        return handle_exception(e, "Failed to process chat message")
+
+
+@routes_bp.route("/ingest/food-transactions", methods=["POST"])
+def ingest_transactions():
+    """
+    Bulk load food transactions from an NDJSON or CSV body.
+
+    The batch id (X-Batch-Id header or batch_id query parameter) makes retries
+    safe: a batch id that was already loaded is acknowledged without reloading.
+    """
+    batch_id = request.headers.get("X-Batch-Id") or request.args.get("batch_id")
+    if not batch_id:
+        return jsonify({"error": "Batch id is required (X-Batch-Id header or batch_id parameter)"}), 400
+
+    fmt = format_for_mimetype(request.mimetype)
+    if fmt is None:
+        return jsonify({"error": "Content-Type must be application/x-ndjson or text/csv"}), 415
+
+    try:
+        stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+        result = ingest_food_transactions(parse_records(stream, fmt), batch_id, source=request.remote_addr)
+    except IngestionError as e:
+        return jsonify({"error": str(e), "error_count": e.error_count, "errors": e.errors}), 422
+    except UnicodeDecodeError as e:
+        return jsonify({"error": "Body must be UTF-8 encoded", "details": str(e)}), 400
+    except Exception as e:
+        return handle_exception(e, "Failed to ingest food transactions")
+
+    return jsonify(result), 201 if result["status"] == "loaded" else 200
+
+
+@routes_bp.route("/export/transactions", methods=["GET"])
+def export_transaction_history():
+    """
+    Stream food transaction history joined with nutrition values.
+
+    Query parameters: format (ndjson or csv), patient_ids (comma-separated),
+    start_date and end_date (YYYY-MM-DD, inclusive).
+    """
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    try:
+        patient_ids = parse_patient_ids(request.args.get('patient_ids'))
+    except ValueError:
+        return jsonify({"error": "patient_ids must be a comma-separated list of integers"}), 400
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if any(d is not None and not is_iso_date(d) for d in (start_date, end_date)):
+        return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
+
+    chunks = (chunk.encode("utf-8") for chunk in export_transactions(fmt, patient_ids, start_date, end_date))
+    headers = {'Content-Disposition': f'attachment; filename="transactions.{fmt}"', 'Vary': 'Accept-Encoding'}
+    if choose_encoding(request.accept_encodings, ["gzip"]):
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(chunks, mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+
+@routes_bp.route("/cohort-summary", methods=["GET"])
+def cohort_summary():
+    """
+    Nutrient adherence across all patients: cohort percentiles, per-patient
+    percentile ranks and outlier flags.
+
+    Query parameters: start_date and end_date (YYYY-MM-DD, inclusive); the
+    range defaults to the COHORT_SUMMARY_DEFAULT_DAYS days ending today.
+    """
+    end_date = request.args.get('end_date') or datetime.now().date().isoformat()
+    start_date = request.args.get('start_date') or (
+        (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=COHORT_SUMMARY_DEFAULT_DAYS - 1)).date().isoformat()
+        if is_iso_date(end_date) else None
+    )
+    if not (is_iso_date(start_date) and is_iso_date(end_date)):
+        return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
+    if start_date > end_date:
+        return jsonify({"error": "start_date must not be after end_date"}), 400
+
+    try:
+        return jsonify(get_cohort_summary(start_date, end_date))
+    except Exception as e:
+        return handle_exception(e, "Failed to compute cohort summary")
+
+
+@routes_bp.route("/allergen-exposures", methods=["GET"])
+def allergen_exposures():
+    """
+    Logged foods containing a recorded allergen, for every patient in the caseload.
+
+    Query parameters: optional start_date and end_date (YYYY-MM-DD, inclusive).
+    """
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if any(d and not is_iso_date(d) for d in (start_date, end_date)):
+        return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
+
+    try:
+        exposures = get_caseload_allergen_exposures(start_date, end_date)
+        return jsonify({
+            "start_date": start_date,
+            "end_date": end_date,
+            "patients": [
+                {"patient_id": patient_id, "exposures": found}
+                for patient_id, found in sorted(exposures.items())
+            ],
+        })
+    except Exception as e:
+        return handle_exception(e, "Failed to find allergen exposures")
+
+
+@routes_bp.route("/foods/search", methods=["GET"])
+def food_search():
+    """
+    Prefix and typo-tolerant search over nutrition reference foods.
+
+    Query parameters: q (required) and limit (default 10, at most 100).
+    """
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter q is required"}), 400
+    try:
+        limit = int(request.args.get('limit', FOOD_SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        return jsonify({"query": query, "results": search_foods(query, limit)})
+    except Exception as e:
+        return handle_exception(e, "Failed to search foods")
+
+
+@routes_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Operational counters for the API process."""
+    return jsonify({
+        "singleflight": get_singleflight_stats(),
+        "prompt_encoding": get_prompt_encoding_stats(),
+        "db_routing": get_replica_stats(),
+        "cohort_summary": get_cohort_summary_stats(),
+        "report_scheduler": get_report_scheduler_stats(),
+        "admission": get_admission_stats(),
+        "shared_cache": get_shared_cache_stats()
+    })
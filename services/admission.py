@@ -0,0 +1,212 @@
+"""
+Admission control module
+
+Limits how many expensive requests (report generation drives Chromium and
+the LLM, chat drives the LLM) run at once in a worker process. Requests over
+the limit wait in a bounded queue, served by priority and then arrival; a
+request is rejected straight away when the queue is full (429) or once it
+has waited longer than the queue deadline (503), with a Retry-After estimate
+from recent service times, instead of slowing every request down or running
+the container out of memory.
+
+Interactive requests are queued ahead of batch requests, and when the queue
+is full an arriving interactive request sheds the newest batch request.
+
+Limits are per worker process and per endpoint, read from
+ADMISSION_<NAME>_CONCURRENCY, ADMISSION_<NAME>_QUEUE and
+ADMISSION_<NAME>_QUEUE_TIMEOUT. A waiting request holds a server thread, so
+the report limit plus queue should stay below GUNICORN_THREADS to leave
+threads for chat.
+"""
+import os
+import math
+import time
+import heapq
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+# Default (concurrency, queue size, queue timeout seconds) per endpoint
+ADMISSION_DEFAULTS: Dict[str, Tuple[int, int, float]] = {
+    "reports": (1, 2, 20.0),
+    "chat": (3, 4, 5.0),
+}
+# Smoothing factor for the service time estimate behind Retry-After
+SERVICE_TIME_ALPHA = 0.2
+MAX_RETRY_AFTER_SECONDS = 120
+
+
+class AdmissionRejected(Exception):
+    """A request was not admitted; `status` is the HTTP status and `retry_after` is in seconds."""
+
+    def __init__(self, message: str, status: int, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded, priority-ordered wait queue."""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []  # heap of (priority, sequence)
+        self._shed = set()
+        self._sequence = itertools.count()
+        self._service_seconds: Optional[float] = None
+        self._stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "shed": 0,
+            "max_queue_depth": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    @contextmanager
+    def admit(self, priority: int = INTERACTIVE) -> Iterator[None]:
+        """
+        Hold one slot for the duration of the block.
+
+        Args:
+            priority: INTERACTIVE or BATCH
+
+        Raises:
+            AdmissionRejected: the queue is full, the request waited past the
+                queue deadline, or it was shed for an interactive request
+        """
+        self._acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: queued work spread over the slots."""
+        service = self._service_seconds or 1.0
+        estimate = service * (len(self._waiting) + 1) / self.limit
+        return min(MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(estimate)))
+
+    def _reject(self, reason: str, status: int, message: str) -> AdmissionRejected:
+        self._stats[reason] += 1
+        retry_after = self.retry_after()
+        logger.warning(f"Admission '{self.name}': {message}; retry after {retry_after}s")
+        return AdmissionRejected(message, status, retry_after)
+
+    def _acquire(self, priority: int) -> None:
+        with self._cond:
+            if self._active < self.limit and not self._waiting:
+                self._active += 1
+                self._stats["admitted"] += 1
+                return
+
+            if len(self._waiting) >= self.queue_size:
+                # Make room by shedding the newest lower-priority waiter, if any
+                lowest = max(self._waiting, default=None)
+                if lowest is None or lowest[0] <= priority:
+                    raise self._reject("rejected_queue_full", 429, f"{self.name} is at capacity")
+                self._waiting.remove(lowest)
+                heapq.heapify(self._waiting)
+                self._shed.add(lowest)
+                self._cond.notify_all()
+
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            self._stats["queued"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiting))
+            queued_at = time.monotonic()
+            deadline = queued_at + self.queue_timeout
+            while True:
+                if ticket in self._shed:
+                    self._shed.discard(ticket)
+                    raise self._reject("shed", 503, f"{self.name} shed a batch request for interactive traffic")
+                if self._active < self.limit and self._waiting[0] == ticket:
+                    heapq.heappop(self._waiting)
+                    self._active += 1
+                    self._stats["admitted"] += 1
+                    waited_ms = (time.monotonic() - queued_at) * 1000
+                    self._stats["wait_ms_total"] += waited_ms
+                    self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited_ms)
+                    # Another slot may be free for the next waiter
+                    self._cond.notify_all()
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    raise self._reject(
+                        "rejected_timeout", 503, f"{self.name} queue wait exceeded {self.queue_timeout:g}s"
+                    )
+                self._cond.wait(remaining)
+
+    def _release(self, service_seconds: float) -> None:
+        with self._cond:
+            self._active -= 1
+            if self._service_seconds is None:
+                self._service_seconds = service_seconds
+            else:
+                self._service_seconds += SERVICE_TIME_ALPHA * (service_seconds - self._service_seconds)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            queued = stats["queued"]
+            stats["wait_ms_avg"] = round(stats["wait_ms_total"] / queued, 1) if queued else 0.0
+            stats["wait_ms_max"] = round(stats["wait_ms_max"], 1)
+            del stats["wait_ms_total"]
+            return dict(
+                stats,
+                limit=self.limit,
+                queue_size=self.queue_size,
+                queue_timeout=self.queue_timeout,
+                active=self._active,
+                queue_depth=len(self._waiting),
+                service_ms=round(self._service_seconds * 1000, 1) if self._service_seconds is not None else None,
+            )
+
+
+_controllers: Dict[str, AdmissionController] = {}
+_controllers_lock = threading.Lock()
+
+
+def _config(name: str) -> Tuple[int, int, float]:
+    limit, queue_size, queue_timeout = ADMISSION_DEFAULTS.get(name, (4, 8, 10.0))
+    prefix = f"ADMISSION_{name.upper()}"
+    return (
+        int(os.environ.get(f"{prefix}_CONCURRENCY", limit)),
+        int(os.environ.get(f"{prefix}_QUEUE", queue_size)),
+        float(os.environ.get(f"{prefix}_QUEUE_TIMEOUT", queue_timeout)),
+    )
+
+
+def get_admission_controller(name: str) -> AdmissionController:
+    """Return the process-wide controller with this name, creating it on first use."""
+    with _controllers_lock:
+        if name not in _controllers:
+            _controllers[name] = AdmissionController(name, *_config(name))
+        return _controllers[name]
+
+
+def get_admission_stats() -> Dict[str, Dict[str, Any]]:
+    """Queue depth, wait time and rejection counters for every controller."""
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return {controller.name: controller.stats() for controller in controllers}
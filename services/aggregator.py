@@ -1,12 +1,23 @@
 from datetime import datetime, date
 import logging
-from data_access.main import get_allergies, get_food_transactions, get_nutrient_targets, get_nutrition_reference, get_patients
+from data_access.main import get_allergies, get_daily_food_items, get_daily_nutrient_rollups, get_food_transactions, get_nutrient_targets, get_nutrition_reference, get_patients
 from utils.utils import calculate_age, convert_dates_to_strings
 
 
 logger = logging.getLogger(__name__)
 
-def collect_reporting_data(patient_id):
+def collect_reporting_data(patient_id, start_date=None, end_date=None):
+    """
+    Collect everything known about a patient for reports and chat.
+
+    Args:
+        patient_id: ID of the patient
+        start_date: Optional inclusive start date (YYYY-MM-DD) for transactions and rollups
+        end_date: Optional inclusive end date (YYYY-MM-DD) for transactions and rollups
+
+    Returns:
+        Patient data dictionary with dates converted to strings
+    """
     patient_data = {}
 
     # Get patient information
@@ -18,15 +29,20 @@ def collect_reporting_data(patient_id):
     allergies = get_allergies(patient_id)
     patient_data['allergies'] = allergies
 
-    # TODO: Split transactions into a separate function for performance
-    # Get food transactions for the patient
-    food_transactions = get_food_transactions(patient_id)
+    # Get food transactions for the patient; a date range limits the scan to those months
+    food_transactions = get_food_transactions(patient_id, start_date, end_date)
     patient_data['food_transactions'] = food_transactions
 
     # Get nutrient targets for the patient
     nutrient_targets = get_nutrient_targets(patient_id)
     patient_data['nutrient_targets'] = nutrient_targets
 
+    # Get pre-aggregated daily nutrient totals for the patient
+    patient_data['daily_nutrient_rollups'] = get_daily_nutrient_rollups(patient_id, start_date, end_date)
+
+    # Servings of each food per day, grouped in the database for the report's food list
+    patient_data['daily_food_items'] = get_daily_food_items(patient_id, start_date, end_date)
+
     patient_data = convert_dates_to_strings(patient_data)
 
     return patient_data
@@ -62,3 +78,46 @@ def filter_transactions(transactions, start_date, end_date):
     except (ValueError, TypeError) as date_error:
         logger.error(f"Date filtering error: {date_error}")
 
+
+
+# Nutrient keys in daily_nutrient_rollups mapped to report nutrient names
+ROLLUP_NUTRIENTS = {
+    'calories': 'calories',
+    'protein_g': 'protein',
+    'fat_g': 'fat',
+    'carbs_g': 'carbs',
+    'fiber_g': 'fiber',
+    'sodium_mg': 'sodium',
+}
+
+
+def summarize_daily_rollups(rollups, start_date=None, end_date=None):
+    """
+    Sum daily nutrient rollups within an optional date range.
+
+    Args:
+        rollups: List of daily_nutrient_rollups rows (dates as YYYY-MM-DD strings or date objects)
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        Dictionary of nutrient totals plus the number of days and transactions covered
+    """
+    totals = {name: 0.0 for name in ROLLUP_NUTRIENTS.values()}
+    totals['days'] = 0
+    totals['transaction_count'] = 0
+
+    for rollup in rollups:
+        # ISO dates compare correctly as strings
+        rollup_date = str(rollup.get('rollup_date', ''))
+        if (start_date and rollup_date < start_date) or (end_date and rollup_date > end_date):
+            continue
+        try:
+            for column, name in ROLLUP_NUTRIENTS.items():
+                totals[name] += float(rollup.get(column) or 0)
+            totals['transaction_count'] += int(rollup.get('transaction_count') or 0)
+            totals['days'] += 1
+        except (ValueError, TypeError) as e:
+            logger.error(f"Error processing nutrient rollup for {rollup_date}: {e}")
+
+    return totals
@@ -0,0 +1,273 @@
+"""
+Allergens module
+
+Exact allergen exposure flags for logged food. An allergen -> foods index is
+built from nutrition_reference: each food's name and any "ingredients" or
+"tags" in additional_nutrients_json are matched against ALLERGEN_KEYWORDS, and
+allergens declared under an "allergens" key are taken as given. The index is
+rebuilt when the cached reference table is reloaded, so flagging a patient's
+transactions is a single pass of set lookups. The keyword matcher is shared
+with the rule-based analysis in services.local_analysis.
+"""
+import re
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+from data_access.main import (
+    get_allergies,
+    get_cached_nutrition_reference,
+    get_food_transactions_for_foods,
+    get_nutrition_reference_version,
+)
+
+logger = logging.getLogger(__name__)
+
+# Words that indicate a food contains a common allergen
+ALLERGEN_KEYWORDS = {
+    "peanut": ["peanut"],
+    "tree nut": ["almond", "walnut", "cashew", "pecan", "pistachio", "hazelnut", "nut butter"],
+    # A recorded "Nuts" allergy covers tree nuts and peanuts
+    "nut": ["almond", "walnut", "cashew", "pecan", "pistachio", "hazelnut", "nut butter", "peanut"],
+    "shellfish": ["shrimp", "crab", "lobster", "prawn", "shellfish", "scallop"],
+    "fish": ["fish", "salmon", "tuna", "cod", "trout"],
+    "egg": ["egg"],
+    "dairy": ["milk", "yogurt", "cheese", "butter", "cream", "dairy"],
+    "gluten": ["wheat", "bread", "pasta", "barley", "rye", "gluten"],
+    "soy": ["soy", "tofu", "edamame"],
+}
+# Recorded allergies that are another name for an ALLERGEN_KEYWORDS key
+ALLERGEN_ALIASES = {"milk": "dairy", "lactose": "dairy", "wheat": "gluten"}
+# Foods that contain a keyword without containing the allergen
+ALLERGEN_EXCLUSIONS = ["peanut butter", "almond butter", "nut butter", "cocoa butter", "coconut milk", "almond milk", "oat milk", "soy milk"]
+
+
+def _word_pattern(keyword: str) -> str:
+    # The keyword as a whole word, optionally plural: "egg" matches "eggs" but not "eggplant"
+    return rf"\b{re.escape(keyword)}(?:e?s)?\b"
+
+
+def canonical_allergen(allergy: str) -> str:
+    """Map a recorded allergy ("Peanuts", "Tree nuts", "Milk") to its ALLERGEN_KEYWORDS key, or its singular form."""
+    allergy = allergy.lower().strip()
+    singular = allergy.rstrip("s")
+    if not singular:
+        return ""
+    for name in (allergy, singular):
+        if name in ALLERGEN_KEYWORDS:
+            return name
+        if name in ALLERGEN_ALIASES:
+            return ALLERGEN_ALIASES[name]
+    # "Peanut oil" -> peanut: the longest name in the allergy, so "Fish" never becomes shellfish
+    contained = [name for name in (*ALLERGEN_KEYWORDS, *ALLERGEN_ALIASES) if re.search(_word_pattern(name), allergy)]
+    if not contained:
+        return singular
+    name = max(contained, key=len)
+    return ALLERGEN_ALIASES.get(name, name)
+
+
+def allergen_keywords(allergy: str) -> List[str]:
+    """Words that indicate a food contains a recorded allergy."""
+    allergen = canonical_allergen(allergy)
+    return ALLERGEN_KEYWORDS.get(allergen, [allergen] if allergen else [])
+
+
+def contains_allergen(food: str, allergies: List[str]) -> List[str]:
+    """Recorded allergies whose keywords appear in a food name."""
+    food = food.lower()
+    matches = []
+    for allergy in allergies:
+        keywords = allergen_keywords(allergy)
+        name = food
+        for phrase in ALLERGEN_EXCLUSIONS:
+            # "peanut butter" is not dairy, but it is still a peanut food
+            head_word = phrase.rsplit(" ", 1)[1]
+            if not any(k in phrase and k not in head_word for k in keywords):
+                name = re.sub(rf"\b{re.escape(phrase)}\b", "", name)
+        if any(re.search(_word_pattern(k), name) for k in keywords):
+            matches.append(allergy)
+    return matches
+
+
+# additional_nutrients_json keys holding ingredient text or tags
+INGREDIENT_KEYS = ("ingredients", "tags")
+# additional_nutrients_json key listing declared allergens
+DECLARED_ALLERGENS_KEY = "allergens"
+
+
+def _json_field(row: Dict[str, Any]) -> Dict[str, Any]:
+    extra = row.get("additional_nutrients_json") or {}
+    if isinstance(extra, str):
+        try:
+            extra = json.loads(extra)
+        except ValueError:
+            return {}
+    return extra if isinstance(extra, dict) else {}
+
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return []
+
+
+class AllergenIndex:
+    """Allergen -> nutrition reference IDs of the foods that contain it."""
+
+    def __init__(self, rows: Iterable[Dict[str, Any]]):
+        self.foods: Dict[int, Dict[str, Any]] = {}
+        self._texts: Dict[int, str] = {}
+        self._declared: Dict[str, set] = defaultdict(set)
+        for row in rows:
+            food_id = int(row["id"])
+            extra = _json_field(row)
+            self.foods[food_id] = row
+            self._texts[food_id] = " ".join(
+                [row.get("food_name") or ""] + [v for key in INGREDIENT_KEYS for v in _as_list(extra.get(key))]
+            )
+            for allergen in _as_list(extra.get(DECLARED_ALLERGENS_KEY)):
+                self._declared[canonical_allergen(allergen)].add(food_id)
+
+        # Common allergens are indexed up front; other recorded allergies on first use
+        self._by_allergen: Dict[str, FrozenSet[int]] = {}
+        for allergen in ALLERGEN_KEYWORDS:
+            self.foods_for(allergen)
+
+    def foods_for(self, allergy: str) -> FrozenSet[int]:
+        """
+        Foods containing an allergen.
+
+        Args:
+            allergy: Recorded allergy, e.g. "Peanuts" or "Tree nuts"
+
+        Returns:
+            Set of nutrition reference IDs
+        """
+        allergen = canonical_allergen(allergy or "")
+        if not allergen:
+            return frozenset()
+        foods = self._by_allergen.get(allergen)
+        if foods is None:
+            matched = {food_id for food_id, text in self._texts.items() if contains_allergen(text, [allergen])}
+            # Declared allergens this one covers count too: "Peanuts" is a "Nuts" food
+            keywords = set(allergen_keywords(allergen))
+            for declared, declared_foods in self._declared.items():
+                if declared == allergen or set(ALLERGEN_KEYWORDS.get(declared, [declared])) <= keywords:
+                    matched |= declared_foods
+            foods = frozenset(matched)
+            # Concurrent first lookups compute the same set; either write wins
+            self._by_allergen[allergen] = foods
+        return foods
+
+    def find_exposures(
+        self, transactions: Iterable[Dict[str, Any]], allergies: Iterable[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Flag transactions of foods containing any of the given allergies.
+
+        Args:
+            transactions: Food transaction dictionaries (nutrition_ref_id, consumption_date, servings)
+            allergies: Allergy rows (allergen, severity)
+
+        Returns:
+            One entry per (transaction, allergy) match, in transaction order
+        """
+        allergy_foods = [(a, self.foods_for(a.get("allergen"))) for a in allergies if a.get("allergen")]
+        if not allergy_foods:
+            return []
+
+        exposures = []
+        for transaction in transactions:
+            try:
+                food_id = int(transaction.get("nutrition_ref_id"))
+            except (TypeError, ValueError):
+                continue
+            for allergy, foods in allergy_foods:
+                if food_id in foods:
+                    exposures.append({
+                        "transaction_id": transaction.get("id"),
+                        "consumption_date": str(transaction.get("consumption_date", "")),
+                        "nutrition_ref_id": food_id,
+                        "food_name": self.foods[food_id].get("food_name"),
+                        "servings": float(transaction.get("servings") or 0),
+                        "allergen": allergy.get("allergen"),
+                        "severity": allergy.get("severity"),
+                    })
+        return exposures
+
+
+_index: Optional[AllergenIndex] = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_allergen_index() -> AllergenIndex:
+    """The process-wide index, rebuilt when the cached reference table is reloaded."""
+    global _index, _index_version
+    version = get_nutrition_reference_version()
+    if _index is None or version != _index_version:
+        with _index_lock:
+            if _index is None or version != _index_version:
+                _index = AllergenIndex(get_cached_nutrition_reference())
+                _index_version = version
+                logger.info(f"Allergen index rebuilt for {len(_index.foods)} foods")
+    return _index
+
+
+def find_allergen_exposures(
+    transactions: Iterable[Dict[str, Any]], allergies: Iterable[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Flag a patient's transactions of foods containing their recorded allergens.
+
+    Args:
+        transactions: Food transaction dictionaries
+        allergies: The patient's allergy rows
+
+    Returns:
+        List of exposure dictionaries (see AllergenIndex.find_exposures)
+    """
+    allergies = [a for a in allergies if a.get("allergen")]
+    if not allergies:
+        return []
+    return get_allergen_index().find_exposures(transactions, allergies)
+
+
+def get_caseload_allergen_exposures(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Allergen exposures for every patient with recorded allergies.
+
+    Only transactions of foods that match some patient's allergy are read, in
+    one query over the allergic patients.
+
+    Args:
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        Dictionary of patient ID to exposures, for patients with at least one
+    """
+    index = get_allergen_index()
+    allergies_by_patient = defaultdict(list)
+    for allergy in get_allergies():
+        allergies_by_patient[allergy["patient_id"]].append(allergy)
+
+    food_ids = set()
+    for allergies in allergies_by_patient.values():
+        for allergy in allergies:
+            food_ids |= index.foods_for(allergy.get("allergen"))
+
+    transactions_by_patient = defaultdict(list)
+    for transaction in get_food_transactions_for_foods(sorted(food_ids), sorted(allergies_by_patient), start_date, end_date):
+        transactions_by_patient[transaction["patient_id"]].append(transaction)
+
+    exposures = {}
+    for patient_id, transactions in transactions_by_patient.items():
+        found = index.find_exposures(transactions, allergies_by_patient[patient_id])
+        if found:
+            exposures[patient_id] = found
+    return exposures
@@ -0,0 +1,217 @@
+"""
+Analytics export module
+
+Writes cohort nutrient facts as columnar files for analytics tools:
+per-transaction facts (with nutrition values pre-joined) and per-day totals
+from the daily rollups. Output is Parquet (or Arrow IPC) partitioned by month
+in a Hive-style layout:
+
+    <out_dir>/transactions/month=2025-02/part-0.parquet
+    <out_dir>/daily/month=2025-02/part-0.parquet
+
+Rows are streamed from the database in date order and written one row group
+at a time, so memory stays bounded by the chunk size. Requires pyarrow.
+
+Usage:
+    python -m services.analytics_export --out-dir exports/cohort --patient-ids 1,2,3 --start-date 2025-01-01
+"""
+import os
+import sys
+import shutil
+import logging
+import argparse
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for analytics exports
+    pa = None
+
+from data_access.main import stream_daily_nutrient_rollups, stream_food_transactions
+from services.export import parse_patient_ids
+
+logger = logging.getLogger(__name__)
+
+# Rows per row group / record batch
+ANALYTICS_CHUNK_ROWS = int(os.environ.get("ANALYTICS_CHUNK_ROWS", "100000"))
+ANALYTICS_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+NUTRIENT_COLUMNS = ["calories", "protein_g", "fat_g", "carbs_g", "fiber_g", "sodium_mg"]
+
+
+def transaction_schema():
+    return pa.schema(
+        [
+            ("transaction_id", pa.int64()),
+            ("patient_id", pa.int32()),
+            ("consumption_date", pa.date32()),
+            ("nutrition_ref_id", pa.int32()),
+            ("food_name", pa.string()),
+            ("servings", pa.float64()),
+        ]
+        + [(column, pa.float64()) for column in NUTRIENT_COLUMNS]
+    )
+
+
+def daily_schema():
+    return pa.schema(
+        [("patient_id", pa.int32()), ("rollup_date", pa.date32())]
+        + [(column, pa.float64()) for column in NUTRIENT_COLUMNS]
+        + [("transaction_count", pa.int32())]
+    )
+
+
+class _MonthWriter:
+    """Writes one month's partition file, a chunk at a time."""
+
+    def __init__(self, path: str, schema, fmt: str):
+        self.path = path
+        self.rows = 0
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, schema, compression="zstd")
+            self._write = self._writer.write_table
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, schema)
+            self._write = self._writer.write_table
+
+    def write(self, table) -> None:
+        self._write(table)
+        self.rows += table.num_rows
+
+    def close(self) -> None:
+        self._writer.close()
+        if hasattr(self, "_sink"):
+            self._sink.close()
+
+
+def write_partitioned(
+    rows: Iterable[Dict[str, Any]],
+    out_dir: str,
+    schema,
+    date_column: str,
+    fmt: str = "parquet",
+    chunk_rows: int = ANALYTICS_CHUNK_ROWS,
+) -> List[Dict[str, Any]]:
+    """
+    Write date-ordered rows into one file per month.
+
+    Args:
+        rows: Row dictionaries ordered by date_column
+        out_dir: Dataset directory (month=YYYY-MM subdirectories are created)
+        schema: pyarrow schema of the rows
+        date_column: Date column used for the month partition
+        fmt: "parquet" or "arrow"
+        chunk_rows: Rows buffered before a row group is written
+
+    Returns:
+        List of {"month", "path", "rows"} for the files written
+    """
+    columns = schema.names
+    buffer: Dict[str, List[Any]] = {column: [] for column in columns}
+    files = []
+    writer: Optional[_MonthWriter] = None
+    month = None
+
+    def flush():
+        if writer is not None and buffer[columns[0]]:
+            writer.write(pa.Table.from_pydict(buffer, schema=schema))
+            for values in buffer.values():
+                values.clear()
+
+    def finish():
+        flush()
+        if writer is not None:
+            writer.close()
+            files.append({"month": month, "path": writer.path, "rows": writer.rows})
+
+    for row in rows:
+        row_month = row[date_column].strftime("%Y-%m")
+        if row_month != month:
+            finish()
+            month = row_month
+            partition_dir = os.path.join(out_dir, f"month={month}")
+            os.makedirs(partition_dir, exist_ok=True)
+            writer = _MonthWriter(os.path.join(partition_dir, f"part-0{ANALYTICS_FORMATS[fmt]}"), schema, fmt)
+        for column in columns:
+            buffer[column].append(row[column])
+        if len(buffer[columns[0]]) >= chunk_rows:
+            flush()
+    finish()
+    return files
+
+
+def export_cohort(
+    out_dir: str,
+    patient_ids: Optional[List[int]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    fmt: str = "parquet",
+) -> Dict[str, Any]:
+    """
+    Export per-transaction and per-day nutrient facts for a cohort.
+
+    Existing transactions/ and daily/ datasets in out_dir are replaced.
+
+    Args:
+        out_dir: Output directory
+        patient_ids: Optional patients to include (all patients when empty)
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+        fmt: "parquet" or "arrow"
+
+    Returns:
+        Dictionary with the files written for each dataset
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is required for analytics exports (pip install pyarrow)")
+    if fmt not in ANALYTICS_FORMATS:
+        raise ValueError(f"Unsupported analytics format: {fmt}")
+
+    datasets = {
+        "transactions": (
+            stream_food_transactions(patient_ids, start_date, end_date, order_by_date=True),
+            transaction_schema(),
+            "consumption_date",
+        ),
+        "daily": (stream_daily_nutrient_rollups(patient_ids, start_date, end_date), daily_schema(), "rollup_date"),
+    }
+
+    result = {}
+    for name, (rows, schema, date_column) in datasets.items():
+        dataset_dir = os.path.join(out_dir, name)
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        files = write_partitioned(rows, dataset_dir, schema, date_column, fmt)
+        logger.info(f"Exported {sum(f['rows'] for f in files)} {name} rows in {len(files)} files to {dataset_dir}")
+        result[name] = files
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export cohort nutrient facts as Parquet or Arrow files")
+    parser.add_argument("--out-dir", required=True, help="Output directory")
+    parser.add_argument("--format", choices=sorted(ANALYTICS_FORMATS), default="parquet")
+    parser.add_argument("--patient-ids", help="Comma-separated patient IDs (default: all patients)")
+    parser.add_argument("--start-date", help="Inclusive start date (YYYY-MM-DD)")
+    parser.add_argument("--end-date", help="Inclusive end date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    try:
+        patient_ids = parse_patient_ids(args.patient_ids)
+    except ValueError:
+        parser.error("--patient-ids must be a comma-separated list of integers")
+
+    try:
+        result = export_cohort(args.out_dir, patient_ids, args.start_date, args.end_date, args.format)
+    except RuntimeError as e:
+        print(str(e))
+        sys.exit(1)
+
+    for name, files in result.items():
+        print(f"{name}: {sum(f['rows'] for f in files)} rows in {len(files)} monthly files")
+
+
+if __name__ == "__main__":
+    main()
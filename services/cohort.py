@@ -0,0 +1,202 @@
+"""
+Cohort module
+
+Population view of nutrient adherence across the caseload. Per-patient
+adherence (average daily intake over logged days as a percentage of target)
+is aggregated in SQL from the daily rollups; cohort percentiles, each
+patient's percentile rank and IQR outlier flags are computed from those rows.
+
+Summaries are cached per date range. When transactions are ingested, only
+the affected patients are re-queried and the cohort statistics are
+recomputed from the cached rows, so a refresh costs one small query.
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+
+from data_access.main import COHORT_NUTRIENTS, get_cohort_adherence
+from services.invalidation import subscribe
+from services.singleflight import get_singleflight
+
+logger = logging.getLogger(__name__)
+
+# Full recompute interval; also picks up target changes and writes made outside the API
+COHORT_SUMMARY_TTL_SECONDS = float(os.environ.get("COHORT_SUMMARY_TTL_SECONDS", "300"))
+COHORT_SUMMARY_MAX_RANGES = int(os.environ.get("COHORT_SUMMARY_MAX_RANGES", "16"))
+# Tukey fences: values beyond Q1 - k*IQR or Q3 + k*IQR are outliers
+OUTLIER_IQR_MULTIPLIER = 1.5
+PERCENTILES = (10, 25, 50, 75, 90)
+
+_cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "full_refreshes": 0, "incremental_refreshes": 0, "patients_refreshed": 0}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Linearly interpolated percentile of sorted values (same as SQL percentile_cont)."""
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def percent_rank(sorted_values: List[float], value: float) -> float:
+    """Fraction of other values strictly below value (same as SQL percent_rank)."""
+    if len(sorted_values) < 2:
+        return 0.0
+    return bisect_left(sorted_values, value) / (len(sorted_values) - 1)
+
+
+def compute_cohort_statistics(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Cohort percentiles, per-patient percentile ranks and outlier flags.
+
+    Args:
+        rows: Output of get_cohort_adherence
+
+    Returns:
+        Dictionary with "nutrients" (cohort statistics) and "patients" (per-patient entries)
+    """
+    nutrients = {}
+    for name in COHORT_NUTRIENTS:
+        values = sorted(r[f"{name}_adherence"] for r in rows if r.get(f"{name}_adherence") is not None)
+        if not values:
+            continue
+        stats = {f"p{p}": round(percentile(values, p), 1) for p in PERCENTILES}
+        iqr = stats["p75"] - stats["p25"]
+        stats.update({
+            "mean": round(sum(values) / len(values), 1),
+            "patients": len(values),
+            "low_fence": round(stats["p25"] - OUTLIER_IQR_MULTIPLIER * iqr, 1),
+            "high_fence": round(stats["p75"] + OUTLIER_IQR_MULTIPLIER * iqr, 1),
+            "_sorted": values,
+        })
+        nutrients[name] = stats
+
+    patients = []
+    for row in rows:
+        adherence = {}
+        ranks = {}
+        outliers = []
+        for name, stats in nutrients.items():
+            value = row.get(f"{name}_adherence")
+            if value is None:
+                continue
+            adherence[name] = value
+            ranks[name] = round(100 * percent_rank(stats["_sorted"], value), 1)
+            if value < stats["low_fence"]:
+                outliers.append({"nutrient": name, "direction": "low"})
+            elif value > stats["high_fence"]:
+                outliers.append({"nutrient": name, "direction": "high"})
+        patients.append({
+            "patient_id": row["patient_id"],
+            "name": f"{row.get('first_name') or ''} {row.get('last_name') or ''}".strip(),
+            "days_logged": row["days_logged"],
+            "adherence": adherence,
+            "percentile_rank": ranks,
+            "outliers": outliers,
+        })
+
+    for stats in nutrients.values():
+        del stats["_sorted"]
+    return {"nutrients": nutrients, "patients": patients}
+
+
+def _build_summary(start_date: str, end_date: str, rows: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    ordered = [rows[pid] for pid in sorted(rows)]
+    summary = compute_cohort_statistics(ordered)
+    summary.update({
+        "start_date": start_date,
+        "end_date": end_date,
+        "patient_count": len(ordered),
+        "patients_with_data": sum(1 for r in ordered if r["days_logged"]),
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    return summary
+
+
+def _refresh_summary(start_date: str, end_date: str) -> Dict[str, Any]:
+    key = (start_date, end_date)
+    with _cache_lock:
+        entry = _cache.get(key)
+        incremental = entry is not None and time.monotonic() - entry["loaded_at"] < COHORT_SUMMARY_TTL_SECONDS
+        marked = set(entry["dirty"]) if entry is not None else set()
+
+    if incremental:
+        rows = dict(entry["rows"])
+        rows.update((r["patient_id"], r) for r in get_cohort_adherence(start_date, end_date, sorted(marked)))
+        loaded_at = entry["loaded_at"]
+    else:
+        rows = {r["patient_id"]: r for r in get_cohort_adherence(start_date, end_date)}
+        loaded_at = time.monotonic()
+    summary = _build_summary(start_date, end_date, rows)
+
+    with _cache_lock:
+        current = _cache.get(key)
+        # Patients marked while we were querying still need a refresh
+        pending = current["dirty"] - marked if current is not None else set()
+        _cache[key] = {"rows": rows, "dirty": pending, "loaded_at": loaded_at, "summary": summary}
+        _cache.move_to_end(key)
+        while len(_cache) > COHORT_SUMMARY_MAX_RANGES:
+            _cache.popitem(last=False)
+        if incremental:
+            _stats["incremental_refreshes"] += 1
+            _stats["patients_refreshed"] += len(marked)
+        else:
+            _stats["full_refreshes"] += 1
+    return summary
+
+
+def get_cohort_summary(start_date: str, end_date: str) -> Dict[str, Any]:
+    """
+    Cached cohort adherence summary for an inclusive date range.
+
+    Args:
+        start_date: Inclusive start date (YYYY-MM-DD)
+        end_date: Inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        Summary dictionary (see compute_cohort_statistics) with range and counts
+    """
+    key = (start_date, end_date)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if (
+            entry is not None
+            and not entry["dirty"]
+            and time.monotonic() - entry["loaded_at"] < COHORT_SUMMARY_TTL_SECONDS
+        ):
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return entry["summary"]
+    # Concurrent requests for the same range share one refresh
+    return get_singleflight("cohort_summary").do(key, _refresh_summary, start_date, end_date)
+
+
+def _on_transactions_changed(changes: Dict[int, Set[str]]) -> None:
+    """Mark patients whose changed dates fall inside a cached range for refresh."""
+    with _cache_lock:
+        for (start_date, end_date), entry in _cache.items():
+            for patient_id, dates in changes.items():
+                if any(start_date <= d <= end_date for d in dates):
+                    entry["dirty"].add(patient_id)
+
+
+def get_cohort_summary_stats() -> Dict[str, int]:
+    """Cache hit and refresh counters."""
+    with _cache_lock:
+        return dict(_stats, cached_ranges=len(_cache))
+
+
+def clear_cohort_summary_cache() -> None:
+    """Drop every cached summary."""
+    with _cache_lock:
+        _cache.clear()
+
+
+subscribe(_on_transactions_changed)
@@ -0,0 +1,126 @@
+"""
+Compression service module
+
+Helpers for content-encoding negotiation, on-the-fly response compression and
+precompressed sidecar files for generated reports.
+"""
+import os
+import gzip
+import zlib
+import logging
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Responses smaller than this are not worth the CPU or the extra headers
+MIN_COMPRESS_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "5"))
+# Sidecars are written once per report, so spend more CPU on them
+SIDECAR_GZIP_LEVEL = 9
+SIDECAR_BROTLI_QUALITY = 11
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "text/html",
+    "text/css",
+    "text/plain",
+    "application/javascript",
+    "text/javascript",
+}
+
+SIDECAR_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+
+def supported_encodings() -> List[str]:
+    """Encodings this process can produce, in order of preference."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encodings, available: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Pick the best content encoding accepted by the client.
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding header (werkzeug MIMEAccept-like)
+        available: Encodings to choose from, defaults to supported_encodings()
+
+    Returns:
+        The chosen encoding name or None for identity
+    """
+    for encoding in available if available is not None else supported_encodings():
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress_bytes(data: bytes, encoding: str, sidecar: bool = False) -> bytes:
+    """Compress data with the given encoding ('br' or 'gzip')."""
+    if encoding == "br":
+        return brotli.compress(data, quality=SIDECAR_BROTLI_QUALITY if sidecar else BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0 keeps the output deterministic so sidecars and ETags are stable
+        return gzip.compress(data, compresslevel=SIDECAR_GZIP_LEVEL if sidecar else GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Gzip a stream of chunks incrementally, for streamed responses."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def sidecar_path(path: str, encoding: str) -> str:
+    """Path of the precompressed sidecar for a file."""
+    return path + SIDECAR_EXTENSIONS[encoding]
+
+
+def write_precompressed_sidecars(path: str) -> List[str]:
+    """
+    Write .gz (and .br when available) copies of a file next to it.
+
+    Args:
+        path: Path of the file to compress
+
+    Returns:
+        List of sidecar paths written
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    written = []
+    for encoding in supported_encodings():
+        target = sidecar_path(path, encoding)
+        try:
+            with open(target, "wb") as f:
+                f.write(compress_bytes(data, encoding, sidecar=True))
+            written.append(target)
+        except OSError as e:
+            logger.warning(f"Failed to write {encoding} sidecar for {path}: {str(e)}")
+
+    logger.info(f"Wrote precompressed sidecars for {path}: {written}")
+    return written
+
+
+def find_sidecar(path: str, accept_encodings) -> Optional[str]:
+    """
+    Return the encoding of the best existing sidecar the client accepts.
+
+    Args:
+        path: Path of the uncompressed file
+        accept_encodings: The request's parsed Accept-Encoding header
+
+    Returns:
+        Encoding name or None if no usable sidecar exists
+    """
+    existing = [e for e in SIDECAR_EXTENSIONS if os.path.exists(sidecar_path(path, e))]
+    return choose_encoding(accept_encodings, existing)
@@ -0,0 +1,124 @@
+"""
+Export module
+
+Streams patient consumption history, joined with nutrition values, as NDJSON
+or CSV. Rows come from a server-side cursor and are encoded in small chunks,
+so memory use stays flat however many rows are exported.
+
+Usage:
+    python -m services.export --format csv --patient-ids 1,2 --start-date 2025-02-01 -o export.csv
+"""
+import io
+import os
+import csv
+import sys
+import json
+import argparse
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from data_access.main import stream_food_transactions
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = [
+    "transaction_id", "patient_id", "consumption_date", "nutrition_ref_id", "food_name", "servings",
+    "calories", "protein_g", "fat_g", "carbs_g", "fiber_g", "sodium_mg",
+]
+# Rows encoded per yielded chunk; one row per chunk would mean one write per row
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "500"))
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]], chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """Encode rows as NDJSON, yielding chunks of chunk_rows lines."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({column: _plain(row.get(column)) for column in EXPORT_COLUMNS}))
+        if len(lines) >= chunk_rows:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]], chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """Encode rows as CSV with a header row, yielding chunks of chunk_rows lines."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow([_plain(row.get(column)) for column in EXPORT_COLUMNS])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def export_transactions(
+    fmt: str,
+    patient_ids: Optional[List[int]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Stream a transaction history export.
+
+    Args:
+        fmt: "ndjson" or "csv"
+        patient_ids: Optional patients to include (all patients when empty)
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        Iterator of encoded text chunks
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    rows = stream_food_transactions(patient_ids, start_date, end_date)
+    return iter_ndjson(rows) if fmt == "ndjson" else iter_csv(rows)
+
+
+def parse_patient_ids(value: Optional[str]) -> Optional[List[int]]:
+    """Parse a comma-separated list of patient IDs; raises ValueError on bad input."""
+    if not value:
+        return None
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export food transaction history as NDJSON or CSV")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--patient-ids", help="Comma-separated patient IDs (default: all patients)")
+    parser.add_argument("--start-date", help="Inclusive start date (YYYY-MM-DD)")
+    parser.add_argument("--end-date", help="Inclusive end date (YYYY-MM-DD)")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        patient_ids = parse_patient_ids(args.patient_ids)
+    except ValueError:
+        parser.error("--patient-ids must be a comma-separated list of integers")
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in export_transactions(args.format, patient_ids, args.start_date, args.end_date):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
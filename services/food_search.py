@@ -0,0 +1,251 @@
+"""
+Food search module
+
+Prefix and typo-tolerant search over nutrition_reference, served from an
+in-memory index built from the cached reference table. When the cached table
+is reloaded, only foods that were added, removed or renamed are re-indexed.
+
+Matching happens per word against the vocabulary of food-name words: an
+exact word scores 1.0, a word the query word is a prefix of 0.9, and a
+misspelling is scored by pg_trgm-style trigram similarity. Foods matching
+more query words rank first, then by total word score, then shorter names.
+Because the vocabulary is far smaller than the catalogue, a search only
+touches the postings of the few words that match.
+"""
+import os
+import re
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from data_access.main import get_cached_nutrition_reference, get_nutrition_reference_version
+
+logger = logging.getLogger(__name__)
+
+FOOD_SEARCH_DEFAULT_LIMIT = 10
+FOOD_SEARCH_MAX_LIMIT = 100
+# Misspelled words below this trigram similarity to a vocabulary word do not match it
+FOOD_SEARCH_MIN_SIMILARITY = float(os.environ.get("FOOD_SEARCH_MIN_SIMILARITY", "0.3"))
+# Vocabulary words considered per query word
+MAX_WORD_MATCHES = 20
+
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.9
+# Fuzzy matches are scaled below prefix matches
+FUZZY_WEIGHT = 0.8
+
+NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse punctuation to single spaces."""
+    return NON_WORD.sub(" ", (text or "").lower()).strip()
+
+
+def trigrams(word: str) -> Set[str]:
+    """pg_trgm-style trigrams of a word padded with two leading spaces and one trailing."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodSearchIndex:
+    """Word, prefix and trigram index over nutrition reference rows."""
+
+    def __init__(self, rows: Iterable[Dict[str, Any]] = ()):
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self._names: Dict[int, str] = {}
+        # word -> food ids, as a set and as a list sorted by (name length, id)
+        self._postings: Dict[str, Set[int]] = {}
+        self._ranked: Dict[str, List[Tuple[int, int]]] = {}
+        self._vocabulary: List[str] = []  # sorted, for prefix lookups
+        self._word_grams: Dict[str, Set[str]] = {}  # trigram -> vocabulary words
+        self._gram_counts: Dict[str, int] = {}  # vocabulary word -> number of distinct trigrams
+        # Searches are CPU-bound and serialized by the GIL anyway; the lock
+        # keeps them from seeing a half-applied update
+        self._lock = threading.Lock()
+        self.update(rows)
+
+    def _add(self, food_id: int, name: str) -> None:
+        self._names[food_id] = name
+        key = (len(name), food_id)
+        for word in set(name.split()):
+            if word not in self._postings:
+                self._postings[word] = set()
+                self._ranked[word] = []
+                insort(self._vocabulary, word)
+                grams = trigrams(word)
+                self._gram_counts[word] = len(grams)
+                for gram in grams:
+                    self._word_grams.setdefault(gram, set()).add(word)
+            self._postings[word].add(food_id)
+            insort(self._ranked[word], key)
+
+    def _remove(self, food_id: int) -> None:
+        name = self._names.pop(food_id)
+        key = (len(name), food_id)
+        for word in set(name.split()):
+            self._postings[word].discard(food_id)
+            ranked = self._ranked[word]
+            del ranked[bisect_left(ranked, key)]
+            if not self._postings[word]:
+                del self._postings[word]
+                del self._ranked[word]
+                del self._vocabulary[bisect_left(self._vocabulary, word)]
+                del self._gram_counts[word]
+                for gram in trigrams(word):
+                    words = self._word_grams[gram]
+                    words.discard(word)
+                    if not words:
+                        del self._word_grams[gram]
+
+    def update(self, rows: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Make the index match rows, re-indexing only foods whose name changed.
+
+        Args:
+            rows: The complete set of nutrition reference rows
+
+        Returns:
+            Counts of added, removed and renamed foods
+        """
+        with self._lock:
+            new_rows = {int(row["id"]): row for row in rows}
+            removed = [food_id for food_id in self._names if food_id not in new_rows]
+            added = []
+            renamed = []
+            for food_id, row in new_rows.items():
+                name = normalize(row.get("food_name"))
+                if food_id not in self._names:
+                    added.append((food_id, name))
+                elif self._names[food_id] != name:
+                    renamed.append((food_id, name))
+
+            for food_id in removed:
+                self._remove(food_id)
+            for food_id, name in renamed:
+                self._remove(food_id)
+                self._add(food_id, name)
+            for food_id, name in added:
+                self._add(food_id, name)
+            self.rows = new_rows
+            return {"added": len(added), "removed": len(removed), "renamed": len(renamed)}
+
+    def _match_word(self, query_word: str) -> List[Tuple[float, str]]:
+        """Vocabulary words matching one query word, best first."""
+        matches = {}
+        i = bisect_left(self._vocabulary, query_word)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(query_word):
+            word = self._vocabulary[i]
+            matches[word] = EXACT_SCORE if word == query_word else PREFIX_SCORE
+            i += 1
+            if len(matches) >= MAX_WORD_MATCHES * 5:
+                break
+
+        query_grams = trigrams(query_word)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._word_grams.get(gram, ()))
+        for word, common in shared.items():
+            if word in matches:
+                continue
+            # Jaccard similarity of the two trigram sets, as pg_trgm computes it
+            similarity = common / (len(query_grams) + self._gram_counts[word] - common)
+            if similarity >= FOOD_SEARCH_MIN_SIMILARITY:
+                matches[word] = FUZZY_WEIGHT * similarity
+
+        return sorted(((score, word) for word, score in matches.items()), reverse=True)[:MAX_WORD_MATCHES]
+
+    def _top_for_word(self, word_matches: List[Tuple[float, str]], limit: int, exclude: Set[int]) -> List[Tuple[Tuple, int]]:
+        """Best foods for a single query word: by word score, then shortest name."""
+        results = []
+        seen = set(exclude)
+        for score, word in word_matches:
+            for length, food_id in self._ranked[word]:
+                if food_id not in seen:
+                    seen.add(food_id)
+                    results.append(((1, score, -length), food_id))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def search(self, query: str, limit: int = FOOD_SEARCH_DEFAULT_LIMIT) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Top matches for a query.
+
+        Args:
+            query: Free-text food name, partial or misspelled
+            limit: Maximum number of results
+
+        Returns:
+            List of (score, reference row), best first; score is the mean word score
+        """
+        words = list(dict.fromkeys(normalize(query).split()))
+        if not words:
+            return []
+        with self._lock:
+            per_word = [m for m in (self._match_word(word) for word in words) if m]
+            if not per_word:
+                return []
+
+            if len(per_word) == 1:
+                ranked = self._top_for_word(per_word[0], limit, set())
+            else:
+                # Foods matching every query word, scored exactly
+                unions = [set().union(*(self._postings[w] for _, w in matches)) for matches in per_word]
+                candidates = set.intersection(*unions)
+                totals = dict.fromkeys(candidates, 0.0)
+                for matches in per_word:
+                    best = {}
+                    # Worst match first so the best word score for each food wins
+                    for score, word in reversed(matches):
+                        best.update(dict.fromkeys(self._postings[word] & candidates, score))
+                    for food_id, score in best.items():
+                        totals[food_id] += score
+                ranked = [((len(per_word), total, -len(self._names[food_id])), food_id)
+                          for food_id, total in totals.items()]
+                ranked.sort(reverse=True)
+                ranked = ranked[:limit]
+                # Fill up with foods matching some of the words
+                for matches in per_word:
+                    if len(ranked) >= limit:
+                        break
+                    partial = self._top_for_word(matches, limit - len(ranked), {f for _, f in ranked})
+                    ranked.extend(((1, key[1], key[2]), food_id) for key, food_id in partial)
+
+            total_words = len(words)
+            return [(round(key[1] / total_words, 3), self.rows[food_id]) for key, food_id in ranked[:limit]]
+
+
+_index = FoodSearchIndex()
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_food_index() -> FoodSearchIndex:
+    """The process-wide index, brought up to date with the cached reference table."""
+    global _index_version
+    version = get_nutrition_reference_version()
+    if version != _index_version:
+        with _index_lock:
+            if version != _index_version:
+                changes = _index.update(get_cached_nutrition_reference())
+                _index_version = version
+                logger.info(f"Food search index updated: {changes}")
+    return _index
+
+
+def search_foods(query: str, limit: int = FOOD_SEARCH_DEFAULT_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Search foods by name with prefix and typo tolerance.
+
+    Args:
+        query: Free-text food name
+        limit: Maximum number of results (capped at FOOD_SEARCH_MAX_LIMIT)
+
+    Returns:
+        List of nutrition reference rows with an added "score", best first
+    """
+    limit = max(1, min(limit, FOOD_SEARCH_MAX_LIMIT))
+    return [dict(row, score=score) for score, row in get_food_index().search(query, limit)]
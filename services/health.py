@@ -0,0 +1,104 @@
+"""
+Health module
+
+Liveness and readiness checks for probes. Readiness runs a trivial query over
+one long-lived connection per process (instead of connecting per probe),
+reads table size estimates from pg_class rather than counting rows, and
+reports PDF renderer and LLM circuit breaker status from in-process state.
+The result is cached for HEALTH_CACHE_SECONDS, and concurrent probes share
+one check, so probes put no real load on the database.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict
+
+import psycopg2
+
+from data_access.main import get_db_connection, get_table_row_estimates
+from services.js_bridge_service import get_renderer_status
+from services.prompt import get_llm_status
+from services.singleflight import get_singleflight
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CACHE_SECONDS = float(os.environ.get("HEALTH_CACHE_SECONDS", "5"))
+HEALTH_STATEMENT_TIMEOUT_MS = int(os.environ.get("HEALTH_STATEMENT_TIMEOUT_MS", "2000"))
+HEALTH_TABLES = ["patients", "allergies", "nutrition_reference", "food_transactions", "nutrient_targets"]
+
+_started_at = time.time()
+_connection = None
+_connection_lock = threading.Lock()
+_cache: Dict[str, Any] = {"result": None, "checked_at": 0.0}
+
+
+def _probe_database() -> Dict[str, Any]:
+    """SELECT 1 and row estimates over the probe connection, reconnecting once if it broke."""
+    global _connection
+    with _connection_lock:
+        for attempt in range(2):
+            try:
+                if _connection is None or _connection.closed:
+                    _connection = get_db_connection()
+                    _connection.autocommit = True
+                    cur = _connection.cursor()
+                    cur.execute(f"SET statement_timeout = {HEALTH_STATEMENT_TIMEOUT_MS}")
+                    cur.close()
+                started = time.monotonic()
+                cur = _connection.cursor()
+                cur.execute("SELECT 1")
+                cur.fetchone()
+                cur.close()
+                latency_ms = round((time.monotonic() - started) * 1000, 1)
+                return {"ok": True, "latency_ms": latency_ms, "tables": get_table_row_estimates(_connection, HEALTH_TABLES)}
+            except psycopg2.Error as e:
+                if _connection is not None:
+                    _connection.close()
+                _connection = None
+                if attempt:
+                    return {"ok": False, "error": str(e).strip()}
+
+
+def _check_readiness() -> Dict[str, Any]:
+    database = _probe_database()
+    renderer = get_renderer_status()
+    llm = get_llm_status()
+    if not database["ok"]:
+        status = "unavailable"
+    elif renderer["warmed"] is False or llm["circuit"] == "open":
+        # Reports degrade (no PDF or local analysis only) but requests are still served
+        status = "degraded"
+    else:
+        status = "ready"
+    result = {
+        "status": status,
+        "database": database,
+        "pdf_renderer": renderer,
+        "llm": llm,
+        "checked_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    _cache["result"] = result
+    _cache["checked_at"] = time.monotonic()
+    return result
+
+
+def get_readiness() -> Dict[str, Any]:
+    """
+    Readiness of this process, cached for HEALTH_CACHE_SECONDS.
+
+    Returns:
+        Dictionary with "status" (ready, degraded or unavailable) and per-dependency details
+    """
+    if _cache["result"] is not None and time.monotonic() - _cache["checked_at"] < HEALTH_CACHE_SECONDS:
+        return _cache["result"]
+    return get_singleflight("readiness").do("readyz", _check_readiness)
+
+
+def get_liveness() -> Dict[str, Any]:
+    """The process is up and serving requests; touches no dependency."""
+    return {"status": "ok", "pid": os.getpid(), "uptime_seconds": round(time.time() - _started_at)}
+
+
+def clear_readiness_cache() -> None:
+    _cache["result"] = None
@@ -0,0 +1,257 @@
+"""
+Ingestion module
+
+Bulk loads food transactions from NDJSON or CSV batches. Every row is
+validated against the patients table and the cached nutrition reference
+before anything is written; valid batches are loaded in one COPY and
+recorded under their client-supplied batch id so retries are not applied
+twice. Daily rollups are refreshed by the food_transactions triggers.
+
+Usage:
+    python -m services.ingestion transactions.ndjson --batch-id pos-2025-02-01
+    python -m services.ingestion transactions.csv
+"""
+import io
+import os
+import sys
+import csv
+import json
+import hashlib
+import logging
+import argparse
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from data_access.main import (
+    copy_food_transactions,
+    get_cached_nutrition_reference,
+    get_existing_patient_ids,
+    invalidate_nutrition_reference_cache,
+)
+from services.invalidation import publish_transactions_changed
+
+logger = logging.getLogger(__name__)
+
+INGEST_MAX_BATCH_ROWS = int(os.environ.get("INGEST_MAX_BATCH_ROWS", "100000"))
+# Validation errors returned to the client; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Bounds of the food_transactions.servings column, DECIMAL(4,2)
+SERVINGS_LIMIT = 100
+SERVINGS_DECIMAL_PLACES = 2
+
+INGEST_FIELDS = ("patient_id", "nutrition_ref_id", "servings", "consumption_date")
+NDJSON_MIMETYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+CSV_MIMETYPES = {"text/csv"}
+
+
+class IngestionError(Exception):
+    """A batch was rejected; `errors` lists the offending rows."""
+
+    def __init__(self, message: str, errors: Optional[List[Dict[str, Any]]] = None, error_count: int = 0):
+        super().__init__(message)
+        self.errors = errors or []
+        self.error_count = error_count or len(self.errors)
+
+
+def parse_ndjson(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield one record per non-blank NDJSON line."""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise IngestionError(f"Invalid JSON on line {line_number}: {e.msg}")
+        if not isinstance(record, dict):
+            raise IngestionError(f"Line {line_number} is not a JSON object")
+        yield record
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield one record per CSV row; the header row must name the ingest fields."""
+    reader = csv.DictReader(lines)
+    missing = [f for f in INGEST_FIELDS if f not in (reader.fieldnames or [])]
+    if missing:
+        raise IngestionError(f"CSV header is missing columns: {', '.join(missing)}")
+    yield from reader
+
+
+def parse_records(stream: TextIO, fmt: str) -> Iterator[Dict[str, Any]]:
+    """
+    Parse a text stream as NDJSON or CSV.
+
+    Args:
+        stream: Text stream (file or request body)
+        fmt: "ndjson" or "csv"
+
+    Returns:
+        Iterator of raw record dictionaries
+    """
+    if fmt == "ndjson":
+        return parse_ndjson(stream)
+    if fmt == "csv":
+        return parse_csv(stream)
+    raise IngestionError(f"Unsupported format: {fmt}")
+
+
+def format_for_mimetype(mimetype: str) -> Optional[str]:
+    """Map a request Content-Type to an ingest format, or None if unsupported."""
+    if mimetype in NDJSON_MIMETYPES:
+        return "ndjson"
+    if mimetype in CSV_MIMETYPES:
+        return "csv"
+    return None
+
+
+def _validate_row(record: Dict[str, Any]) -> Tuple[int, int, Decimal, date]:
+    try:
+        patient_id = int(record["patient_id"])
+        nutrition_ref_id = int(record["nutrition_ref_id"])
+    except KeyError as e:
+        raise ValueError(f"missing field {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("patient_id and nutrition_ref_id must be integers")
+
+    try:
+        servings = Decimal(str(record.get("servings", 1)))
+    except InvalidOperation:
+        raise ValueError("servings must be a number")
+    # food_transactions.servings is DECIMAL(4,2): one out-of-range value would fail the whole COPY
+    if not servings.is_finite() or servings <= 0 or servings >= SERVINGS_LIMIT:
+        raise ValueError(f"servings must be greater than 0 and less than {SERVINGS_LIMIT}")
+    if servings.as_tuple().exponent < -SERVINGS_DECIMAL_PLACES:
+        raise ValueError(f"servings must have at most {SERVINGS_DECIMAL_PLACES} decimal places")
+
+    try:
+        consumption_date = date.fromisoformat(str(record["consumption_date"]))
+    except KeyError:
+        raise ValueError("missing field consumption_date")
+    except ValueError:
+        raise ValueError("consumption_date must be an ISO date (YYYY-MM-DD)")
+
+    return patient_id, nutrition_ref_id, servings, consumption_date
+
+
+def _known_nutrition_ref_ids(refresh: bool = False) -> Set[int]:
+    if refresh:
+        invalidate_nutrition_reference_cache()
+    return {int(ref["id"]) for ref in get_cached_nutrition_reference()}
+
+
+def validate_records(records: Iterable[Dict[str, Any]]) -> List[Tuple[int, int, Decimal, date]]:
+    """
+    Validate a batch of records; a batch is loaded only if every row is valid.
+
+    Args:
+        records: Raw record dictionaries
+
+    Returns:
+        List of (patient_id, nutrition_ref_id, servings, consumption_date) tuples
+
+    Raises:
+        IngestionError: The batch is empty, too large, or has invalid rows
+    """
+    rows = []
+    errors = []
+    error_count = 0
+
+    def reject(row_number, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": row_number, "error": message})
+
+    for row_number, record in enumerate(records, start=1):
+        if row_number > INGEST_MAX_BATCH_ROWS:
+            raise IngestionError(f"Batch exceeds the maximum of {INGEST_MAX_BATCH_ROWS} rows")
+        try:
+            rows.append(_validate_row(record))
+        except ValueError as e:
+            reject(row_number, str(e))
+            rows.append(None)
+
+    if not rows:
+        raise IngestionError("Batch contains no rows")
+
+    valid = [(n, row) for n, row in enumerate(rows, start=1) if row is not None]
+
+    ref_ids = _known_nutrition_ref_ids()
+    if any(row[1] not in ref_ids for _, row in valid):
+        # A food may have been added since the cache was filled
+        ref_ids = _known_nutrition_ref_ids(refresh=True)
+    existing_patients = get_existing_patient_ids({row[0] for _, row in valid})
+
+    for row_number, row in valid:
+        if row[0] not in existing_patients:
+            reject(row_number, f"unknown patient_id {row[0]}")
+        elif row[1] not in ref_ids:
+            reject(row_number, f"unknown nutrition_ref_id {row[1]}")
+
+    if error_count:
+        errors.sort(key=lambda e: e["row"])
+        raise IngestionError(f"Batch rejected: {error_count} invalid row(s)", errors, error_count)
+
+    return rows
+
+
+def ingest_food_transactions(records: Iterable[Dict[str, Any]], batch_id: str, source: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Validate and load a batch of food transactions.
+
+    Args:
+        records: Raw record dictionaries (see parse_records)
+        batch_id: Client-supplied idempotency key for the batch
+        source: Optional description of where the batch came from
+
+    Returns:
+        Dictionary with batch_id, status ("loaded" or "duplicate"), rows and patients
+
+    Raises:
+        IngestionError: The batch id is missing or the batch is invalid
+    """
+    batch_id = (batch_id or "").strip()
+    if not batch_id or len(batch_id) > 255:
+        raise IngestionError("A batch id of 1-255 characters is required")
+
+    rows = validate_records(records)
+    loaded = copy_food_transactions(rows, batch_id, source)
+    if loaded is None:
+        return {"batch_id": batch_id, "status": "duplicate", "rows": 0, "patients": 0}
+
+    changes: Dict[int, Set[str]] = {}
+    for patient_id, _, _, consumption_date in rows:
+        changes.setdefault(patient_id, set()).add(consumption_date.isoformat())
+    publish_transactions_changed(changes)
+
+    return {"batch_id": batch_id, "status": "loaded", "rows": loaded, "patients": len(changes)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load food transactions from an NDJSON or CSV file")
+    parser.add_argument("file", help="NDJSON (.ndjson/.jsonl) or CSV (.csv) file")
+    parser.add_argument("--batch-id", help="Idempotency key (defaults to the file's SHA-256)")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="Input format (defaults to the file extension)")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.file.lower().endswith(".csv") else "ndjson")
+    with open(args.file, "rb") as f:
+        content = f.read()
+    batch_id = args.batch_id or hashlib.sha256(content).hexdigest()
+
+    try:
+        records = parse_records(io.StringIO(content.decode("utf-8"), newline=""), fmt)
+        result = ingest_food_transactions(records, batch_id, source=os.path.basename(args.file))
+    except IngestionError as e:
+        print(str(e))
+        for error in e.errors:
+            print(f"  row {error['row']}: {error['error']}")
+        sys.exit(1)
+
+    print(f"Batch {result['batch_id']}: {result['status']}, {result['rows']} rows for {result['patients']} patients")
+
+
+if __name__ == "__main__":
+    main()
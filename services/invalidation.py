@@ -0,0 +1,54 @@
+"""
+Invalidation module
+
+In-process notifications for data changes made through the API. Caches that
+hold patient-derived data subscribe here and drop the entries for the
+patients and dates that changed.
+"""
+import logging
+import threading
+from typing import Callable, Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+_subscribers: List[Callable[[Dict[int, Set[str]]], None]] = []
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(callback: Callable[[Dict[int, Set[str]]], None]) -> None:
+    """
+    Register a callback for food transaction changes.
+
+    Args:
+        callback: Called with a {patient_id: set of ISO dates} mapping
+    """
+    with _subscribers_lock:
+        if callback not in _subscribers:
+            _subscribers.append(callback)
+
+
+def unsubscribe(callback: Callable[[Dict[int, Set[str]]], None]) -> None:
+    """Remove a previously registered callback."""
+    with _subscribers_lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+
+def publish_transactions_changed(changes: Dict[int, Set[str]]) -> None:
+    """
+    Notify subscribers that food transactions changed.
+
+    A failing subscriber is logged and does not stop the others.
+
+    Args:
+        changes: {patient_id: set of ISO dates} that gained or lost transactions
+    """
+    if not changes:
+        return
+    with _subscribers_lock:
+        callbacks = list(_subscribers)
+    for callback in callbacks:
+        try:
+            callback(changes)
+        except Exception as e:
+            logger.error(f"Invalidation subscriber {callback!r} failed: {str(e)}")
@@ -12,6 +12,8 @@ import subprocess
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from services.tracing import inject_env, record_node_spans, span
+
 logger = logging.getLogger(__name__)
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -21,8 +23,15 @@ class DateTimeEncoder(json.JSONEncoder):
         #     return obj.isoformat()
         return obj.isoformat()
 
+# Node.js version once a check has succeeded; later checks skip the subprocess
+_node_version: Optional[str] = None
+
+
 def check_node_installed() -> bool:
     """Check if Node.js is installed and working"""
+    global _node_version
+    if _node_version:
+        return True
     try:
         process = subprocess.run(
             ["node", "--version"],
@@ -31,7 +40,8 @@ def check_node_installed() -> bool:
             check=False
         )
         if process.returncode == 0:
-            logger.info(f"Node.js is installed: {process.stdout.strip()}")
+            _node_version = process.stdout.strip()
+            logger.info(f"Node.js is installed: {_node_version}")
             return True
         else:
             logger.warning(f"Node.js check failed: {process.stderr}")
@@ -40,6 +50,54 @@ def check_node_installed() -> bool:
         logger.warning(f"Error checking Node.js: {str(e)}")
         return False
 
+# Launches and closes headless Chromium, the same way convert-to-pdf.js does
+RENDERER_WARMUP_SCRIPT = (
+    "require('puppeteer')"
+    ".launch({headless: true, args: ['--no-sandbox', '--disable-setuid-sandbox']})"
+    ".then(browser => browser.close())"
+    ".catch(error => { console.error(error.message); process.exit(1); })"
+)
+RENDERER_WARMUP_TIMEOUT_SECONDS = int(os.environ.get("RENDERER_WARMUP_TIMEOUT_SECONDS", "60"))
+# Outcome of the last warm-up launch: None until one has run
+_renderer_warmed: Optional[bool] = None
+
+
+def warm_pdf_renderer() -> bool:
+    """
+    Load Puppeteer and start Chromium once so the first PDF does not pay for a cold start.
+
+    Returns:
+        True if a browser could be launched
+    """
+    global _renderer_warmed
+    _renderer_warmed = False
+    if not check_node_installed():
+        return False
+    js_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "js")
+    try:
+        process = subprocess.run(
+            ["node", "-e", RENDERER_WARMUP_SCRIPT],
+            cwd=js_dir,
+            capture_output=True,
+            text=True,
+            timeout=RENDERER_WARMUP_TIMEOUT_SECONDS,
+            check=False
+        )
+    except subprocess.TimeoutExpired:
+        logger.warning(f"PDF renderer warm-up timed out after {RENDERER_WARMUP_TIMEOUT_SECONDS}s")
+        return False
+    if process.returncode != 0:
+        logger.warning(f"PDF renderer warm-up failed: {process.stderr.strip()}")
+        return False
+    _renderer_warmed = True
+    return True
+
+
+def get_renderer_status() -> Dict[str, Any]:
+    """Node.js version and the outcome of the renderer warm-up, without starting any process."""
+    return {"node": _node_version, "warmed": _renderer_warmed}
+
+
 def generate_html_file(
     data: Dict[str, Any],
     output_html_path: str,
@@ -102,17 +160,20 @@ def generate_pdf(
         
         logger.info(f"Running PDF generator: {' '.join(cmd)}")
         
-        # Execute the Node.js script
-        process = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=False
-        )
+        # Execute the Node.js script; its phases become child spans of this one
+        with span("pdf render", **{"process.command": "node convert-to-pdf.js"}):
+            process = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                check=False,
+                env=inject_env(dict(os.environ))
+            )
+            stdout = record_node_spans(process.stdout)
         
         # Log output
-        if process.stdout:
-            logger.info(f"PDF Generator stdout: {process.stdout}")
+        if stdout:
+            logger.info(f"PDF Generator stdout: {stdout}")
         
         if process.stderr:
             logger.warning(f"PDF Generator stderr: {process.stderr}")
@@ -146,3 +207,39 @@ def generate_pdf(
     except Exception as e:
         logger.error(f"Unexpected error during PDF generation: {str(e)}")
         raise
+
+
+def render_pdf_packet(manifest_path: str) -> str:
+    """
+    Render several reports in one browser session with render-packet.js.
+
+    Args:
+        manifest_path: JSON manifest naming the shell HTML, each report's data
+            and PDF path, and the merged PDF path (see render-packet.js)
+
+    Returns:
+        The renderer's output, without trace lines
+    """
+    if not check_node_installed():
+        raise RuntimeError("Node.js is not available. PDF generation requires Node.js.")
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = ["node", os.path.join(base_dir, "js", "render-packet.js"), manifest_path]
+    logger.info(f"Running packet renderer: {' '.join(cmd)}")
+
+    with span("pdf packet render", **{"process.command": "node render-packet.js"}):
+        process = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            check=False,
+            env=inject_env(dict(os.environ))
+        )
+        stdout = record_node_spans(process.stdout)
+
+    if stdout:
+        logger.info(f"Packet renderer stdout: {stdout}")
+    if process.returncode != 0:
+        logger.error(f"Packet rendering failed with error code {process.returncode}: {process.stderr}")
+        raise RuntimeError(f"Packet rendering failed: {process.stderr}")
+    return stdout
@@ -0,0 +1,293 @@
+"""
+LLM client module
+
+Shared wrapper around the Azure OpenAI client used by every AI call. It adds
+request and token rate limiting, a cap on concurrent upstream calls, per-call
+deadlines, jittered retries that honour Retry-After, and a circuit breaker that
+fails fast while the upstream is unhealthy.
+"""
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.tracing import span
+
+logger = logging.getLogger(__name__)
+
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "30"))
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("LLM_TOKENS_PER_MINUTE", "60000"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.environ.get("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.environ.get("LLM_RETRY_MAX_SECONDS", "20"))
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.environ.get("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+# Completion budget assumed when a call does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+
+def retryable_errors() -> Tuple[type, ...]:
+    """Upstream errors worth retrying. The OpenAI SDK is slow to import, so it is loaded on first use."""
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+class LLMClientError(Exception):
+    """Base class for errors raised by the LLM client wrapper."""
+
+
+class CircuitOpenError(LLMClientError):
+    """The circuit breaker is open; the upstream is considered unhealthy."""
+
+
+class LLMDeadlineExceeded(LLMClientError):
+    """The call could not complete before its deadline."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1, deadline: Optional[float] = None) -> bool:
+        """
+        Take `amount` tokens, waiting for them if needed.
+
+        Args:
+            amount: Tokens to take; capped at the bucket capacity
+            deadline: time.monotonic() value after which to give up
+
+        Returns:
+            True if the tokens were taken, False if the deadline would be missed
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Opens after `failure_threshold` failed calls, rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def release(self) -> None:
+        """Give back an allowed call that never reached the upstream."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self._state != self.CLOSED or self.failures >= self.failure_threshold:
+                if self._state == self.CLOSED:
+                    logger.warning(f"LLM circuit breaker opened after {self.failures} failures")
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough prompt token estimate (about four characters per token)."""
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 4 * len(messages)
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait according to the error response's retry headers, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """Rate-limited, bounded and circuit-broken wrapper around an OpenAI-compatible client."""
+
+    def __init__(
+        self,
+        client,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        deadline: float = LLM_DEADLINE_SECONDS,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.client = client
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.request_bucket = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 6))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, max(1.0, tokens_per_minute / 6))
+        self.breaker = breaker or CircuitBreaker(LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_SECONDS)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter, but never sooner than the server asked for
+        delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+        retry_after = parse_retry_after(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def chat_completion(self, deadline: Optional[float] = None, **kwargs) -> Any:
+        """
+        Call chat.completions.create with rate limiting, retries and a deadline.
+
+        Args:
+            deadline: Seconds the whole call (queueing and retries included) may take
+            **kwargs: Arguments for chat.completions.create
+
+        Returns:
+            The chat completion response
+
+        Raises:
+            CircuitOpenError: The upstream is unhealthy and the call was not attempted
+            LLMDeadlineExceeded: The call could not finish before the deadline
+            openai.OpenAIError: Non-retryable errors, or the last retryable one
+        """
+        with span(
+            "llm chat_completion",
+            kind="client",
+            **{"gen_ai.system": "openai", "gen_ai.request.model": kwargs.get("model"),
+               "gen_ai.request.max_tokens": kwargs.get("max_tokens")},
+        ) as current:
+            response = self._chat_completion(deadline, **kwargs)
+            usage = getattr(response, "usage", None)
+            if current is not None and usage is not None:
+                current.set_attribute("gen_ai.usage.input_tokens", usage.prompt_tokens)
+                current.set_attribute("gen_ai.usage.output_tokens", usage.completion_tokens)
+            return response
+
+    def _chat_completion(self, deadline: Optional[float], **kwargs) -> Any:
+        deadline_at = time.monotonic() + (deadline if deadline is not None else self.deadline)
+
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM upstream is unavailable (circuit open)")
+
+        estimated_tokens = estimate_tokens(kwargs.get("messages", [])) + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+        if not self.request_bucket.acquire(1, deadline_at) or not self.token_bucket.acquire(estimated_tokens, deadline_at):
+            self.breaker.release()
+            raise LLMDeadlineExceeded("LLM rate limit wait would exceed the deadline")
+
+        if not self._semaphore.acquire(timeout=max(0.0, deadline_at - time.monotonic())):
+            self.breaker.release()
+            raise LLMDeadlineExceeded("Timed out waiting for an LLM concurrency slot")
+
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    self.breaker.record_failure()
+                    raise LLMDeadlineExceeded("LLM call deadline exceeded")
+                try:
+                    response = self.client.chat.completions.create(
+                        timeout=min(self.timeout, remaining),
+                        **kwargs
+                    )
+                    self.breaker.record_success()
+                    return response
+                except retryable_errors() as e:
+                    delay = self._backoff(attempt, e)
+                    attempt += 1
+                    if attempt > self.max_retries or time.monotonic() + delay >= deadline_at:
+                        logger.error(f"LLM call failed after {attempt} attempt(s): {str(e)}")
+                        self.breaker.record_failure()
+                        raise
+                    logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                except Exception:
+                    # Not an upstream health problem (e.g. a bad request)
+                    self.breaker.release()
+                    raise
+        finally:
+            self._semaphore.release()
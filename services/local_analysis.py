@@ -0,0 +1,171 @@
+"""
+Local analysis module
+
+Deterministic, rule-based nutritional analysis computed from formatted report
+data in milliseconds. Produces the same SUMMARY/ANALYSIS/RECOMMENDATIONS/
+HEALTH_INSIGHTS fields as the AI analysis, so it can be used as a fast mode or
+as a fallback when the LLM is slow or unavailable.
+"""
+import logging
+from typing import Any, Dict, List, Tuple
+
+from services.allergens import contains_allergen
+
+logger = logging.getLogger(__name__)
+
+# Display name and unit for each nutrient in report data
+NUTRIENT_LABELS = {
+    "calories": ("Calories", "kcal"),
+    "protein": ("Protein", "g"),
+    "carbs": ("Carbohydrates", "g"),
+    "fat": ("Fat", "g"),
+    "fiber": ("Fiber", "g"),
+    "sodium": ("Sodium", "mg"),
+}
+
+# Percent-of-target bands; sodium is a ceiling rather than a goal
+LOW_THRESHOLD = 70
+HIGH_THRESHOLD = 110
+CEILING_NUTRIENTS = {"sodium"}
+
+# Foods suggested when intake is low, and advice when it is high
+LOW_INTAKE_FOODS = {
+    "calories": ["nut butters", "whole grains", "olive oil", "dried fruit"],
+    "protein": ["chicken breast", "fish", "eggs", "lentils", "greek yogurt"],
+    "carbs": ["oatmeal", "brown rice", "potatoes", "fruit"],
+    "fat": ["avocado", "almonds", "olive oil", "salmon"],
+    "fiber": ["broccoli", "beans", "oatmeal", "berries", "whole wheat bread"],
+}
+HIGH_INTAKE_ADVICE = {
+    "calories": "reduce portion sizes and energy-dense snacks",
+    "protein": "balance protein with more vegetables and whole grains",
+    "carbs": "swap refined carbohydrates for vegetables and whole grains",
+    "fat": "choose lean proteins and limit fried foods",
+    "fiber": "increase fluid intake alongside the high fiber intake",
+    "sodium": "limit processed and restaurant foods and add less salt",
+}
+
+def _logged_days(report_data: Dict[str, Any]) -> int:
+    days = {item.get("date") for item in report_data.get("food_items", []) if item.get("date")}
+    return max(len(days), 1)
+
+
+def _classify(name: str, percent: float) -> str:
+    if name in CEILING_NUTRIENTS:
+        return "above limit" if percent > 100 else "within limit"
+    if percent < LOW_THRESHOLD:
+        return "below target"
+    if percent > HIGH_THRESHOLD:
+        return "above target"
+    return "on target"
+
+
+def _nutrient_status(report_data: Dict[str, Any], days: int) -> List[Tuple[str, float, float, float, str]]:
+    """(name, daily average, target, percent, status) for each nutrient with a target."""
+    statuses = []
+    for name, values in report_data.get("nutrients", {}).items():
+        try:
+            actual = float(values.get("actual") or 0)
+            target = float(values.get("target") or 0)
+        except (ValueError, TypeError, AttributeError):
+            continue
+        if target <= 0:
+            continue
+        average = actual / days
+        percent = average / target * 100
+        statuses.append((name, average, target, percent, _classify(name, percent)))
+    return statuses
+
+
+def generate_local_analysis(report_data: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Compute a rule-based analysis from formatted report data.
+
+    Args:
+        report_data: Output of format_report_data (nutrients, food_items, patient)
+
+    Returns:
+        Dictionary with SUMMARY, ANALYSIS, RECOMMENDATIONS and HEALTH_INSIGHTS strings
+    """
+    patient = report_data.get("patient", {})
+    name = (patient.get("name") or "The patient").strip() or "The patient"
+    allergies = [a for a in patient.get("allergies", []) if a]
+    food_items = report_data.get("food_items", [])
+
+    if not food_items:
+        return {
+            "SUMMARY": f"No food intake was recorded for {name} in this period.",
+            "ANALYSIS": "Nutrient intake cannot be compared to targets without recorded meals.",
+            "RECOMMENDATIONS": "Confirm that meals are being logged so intake can be assessed.",
+            "HEALTH_INSIGHTS": f"Recorded allergies: {', '.join(allergies)}." if allergies else "No allergies recorded.",
+        }
+
+    days = _logged_days(report_data)
+    statuses = _nutrient_status(report_data, days)
+    on_track = [s for s in statuses if s[4] in ("on target", "within limit")]
+
+    # SUMMARY
+    summary = f"{name} logged {len(food_items)} food items over {days} day{'s' if days != 1 else ''}."
+    calories = next((s for s in statuses if s[0] == "calories"), None)
+    if calories:
+        summary += f" Average intake was {calories[1]:.0f} kcal/day ({calories[3]:.0f}% of the {calories[2]:.0f} kcal target)."
+    summary += f" {len(on_track)} of {len(statuses)} tracked nutrients were within their target range."
+
+    # ANALYSIS
+    analysis_lines = []
+    for nutrient, average, target, percent, status in statuses:
+        label, unit = NUTRIENT_LABELS.get(nutrient, (nutrient.title(), ""))
+        analysis_lines.append(
+            f"{label}: {average:.0f}{unit}/day vs {target:.0f}{unit} target ({percent:.0f}%, {status})."
+        )
+
+    # RECOMMENDATIONS, never suggesting foods that contain a recorded allergen
+    recommendations = []
+    for nutrient, _, _, _, status in statuses:
+        label = NUTRIENT_LABELS.get(nutrient, (nutrient.title(), ""))[0]
+        if status == "below target" and nutrient in LOW_INTAKE_FOODS:
+            foods = [f for f in LOW_INTAKE_FOODS[nutrient] if not contains_allergen(f, allergies)]
+            if foods:
+                recommendations.append(f"Increase {label.lower()} with foods such as {', '.join(foods[:3])}.")
+        elif status in ("above target", "above limit") and nutrient in HIGH_INTAKE_ADVICE:
+            recommendations.append(f"To lower {label.lower()}, {HIGH_INTAKE_ADVICE[nutrient]}.")
+    if not recommendations:
+        recommendations.append("Maintain the current eating pattern; intake is in line with targets.")
+
+    # HEALTH_INSIGHTS
+    insights = []
+    if "allergen_exposures" in report_data:
+        # Exact flags from the allergen index (see services.allergens)
+        matched_by_food: Dict[str, List[str]] = {}
+        for exposure in report_data["allergen_exposures"]:
+            matched = matched_by_food.setdefault(exposure["food_name"], [])
+            if exposure["allergen"] not in matched:
+                matched.append(exposure["allergen"])
+        exposures = sorted(f"{food} ({', '.join(matched)})" for food, matched in matched_by_food.items())
+    else:
+        exposures = sorted({
+            f"{item.get('name')} ({', '.join(matched)})"
+            for item in food_items
+            for matched in [contains_allergen(item.get("name", ""), allergies)]
+            if matched
+        })
+    if exposures:
+        insights.append(f"Possible allergen exposure: {'; '.join(exposures)}.")
+    elif allergies:
+        insights.append(f"No recorded foods matched the patient's allergies ({', '.join(allergies)}).")
+    for nutrient, _, _, percent, status in statuses:
+        if nutrient == "sodium" and status == "above limit":
+            insights.append("Sodium above the daily limit is associated with elevated blood pressure.")
+        if nutrient == "fiber" and status == "below target":
+            insights.append("Low fiber intake can affect digestive health and blood sugar control.")
+        if nutrient == "calories" and percent < 50:
+            insights.append("Very low energy intake may indicate under-eating or incomplete meal logging.")
+    if not insights:
+        insights.append("No specific health concerns identified from the recorded intake.")
+
+    return {
+        "SUMMARY": summary,
+        "ANALYSIS": " ".join(analysis_lines),
+        "RECOMMENDATIONS": " ".join(recommendations),
+        "HEALTH_INSIGHTS": " ".join(insights),
+    }
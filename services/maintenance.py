@@ -0,0 +1,47 @@
+"""
+Maintenance process
+
+Runs the periodic store and database upkeep: report compaction (retention and
+index reconciliation, see report_storage.compact_reports) every
+REPORT_COMPACTION_INTERVAL seconds and partition maintenance (see
+partitions.ensure_upcoming_partitions) every PARTITION_MAINTENANCE_INTERVAL
+seconds. Like the report scheduler it runs in its own process, never in the
+API, so the gunicorn master does not fork workers with these threads running
+and tests that build the app do not start them:
+
+    python -m services.maintenance
+"""
+import sys
+import signal
+import logging
+import threading
+
+from services.partitions import start_partition_worker, stop_partition_worker
+from services.report_storage import start_compaction_worker, stop_compaction_worker
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(filename)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    workers = [start_compaction_worker(), start_partition_worker()]
+    if not any(workers):
+        # Both intervals are 0; exit cleanly so a restart policy does not loop
+        logger.info("No maintenance workers enabled")
+        return
+    stopped = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopped.set())
+    stopped.wait()
+    stop_compaction_worker()
+    stop_partition_worker()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
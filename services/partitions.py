@@ -0,0 +1,73 @@
+"""
+Partition maintenance module
+
+food_transactions is range partitioned by month (see init.sql). Rows for a
+month without a partition land in food_transactions_default, which every
+query for that month then has to scan, so the partitions of the current
+month and the next PARTITION_MONTHS_AHEAD months are created ahead of time:
+once when the maintenance process (python -m services.maintenance) starts
+and every PARTITION_MAINTENANCE_INTERVAL seconds after that, from a
+background thread.
+"""
+import os
+import logging
+import threading
+from datetime import date, timedelta
+from typing import Optional
+
+from data_access.main import ensure_food_transaction_partitions
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))
+# Seconds between partition maintenance runs; 0 disables the worker
+PARTITION_MAINTENANCE_INTERVAL = int(os.environ.get("PARTITION_MAINTENANCE_INTERVAL", "86400"))
+
+
+def ensure_upcoming_partitions(today: Optional[date] = None, months_ahead: int = None) -> int:
+    """
+    Create the missing partitions from this month through months_ahead months from now.
+
+    Args:
+        today: Date to count from (default: today)
+        months_ahead: Months after the current one to cover (default: PARTITION_MONTHS_AHEAD)
+
+    Returns:
+        Number of partitions created
+    """
+    today = today or date.today()
+    months_ahead = PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    month_index = today.year * 12 + today.month + months_ahead
+    last_day = date(month_index // 12, month_index % 12 + 1, 1) - timedelta(days=1)
+    return ensure_food_transaction_partitions(today.replace(day=1), last_day)
+
+
+_partition_thread: Optional[threading.Thread] = None
+_partition_stop = threading.Event()
+
+
+def start_partition_worker(interval: int = None) -> Optional[threading.Thread]:
+    """Start the partition maintenance thread once per process; it runs immediately, then every interval."""
+    global _partition_thread
+    interval = PARTITION_MAINTENANCE_INTERVAL if interval is None else interval
+    if interval <= 0 or (_partition_thread and _partition_thread.is_alive()):
+        return _partition_thread
+
+    def run():
+        while True:
+            try:
+                ensure_upcoming_partitions()
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {str(e)}")
+            if _partition_stop.wait(interval):
+                return
+
+    _partition_stop.clear()
+    _partition_thread = threading.Thread(target=run, name="partition-maintenance", daemon=True)
+    _partition_thread.start()
+    logger.info(f"Started partition maintenance worker (every {interval}s)")
+    return _partition_thread
+
+
+def stop_partition_worker() -> None:
+    _partition_stop.set()
@@ -0,0 +1,172 @@
+"""
+Profiling module
+
+Runs a single request under cProfile without a redeploy. A request is
+profiled when it sends the X-Profile-Token header matching PROFILING_TOKEN
+(on-demand profiling is off while the token is unset), or when it is picked
+by PROFILE_SAMPLE_RATE for continuous low-rate profiling.
+
+The profile covers the request thread: report formatting, date conversion,
+database calls, the wait on the Node PDF renderer and the wait for AI
+analysis (the LLM call itself runs on the analysis executor). It is saved as
+a .prof file in PROFILE_DIR (open it with pstats or snakeviz), the newest
+PROFILE_MAX_FILES are kept, and a summary of those buckets is returned in the
+X-Profile-Summary header.
+
+Only one request per process is profiled at a time. On Python 3.12+ cProfile
+is built on sys.monitoring, which is process-wide: the profile also records
+whatever other threads of the worker (concurrent gthread requests, the
+analysis executor, background workers) run meanwhile, and a second profiler
+cannot be enabled while one is active. A token request waits up to
+PROFILE_LOCK_TIMEOUT seconds for a running profile to finish; a sampled one
+is simply not profiled. For a profile of one request alone, send it to a
+worker started with GUNICORN_THREADS=1. Before 3.12 the profile covers only
+the request thread.
+"""
+import os
+import hmac
+import time
+import random
+import pstats
+import cProfile
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import Flask, g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+# Fraction of requests profiled without a token (0 disables)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+# Seconds a token request waits for another request's profile to finish
+PROFILE_LOCK_TIMEOUT = float(os.environ.get("PROFILE_LOCK_TIMEOUT", "30"))
+
+# Held for the duration of a profile; see the module docstring
+_profile_lock = threading.Lock()
+
+FunctionKey = Tuple[str, int, str]
+
+
+def _is_db_call(key: FunctionKey) -> bool:
+    # psycopg2 is a C extension, so its calls are recorded as built-ins
+    return key[0] == "~" and "psycopg2" in key[2]
+
+
+# Summary bucket -> predicate over pstats function keys (file, line, name); cumulative times are summed
+PROFILE_BUCKETS: Dict[str, Callable[[FunctionKey], bool]] = {
+    "format_report_data": lambda key: key[2] == "format_report_data",
+    "convert_dates_to_strings": lambda key: key[2] == "convert_dates_to_strings",
+    "db": _is_db_call,
+    "node": lambda key: key[0].endswith("subprocess.py") and key[2] == "run",
+    "ai_analysis_wait": lambda key: key[2] == "get_report_analysis",
+}
+
+
+def _profile_reason() -> Optional[str]:
+    token = request.headers.get(PROFILE_TOKEN_HEADER)
+    if token and PROFILING_TOKEN:
+        if hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode()):
+            return "token"
+        logger.warning(f"Rejected profiling token for {request.path}")
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def should_profile() -> bool:
+    """Whether the current request is profiled: a valid token or a sampling hit."""
+    return _profile_reason() is not None
+
+
+def summarize_profile(stats: pstats.Stats, total_ms: float) -> Dict[str, float]:
+    """
+    Milliseconds spent in each PROFILE_BUCKETS bucket.
+
+    Args:
+        stats: Stats of the finished profile
+        total_ms: Wall time of the request
+
+    Returns:
+        Dictionary of "total" and bucket name to milliseconds
+    """
+    summary = {"total": round(total_ms, 1)}
+    for bucket, matches in PROFILE_BUCKETS.items():
+        cumulative = sum(entry[3] for key, entry in stats.stats.items() if matches(key))
+        summary[bucket] = round(cumulative * 1000, 1)
+    return summary
+
+
+def _prune_profiles() -> None:
+    files = sorted(
+        (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")),
+        key=os.path.getmtime,
+    )
+    for path in files[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else []:
+        os.remove(path)
+
+
+def _start_profile() -> None:
+    reason = _profile_reason()
+    if reason is None:
+        return
+    if not _profile_lock.acquire(timeout=PROFILE_LOCK_TIMEOUT if reason == "token" else 0):
+        logger.warning(f"Not profiling {request.path}: another request is being profiled")
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:  # another profiling tool (e.g. a debugger) is already active
+        _profile_lock.release()
+        logger.warning(f"Could not profile {request.path}: {str(e)}")
+        return
+    g.profiler = profiler
+    g.profile_started = time.perf_counter()
+
+
+def _finish_profile(response):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    _profile_lock.release()
+    total_ms = (time.perf_counter() - g.pop("profile_started")) * 1000
+
+    endpoint = (request.endpoint or "unknown").split(".")[-1]
+    filename = f"{time.strftime('%Y%m%d_%H%M%S')}_{endpoint}_{os.getpid()}_{random.randrange(16 ** 4):04x}.prof"
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, filename)
+        profiler.dump_stats(path)
+        _prune_profiles()
+    except OSError as e:
+        logger.error(f"Could not save profile for {request.path}: {str(e)}")
+        path = None
+
+    summary = summarize_profile(pstats.Stats(profiler), total_ms)
+    response.headers["X-Profile-Summary"] = "; ".join(f"{name}={ms}ms" for name, ms in summary.items())
+    if path:
+        response.headers["X-Profile-File"] = filename
+    logger.info(f"Profiled {request.method} {request.full_path}: {summary} ({path})")
+    return response
+
+
+def _abandon_profile(error=None) -> None:
+    # after_request is skipped when the view raised; never leave the profiler running on the thread
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+
+
+def init_profiling(app: Flask) -> None:
+    """Register the request hooks; they do nothing unless a token is configured or sampling is on."""
+    if not PROFILING_TOKEN and PROFILE_SAMPLE_RATE <= 0:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abandon_profile)
@@ -2,25 +2,52 @@ import os
 import sys
 import json
 import logging
+import threading
 from typing import Dict, List, Optional, Any
 
-from openai import AzureOpenAI
-from dotenv import load_dotenv
+from services.aggregator import summarize_daily_rollups
+from services.allergens import find_allergen_exposures
+from services.prompt_encoding import encode_patient_context, load_template
+from services.llm_client import LLM_TIMEOUT_SECONDS, LLMClient, LLMClientError
 
 
-load_dotenv()
-
 endpoint = os.getenv(
     "AZUREAI_ENDPOINT_URL", "https://cardwatch-reporting-ai.openai.azure.com/"
 )
 deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4o")
-subscription_key = os.getenv("AZURE_OPENAI_API_KEY")
 
-azure_openai = AzureOpenAI(
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
-    api_version="2024-10-01-preview",
-)
+_llm_client: Optional[LLMClient] = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """
+    The shared rate-limited, circuit-broken client all AI calls go through.
+
+    Created on first use: the OpenAI SDK takes most of the app's import time,
+    and the health check, CLI tools and most requests never call the LLM.
+    """
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                from openai import AzureOpenAI
+                azure_openai = AzureOpenAI(
+                    azure_endpoint=endpoint,
+                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                    api_version="2024-10-01-preview",
+                    timeout=LLM_TIMEOUT_SECONDS,
+                    max_retries=0,  # Retries are handled by llm_client
+                )
+                _llm_client = LLMClient(azure_openai)
+    return _llm_client
+
+
+def get_llm_status() -> Dict[str, Any]:
+    """Circuit breaker state of the shared LLM client, without creating it."""
+    if _llm_client is None:
+        return {"initialized": False, "circuit": None}
+    return {"initialized": True, "circuit": _llm_client.breaker.state}
 
 
 def get_ai_prompt_response(data):
@@ -28,12 +55,9 @@ def get_ai_prompt_response(data):
     Generate a structured JSON report based on dietary data using the OpenAI model.
     This format is meant for the PDF report format.
     """
-    with open("services/templates/response_format.json", "r") as f:
-        response_format = f.read()
-
-    response_format_str = str(response_format)
+    response_format_str = load_template("response_format.json")
 
-    response = azure_openai.chat.completions.create(
+    response = get_llm_client().chat_completion(
         model=deployment,
         temperature=0.3,  # Lower temperature for more consistent results
         messages=[
@@ -46,17 +70,25 @@ def get_ai_prompt_response(data):
                             data provided by the user. If no data is available, replace empty fields with 'na' \
                             and ensure valid json in the response. Template: {response_format_str}",
             },
-            {"role": "user", "content": str(data)},
+            {"role": "user", "content": encode_patient_context(data)},
         ],
     )
 
     return response.choices[0].message.content
 
 
-def get_ai_analysis(data):
+# Returned by get_ai_analysis when the LLM call fails
+AI_ANALYSIS_ERROR_RESPONSE = '{"SUMMARY": "Unable to generate analysis due to an error.", "ANALYSIS": "", "RECOMMENDATIONS": "", "HEALTH_INSIGHTS": ""}'
+
+
+def get_ai_analysis(data, deadline=None):
     """
     Generate a comprehensive analysis and recommendations for the dashboard display.
     Includes nutritional analysis, recommendations, and health insights.
+
+    Args:
+        data: Report data to analyze
+        deadline: Seconds the LLM call may take (default: the client's LLM_DEADLINE_SECONDS)
     """
     system_prompt = """
     You are a nutrition expert assistant helping dietitians analyze patient nutritional data. 
@@ -73,12 +105,13 @@ def get_ai_analysis(data):
     """
     
     try:
-        response = azure_openai.chat.completions.create(
+        response = get_llm_client().chat_completion(
+            deadline=deadline,
             model=deployment,
             temperature=0.4,
             messages=[
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": str(data)}
+                {"role": "user", "content": encode_patient_context(data)}
             ],
             response_format={"type": "json_object"}
         )
@@ -86,7 +119,7 @@ def get_ai_analysis(data):
         return response.choices[0].message.content
     except Exception as e:
         logging.error(f"Error generating dashboard analysis: {str(e)}")
-        return '{"SUMMARY": "Unable to generate analysis due to an error.", "ANALYSIS": "", "RECOMMENDATIONS": "", "HEALTH_INSIGHTS": ""}'
+        return AI_ANALYSIS_ERROR_RESPONSE
 
 
 class ChatContext:
@@ -128,6 +161,33 @@ class ChatContext:
                     if 'fat_target' in target:
                         target_info += f"Fat: {target.get('fat_target')}g "
                     target_info += "\n"
+
+        # Exact allergen exposure flags from the allergen index
+        exposures = find_allergen_exposures(self.patient_data.get('food_transactions', []), allergies)
+        if exposures:
+            exposure_info = "; ".join(
+                f"{e['food_name']} on {e['consumption_date']} ({e['allergen']}"
+                + (f", {e['severity']}" if e['severity'] else "") + ")"
+                for e in exposures
+            )
+        else:
+            exposure_info = "None found in logged food"
+
+        # Summarize intake from the pre-aggregated daily rollups
+        intake_info = "No intake recorded"
+        rollups = self.patient_data.get('daily_nutrient_rollups') or []
+        if rollups:
+            totals = summarize_daily_rollups(rollups)
+            days = totals['days'] or 1
+            intake_info = (
+                f"Average per day over {totals['days']} logged days: "
+                f"Calories: {totals['calories'] / days:.0f} "
+                f"Protein: {totals['protein'] / days:.0f}g "
+                f"Carbs: {totals['carbs'] / days:.0f}g "
+                f"Fat: {totals['fat'] / days:.0f}g "
+                f"Fiber: {totals['fiber'] / days:.0f}g "
+                f"Sodium: {totals['sodium'] / days:.0f}mg"
+            )
         
         # Create the system prompt with patient context
         return f"""
@@ -138,8 +198,10 @@ class ChatContext:
         - Age: {age}
         - Gender: {gender}
         - Allergies: {allergy_list}
+        - Allergen exposures: {exposure_info}
         - Nutrient Targets: 
         {target_info}
+        - Intake: {intake_info}
         
         As a nutrition expert, your role is to:
         1. Answer questions about the patient's nutritional needs based on their data
@@ -198,7 +260,7 @@ def chat_with_patient_context(
         context.add_message("user", message)
         
         # Get response from OpenAI
-        response = azure_openai.chat.completions.create(
+        response = get_llm_client().chat_completion(
             model=deployment,
             temperature=0.7,  # Slightly higher temperature for more natural conversation
             messages=context.get_messages_for_api()
@@ -216,6 +278,13 @@ def chat_with_patient_context(
             "chat_history": context.messages
         }
     
+    except LLMClientError as e:
+        # Circuit open or deadline missed: fail fast with an actionable message
+        logging.warning(f"AI service unavailable for chat: {str(e)}")
+        return {
+            "response": "The AI assistant is temporarily busy. Please try again in a moment.",
+            "chat_history": chat_history or []
+        }
     except Exception as e:
         logging.error(f"Error in chat with patient context: {str(e)}")
         return {
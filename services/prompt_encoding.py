@@ -0,0 +1,169 @@
+"""
+Prompt encoding module
+
+Renders patient context for LLM prompts in a compact, deterministic format and
+caches static prompt templates in memory. Prompt size drives both LLM latency
+and cost, so numbers are rounded, empty fields dropped and food items
+aggregated into one line per food.
+"""
+import os
+import re
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+NUMERIC_STRING = re.compile(r"^-?\d+(\.\d+)?$")
+# Tokenizing str(data) costs about as much as encoding it, so the before/after
+# token counts are only taken for one in this many prompts (0 never)
+PROMPT_STATS_SAMPLE_EVERY = int(os.environ.get("PROMPT_STATS_SAMPLE_EVERY", "20"))
+
+_stats_lock = threading.Lock()
+_stats = {"prompts": 0, "sampled_prompts": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+@lru_cache(maxsize=None)
+def load_template(name: str) -> str:
+    """Read a prompt template from services/templates once per process."""
+    with open(os.path.join(TEMPLATES_DIR, name), "r") as f:
+        return f.read()
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # Imported on first use to keep it out of app start-up
+    try:
+        import tiktoken
+    except ImportError:  # Fall back to a character-based estimate
+        return None
+    return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise about four characters per token."""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _format_scalar(value: Any) -> str:
+    """Round numbers (including Decimal strings) and drop trailing zeros."""
+    if isinstance(value, str) and NUMERIC_STRING.match(value):
+        value = float(value)
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, (int, float)):
+        rounded = round(float(value), 1)
+        return str(int(rounded)) if rounded.is_integer() else str(rounded)
+    return str(value)
+
+
+def _is_target_pair(value: Any) -> bool:
+    return isinstance(value, dict) and set(value) == {"actual", "target"}
+
+
+def _encode_food_items(items: List[Dict[str, Any]]) -> List[str]:
+    """Aggregate food items into one line per food: servings, calories and days eaten."""
+    foods: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        name = item.get("name", "Unknown item")
+        food = foods.setdefault(name, {"servings": 0.0, "calories": 0.0, "days": set()})
+        try:
+            quantity = float(item.get("quantity") or 0)
+            food["servings"] += quantity
+            food["calories"] += float(item.get("calories") or 0) * quantity
+        except (ValueError, TypeError):
+            continue
+        if item.get("date"):
+            food["days"].add(item["date"])
+
+    lines = []
+    for name in sorted(foods):
+        food = foods[name]
+        lines.append(
+            f"- {name}: {_format_scalar(food['servings'])} servings, "
+            f"{_format_scalar(food['calories'])} kcal, {len(food['days'])} days"
+        )
+    return lines
+
+
+def _encode(data: Dict[str, Any], indent: str = "") -> List[str]:
+    lines = []
+    for key, value in data.items():
+        if _is_empty(value):
+            continue
+        if key == "food_items" and isinstance(value, list):
+            lines.append(f"{indent}foods (aggregated):")
+            lines.extend(indent + line for line in _encode_food_items(value))
+        elif isinstance(value, dict) and value and all(_is_target_pair(v) for v in value.values()):
+            pairs = " ".join(
+                f"{name}={_format_scalar(v['actual'])}/{_format_scalar(v['target'])}"
+                for name, v in value.items()
+            )
+            lines.append(f"{indent}{key} (actual/target): {pairs}")
+        elif isinstance(value, dict):
+            nested = _encode(value, indent + "  ")
+            if nested:
+                lines.append(f"{indent}{key}:")
+                lines.extend(nested)
+        elif isinstance(value, list):
+            if all(not isinstance(v, (dict, list)) for v in value):
+                lines.append(f"{indent}{key}: {', '.join(_format_scalar(v) for v in value if not _is_empty(v))}")
+            else:
+                lines.append(f"{indent}{key}:")
+                for element in value:
+                    if isinstance(element, dict):
+                        fields = " ".join(
+                            f"{k}={_format_scalar(v)}" for k, v in element.items()
+                            if not _is_empty(v) and not isinstance(v, (dict, list))
+                        )
+                        lines.append(f"{indent}- {fields}")
+                    elif not _is_empty(element):
+                        lines.append(f"{indent}- {_format_scalar(element)}")
+        else:
+            lines.append(f"{indent}{key}: {_format_scalar(value)}")
+    return lines
+
+
+def encode_patient_context(data: Any) -> str:
+    """
+    Render patient context as compact, deterministic text for an LLM prompt.
+
+    Args:
+        data: Patient/report data dictionary
+
+    Returns:
+        Encoded context string
+    """
+    if not isinstance(data, dict):
+        return _format_scalar(data)
+
+    encoded = "\n".join(_encode(data))
+
+    with _stats_lock:
+        sampled = PROMPT_STATS_SAMPLE_EVERY > 0 and _stats["prompts"] % PROMPT_STATS_SAMPLE_EVERY == 0
+        _stats["prompts"] += 1
+    if sampled:
+        tokens_before = count_tokens(str(data))
+        tokens_after = count_tokens(encoded)
+        with _stats_lock:
+            _stats["sampled_prompts"] += 1
+            _stats["tokens_before"] += tokens_before
+            _stats["tokens_after"] += tokens_after
+        logger.info(f"Encoded prompt context: {tokens_before} -> {tokens_after} tokens")
+
+    return encoded
+
+
+def get_prompt_encoding_stats() -> Dict[str, int]:
+    """Prompts encoded, and cumulative token counts before and after encoding over the sampled ones."""
+    with _stats_lock:
+        return dict(_stats)
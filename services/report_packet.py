@@ -0,0 +1,140 @@
+"""
+Report packet module
+
+Renders many patients' reports as one packet, e.g. a clinic's weekly
+caseload: a single PDF that opens with a table of contents, or a zip with a
+PDF per patient.
+
+All patients are rendered in one browser session by js/render-packet.js. The
+report template and its chart library are loaded once, and each patient is
+drawn into the same page and printed. An extra patient costs a chart
+re-render and a page.pdf, not a Node start, a browser launch and a page load
+as a standalone report does. Merging into one PDF needs pdf-lib in js/; zips
+are built here.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+from services.js_bridge_service import DateTimeEncoder, generate_html_file, render_pdf_packet
+from services.report_service import prepare_report_data
+from services.report_storage import get_report_storage
+from services.shared_cache import get_patient_bundle
+
+logger = logging.getLogger(__name__)
+
+# Packet format -> mimetype of the stored file
+PACKET_FORMATS = {"pdf": "application/pdf", "zip": "application/zip"}
+REPORT_PACKET_MAX_PATIENTS = int(os.environ.get("REPORT_PACKET_MAX_PATIENTS", "100"))
+PACKET_PREFIX = "packets"
+
+
+def packet_key(patient_ids: List[Any], start_date: Optional[str], end_date: Optional[str], format: str) -> str:
+    """Storage key for a packet: its request digest and a timestamp, sharded by month."""
+    request_digest = hashlib.blake2b(
+        json.dumps([[str(p) for p in patient_ids], start_date, end_date]).encode(), digest_size=4
+    ).hexdigest()
+    now = datetime.now()
+    return f"{PACKET_PREFIX}/{now.strftime('%Y-%m')}/packet-{request_digest}_{now.strftime('%Y%m%d_%H%M%S')}.{format}"
+
+
+def _report_title(patient_id, data: Dict[str, Any]) -> str:
+    name = (data.get("patient") or {}).get("name")
+    return f"{name} (ID {patient_id})" if name else f"Patient {patient_id}"
+
+
+def generate_report_packet(
+    patient_ids: List[Any],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    format: str = "pdf",
+    include_ai: Union[bool, str] = "fast"
+) -> Dict[str, Any]:
+    """
+    Generate one packet of nutrition reports for several patients.
+
+    Args:
+        patient_ids: Patients in packet order; duplicates are dropped
+        start_date: Start date for the report period (format: YYYY-MM-DD)
+        end_date: End date for the report period (format: YYYY-MM-DD)
+        format: "pdf" for one document with a table of contents, "zip" for a PDF per patient
+        include_ai: Analysis mode, as for generate_patient_report (default="fast")
+
+    Returns:
+        Dictionary with the packet file, the patients it contains and those that failed
+    """
+    if format not in PACKET_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(PACKET_FORMATS)}")
+    patient_ids = list(dict.fromkeys(patient_ids))
+    if not patient_ids:
+        raise ValueError("At least one patient is required")
+    if len(patient_ids) > REPORT_PACKET_MAX_PATIENTS:
+        raise ValueError(f"A packet holds at most {REPORT_PACKET_MAX_PATIENTS} patients")
+
+    # A patient whose data cannot be prepared is left out rather than failing the packet
+    reports, failed = [], []
+    for patient_id in patient_ids:
+        try:
+            bundle = get_patient_bundle(patient_id, start_date, end_date)
+            reports.append((patient_id, prepare_report_data(bundle, patient_id, start_date, end_date, include_ai)))
+        except Exception as e:
+            logger.error(f"Leaving patient {patient_id} out of the packet: {str(e)}")
+            failed.append({"patient_id": patient_id, "error": str(e)})
+    if not reports:
+        raise RuntimeError("No report in the packet could be prepared")
+
+    storage = get_report_storage()
+    key = packet_key([patient_id for patient_id, _ in reports], start_date, end_date, format)
+    output_path = storage.path_for_write(key)
+    template_path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "js", "templates", "report-template.html"
+    )
+
+    with tempfile.TemporaryDirectory(prefix="packet_") as work_dir:
+        # The shell is the template without data; each patient is drawn into it in turn
+        shell_path = generate_html_file(None, os.path.join(work_dir, "shell.html"), template_path)
+        manifest = {
+            "shell": shell_path,
+            "reports": [
+                {
+                    "title": _report_title(patient_id, data),
+                    "subtitle": f"{data['date_range']['start'] or 'All dates'} to {data['date_range']['end'] or 'latest'}",
+                    "data": data,
+                    "pdf": os.path.join(work_dir, f"{patient_id}.pdf"),
+                }
+                for patient_id, data in reports
+            ],
+            "merged": output_path if format == "pdf" else None,
+        }
+        manifest_path = os.path.join(work_dir, "manifest.json")
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, cls=DateTimeEncoder)
+
+        started = time.perf_counter()
+        render_pdf_packet(manifest_path)
+        render_seconds = time.perf_counter() - started
+        logger.info(f"Rendered a packet of {len(reports)} reports in {render_seconds:.2f}s")
+
+        if format == "zip":
+            # PDFs are already compressed; storing them keeps the zip fast to build
+            with zipfile.ZipFile(output_path, "w", zipfile.ZIP_STORED) as packet:
+                for (patient_id, _), report in zip(reports, manifest["reports"]):
+                    packet.write(report["pdf"], f"{patient_id}_nutrition_report.pdf")
+
+    storage.commit(key)
+    return {
+        "status": "Packet generated",
+        "file": key,
+        "path": storage.local_path(key),
+        "format": format,
+        "patients": [patient_id for patient_id, _ in reports],
+        "failed": failed,
+        "render_seconds": round(render_seconds, 2),
+    }
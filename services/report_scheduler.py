@@ -0,0 +1,362 @@
+"""
+Report scheduler module
+
+Pre-generates recurring reports in an off-peak window, so the morning
+/generate-report calls find a reusable report in the store (see
+report_service.find_reusable_report) instead of generating one.
+
+Recurring reports are defined in REPORT_SCHEDULE_FILE, a JSON list such as
+
+    [{"name": "weekly", "patient_ids": "all", "window_days": 7, "sections": null, "include_ai": true}]
+
+or registered with register_report_definition(). Each definition runs daily
+at the start of REPORT_PREGEN_WINDOW (local time) plus a random delay of up
+to REPORT_PREGEN_JITTER_SECONDS, generates at most REPORT_PREGEN_CONCURRENCY
+reports at a time and starts none after the window closes. A window missed
+since the last recorded run (e.g. while the scheduler was down) is caught up
+at start-up after a random delay. Runs are recorded in the report store under
+a store lock, so processes sharing the store do not duplicate work. Requires
+APScheduler.
+
+The scheduler runs in its own process, never in the API (whose gunicorn
+master is forked into workers):
+
+    python -m services.report_scheduler
+    python -m services.report_scheduler --run-now weekly
+"""
+import os
+import sys
+import json
+import signal
+import argparse
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+try:
+    from apscheduler.executors.pool import ThreadPoolExecutor as SchedulerExecutor
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+except ImportError:  # APScheduler is only needed for scheduled pre-generation
+    BackgroundScheduler = None
+
+from data_access.main import get_patients
+from services.report_service import REPORT_SECTIONS, find_reusable_report, generate_patient_report
+from services.report_storage import get_report_storage
+from services.shared_cache import get_patient_bundle_with_read_time
+
+logger = logging.getLogger(__name__)
+
+REPORT_SCHEDULE_FILE = os.environ.get("REPORT_SCHEDULE_FILE", "report_schedules.json")
+# Local time range in which scheduled reports are generated; may cross midnight
+REPORT_PREGEN_WINDOW = os.environ.get("REPORT_PREGEN_WINDOW", "01:00-05:00")
+REPORT_PREGEN_CONCURRENCY = int(os.environ.get("REPORT_PREGEN_CONCURRENCY", "2"))
+# Upper bound of the random delay added to scheduled and catch-up runs
+REPORT_PREGEN_JITTER_SECONDS = int(os.environ.get("REPORT_PREGEN_JITTER_SECONDS", "600"))
+
+STATE_KEY = "schedules/state.json"
+ANALYSIS_MODES = (True, False, "fast")
+
+_definitions: Dict[str, "ReportDefinition"] = {}
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class ReportDefinition:
+    """A recurring report: which patients, which rolling date window and how it is generated."""
+
+    def __init__(
+        self,
+        name: str,
+        patient_ids: Union[str, List[int]] = "all",
+        window_days: int = 7,
+        end_offset_days: int = 0,
+        sections: Optional[List[str]] = None,
+        include_ai: Union[bool, str] = True,
+    ):
+        if not name:
+            raise ValueError("Report definitions need a name")
+        if patient_ids != "all" and not (isinstance(patient_ids, list) and all(isinstance(p, int) for p in patient_ids)):
+            raise ValueError(f"{name}: patient_ids must be \"all\" or a list of integers")
+        if window_days < 1 or end_offset_days < 0:
+            raise ValueError(f"{name}: window_days must be positive and end_offset_days not negative")
+        unknown = set(sections or ()) - set(REPORT_SECTIONS)
+        if unknown:
+            raise ValueError(f"{name}: unknown sections {sorted(unknown)}")
+        if include_ai not in ANALYSIS_MODES:
+            raise ValueError(f"{name}: include_ai must be true, false or \"fast\"")
+        self.name = name
+        self.patient_ids = patient_ids
+        self.window_days = window_days
+        self.end_offset_days = end_offset_days
+        self.sections = sections or None
+        self.include_ai = include_ai
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> "ReportDefinition":
+        return cls(**raw)
+
+    def date_range(self, today: date) -> Tuple[str, str]:
+        """Inclusive (start, end) dates of the rolling window ending end_offset_days before today."""
+        end = today - timedelta(days=self.end_offset_days)
+        start = end - timedelta(days=self.window_days - 1)
+        return start.isoformat(), end.isoformat()
+
+    def resolve_patient_ids(self) -> List[int]:
+        if self.patient_ids == "all":
+            return [patient["id"] for patient in get_patients()]
+        return list(self.patient_ids)
+
+
+def parse_window(value: str) -> Tuple[time, time]:
+    """Parse "HH:MM-HH:MM" into start and end times."""
+    start, end = value.split("-")
+    return time.fromisoformat(start.strip()), time.fromisoformat(end.strip())
+
+
+def current_window(now: datetime, window: str = REPORT_PREGEN_WINDOW) -> Tuple[datetime, datetime]:
+    """Start and end of the most recent off-peak window that started at or before now."""
+    start_time, end_time = parse_window(window)
+    start = datetime.combine(now.date(), start_time)
+    if start > now:
+        start -= timedelta(days=1)
+    end = datetime.combine(start.date(), end_time)
+    if end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+
+def _load_state(storage) -> Dict[str, Any]:
+    if not storage.exists(STATE_KEY):
+        return {}
+    return json.loads(storage.read_bytes(STATE_KEY))
+
+
+def _record_run(storage, name: str, run: Dict[str, Any]) -> None:
+    with storage.lock("schedule_state"):
+        state = _load_state(storage)
+        state[name] = run
+        storage.write_bytes(STATE_KEY, json.dumps(state, indent=2).encode("utf-8"))
+
+
+def run_definition(
+    definition: ReportDefinition,
+    window_start: Optional[datetime] = None,
+    deadline: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    Generate a definition's reports for its current date range.
+
+    Patients whose matching report is still reusable are skipped. No new
+    report is started after the deadline; those patients are counted as
+    deferred and picked up by the next run.
+
+    Args:
+        definition: The recurring report
+        window_start: Start of the window this run belongs to; the run is skipped
+            if another process already recorded a run for it
+        deadline: Time after which no new report is started
+
+    Returns:
+        Run record with the date range and generated/reused/failed/deferred counts
+    """
+    storage = get_report_storage()
+    with storage.lock(f"schedule_{definition.name}"):
+        last_run = _load_state(storage).get(definition.name, {}).get("last_run")
+        if window_start is not None and last_run and last_run >= window_start.isoformat(timespec="seconds"):
+            logger.info(f"Scheduled reports {definition.name} already ran at {last_run}; skipping")
+            return {"skipped": True, "last_run": last_run}
+
+        started_at = datetime.now()
+        start_date, end_date = definition.date_range(started_at.date())
+        counts = {"generated": 0, "reused": 0, "failed": 0, "deferred": 0}
+        counts_lock = threading.Lock()
+
+        def generate(patient_id: int) -> None:
+            if deadline is not None and datetime.now() >= deadline:
+                outcome = "deferred"
+            else:
+                try:
+                    if find_reusable_report(str(patient_id), start_date, end_date, definition.sections, definition.include_ai):
+                        outcome = "reused"
+                    else:
+                        patient_data, data_read_at = get_patient_bundle_with_read_time(patient_id, start_date, end_date)
+                        result = generate_patient_report(
+                            patient_data,
+                            patient_id=str(patient_id),
+                            start_date=start_date,
+                            end_date=end_date,
+                            sections=definition.sections,
+                            include_ai=definition.include_ai,
+                            data_read_at=data_read_at,
+                        )
+                        # An HTML-only fallback, or local analysis standing in for the AI
+                        # (e.g. during an LLM outage), is not reusable; the next run retries it
+                        degraded = definition.include_ai is True and result.get("analysis_source") != "ai"
+                        outcome = "generated" if result.get("format") == "pdf" and not degraded else "failed"
+                except Exception as e:
+                    logger.error(f"Scheduled report {definition.name} failed for patient {patient_id}: {str(e)}")
+                    outcome = "failed"
+            with counts_lock:
+                counts[outcome] += 1
+
+        with ThreadPoolExecutor(max_workers=REPORT_PREGEN_CONCURRENCY, thread_name_prefix="report-pregen") as pool:
+            list(pool.map(generate, definition.resolve_patient_ids()))
+
+        run = {
+            "last_run": started_at.isoformat(timespec="seconds"),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "date_range": {"start": start_date, "end": end_date},
+            **counts,
+        }
+        _record_run(storage, definition.name, run)
+        logger.info(f"Scheduled reports {definition.name}: {run}")
+        return run
+
+
+def _run_scheduled(name: str) -> None:
+    definition = _definitions.get(name)
+    if definition is None:
+        return
+    window_start, window_end = current_window(datetime.now())
+    # A catch-up that starts after the window closed runs to completion
+    deadline = window_end if datetime.now() < window_end else None
+    run_definition(definition, window_start=window_start, deadline=deadline)
+
+
+def _schedule(definition: ReportDefinition, state: Dict[str, Any], now: datetime) -> None:
+    start_time, _ = parse_window(REPORT_PREGEN_WINDOW)
+    _scheduler.add_job(
+        _run_scheduled,
+        CronTrigger(hour=start_time.hour, minute=start_time.minute, jitter=REPORT_PREGEN_JITTER_SECONDS),
+        args=[definition.name],
+        id=f"report:{definition.name}",
+        replace_existing=True,
+    )
+
+    # Definitions that have never run wait for their first window
+    last_run = state.get(definition.name, {}).get("last_run")
+    window_start, _ = current_window(now)
+    if last_run and last_run < window_start.isoformat(timespec="seconds"):
+        run_at = now + timedelta(seconds=random.uniform(0, REPORT_PREGEN_JITTER_SECONDS))
+        logger.info(f"Scheduled reports {definition.name} missed the window at {window_start}; catching up at {run_at}")
+        _scheduler.add_job(
+            _run_scheduled,
+            "date",
+            run_date=run_at,
+            args=[definition.name],
+            id=f"report-catchup:{definition.name}",
+            replace_existing=True,
+        )
+
+
+def load_report_definitions(path: str = REPORT_SCHEDULE_FILE) -> List[ReportDefinition]:
+    """Read recurring report definitions from a JSON file; no file means no definitions."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [ReportDefinition.from_dict(raw) for raw in json.load(f)]
+
+
+def register_report_definition(definition: ReportDefinition) -> None:
+    """Add or replace a recurring report; scheduled immediately if the scheduler is running."""
+    with _scheduler_lock:
+        _definitions[definition.name] = definition
+        if _scheduler is not None:
+            _schedule(definition, _load_state(get_report_storage()), datetime.now())
+
+
+def start_report_scheduler():
+    """Start the scheduler once per process if any recurring reports are defined."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return _scheduler
+        try:
+            for definition in load_report_definitions():
+                _definitions.setdefault(definition.name, definition)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Could not load report schedule from {REPORT_SCHEDULE_FILE}: {str(e)}")
+        if not _definitions:
+            return None
+        if BackgroundScheduler is None:
+            logger.warning("APScheduler is not installed; scheduled report pre-generation is disabled")
+            return None
+
+        window_start, window_end = current_window(datetime.now())
+        _scheduler = BackgroundScheduler(
+            # One definition at a time; each run bounds its own concurrency
+            executors={"default": SchedulerExecutor(1)},
+            job_defaults={
+                "coalesce": True,
+                "max_instances": 1,
+                "misfire_grace_time": int((window_end - window_start).total_seconds()),
+            },
+        )
+        state = _load_state(get_report_storage())
+        now = datetime.now()
+        for definition in _definitions.values():
+            _schedule(definition, state, now)
+        _scheduler.start()
+        logger.info(f"Started report scheduler for {len(_definitions)} definitions in window {REPORT_PREGEN_WINDOW}")
+        return _scheduler
+
+
+def stop_report_scheduler() -> None:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.shutdown(wait=False)
+            _scheduler = None
+
+
+def get_report_scheduler_stats() -> Dict[str, Any]:
+    """Next and last run of each recurring report; other processes (e.g. the API) see the recorded runs."""
+    with _scheduler_lock:
+        if _scheduler is None:
+            return {"running": False, "last_runs": _load_state(get_report_storage())}
+        state = _load_state(get_report_storage())
+        definitions = {}
+        for name in _definitions:
+            job = _scheduler.get_job(f"report:{name}")
+            definitions[name] = {
+                "next_run": job.next_run_time.isoformat() if job and job.next_run_time else None,
+                "last_run": state.get(name),
+            }
+        return {"running": True, "window": REPORT_PREGEN_WINDOW, "definitions": definitions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate recurring reports in the off-peak window")
+    parser.add_argument("--run-now", metavar="NAME", help="Run one definition immediately, then exit")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(filename)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    if args.run_now:
+        definitions = {definition.name: definition for definition in load_report_definitions()}
+        if args.run_now not in definitions:
+            parser.error(f"No report definition named {args.run_now} in {REPORT_SCHEDULE_FILE}")
+        print(json.dumps(run_definition(definitions[args.run_now])))
+        return
+
+    if start_report_scheduler() is None:
+        # Nothing to schedule (or no APScheduler); exit cleanly so a restart policy does not loop
+        logger.info("No scheduled reports to run")
+        return
+    stopped = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopped.set())
+    stopped.wait()
+    stop_report_scheduler()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
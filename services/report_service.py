@@ -5,19 +5,36 @@ Centralizes all report-related functionality for creating, storing, and retrievi
 """
 import os
 import json
+import time
 import logging
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Any, Optional, Tuple, Union
 
-from data_access.main import get_nutrition_reference
-from services.aggregator import filter_transactions
+from data_access.main import (
+    get_cached_nutrition_reference,
+    get_database_time,
+    get_latest_transaction_created_at,
+    get_table_version,
+)
+from services.aggregator import filter_transactions, summarize_daily_rollups
+from services.allergens import find_allergen_exposures
+from services.compression import write_precompressed_sidecars
 from services.js_bridge_service import generate_html_file, generate_pdf
-from services.prompt import get_ai_analysis
+from services.report_storage import (
+    REPORTS_DIR,
+    add_report_metadata,
+    apply_html_policy,
+    get_report_storage,
+    load_patient_reports,
+    report_key,
+)
+from services.local_analysis import generate_local_analysis
+from services.prompt import AI_ANALYSIS_ERROR_RESPONSE, get_ai_analysis
+from services.shared_cache import get_cached_report_data
+from services.tracing import bind_context
 from utils.utils import calculate_age, convert_dates_to_strings
 
-# Define constants
-REPORTS_DIR = "reports"
-
 logger = logging.getLogger(__name__)
 
 # Report section options - used for customizing report content
@@ -31,6 +48,70 @@ REPORT_SECTIONS = {
     "ai_analysis": "AI Nutritional Analysis"
 }
 
+ANALYSIS_KEYS = ["SUMMARY", "ANALYSIS", "RECOMMENDATIONS", "HEALTH_INSIGHTS"]
+
+# Hours a stored report can be returned for an identical request (0 always regenerates)
+REPORT_REUSE_MAX_AGE_HOURS = float(os.environ.get("REPORT_REUSE_MAX_AGE_HOURS", "24"))
+# How long a report waits for the LLM before using the local analysis instead
+AI_ANALYSIS_DEADLINE_SECONDS = float(os.environ.get("AI_ANALYSIS_DEADLINE_SECONDS", "20"))
+_analysis_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("AI_ANALYSIS_WORKERS", "4")),
+    thread_name_prefix="ai-analysis"
+)
+
+def _ai_analysis_before(report_data: Dict[str, Any], deadline_at: float) -> str:
+    # The LLM call gets only the time the report still waits for, so an
+    # abandoned call does not hold an executor slot or spend tokens past it
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        return AI_ANALYSIS_ERROR_RESPONSE
+    return get_ai_analysis(report_data, deadline=remaining)
+
+def get_report_analysis(report_data: Dict[str, Any], mode: Union[bool, str] = True) -> Tuple[Dict[str, str], str]:
+    """
+    Get the analysis sections for a report.
+
+    The AI analysis is hedged by the local rule-based engine: if the LLM fails
+    or misses AI_ANALYSIS_DEADLINE_SECONDS, the local analysis is used so the
+    report never waits longer than the deadline.
+
+    Args:
+        report_data: Formatted report data
+        mode: "fast" for local analysis only, otherwise AI with local fallback
+
+    Returns:
+        Tuple of (analysis dictionary, source "ai" or "local")
+    """
+    if mode == "fast":
+        return generate_local_analysis(report_data), "local"
+
+    # Create a reduced context to minimize prompt size
+    reduced_patient_data = report_data.copy()
+    reduced_patient_data.pop("food_transactions", None)
+
+    # bind_context keeps the LLM span in the report's trace
+    deadline_at = time.monotonic() + AI_ANALYSIS_DEADLINE_SECONDS
+    future = _analysis_executor.submit(bind_context(_ai_analysis_before), reduced_patient_data, deadline_at)
+    try:
+        analysis_json = future.result(timeout=AI_ANALYSIS_DEADLINE_SECONDS)
+        logger.info(f"AI analysis response: {analysis_json}")
+        if analysis_json == AI_ANALYSIS_ERROR_RESPONSE:
+            raise RuntimeError("AI analysis returned an error response")
+
+        analysis_data = json.loads(analysis_json)
+        analysis = {key: analysis_data[key] for key in ANALYSIS_KEYS if key in analysis_data}
+        if not analysis.get("SUMMARY"):
+            raise ValueError("AI analysis has no SUMMARY")
+        return analysis, "ai"
+    except FutureTimeout:
+        # A call still queued is dropped; a running one ends at the same deadline
+        future.cancel()
+        logger.warning(f"AI analysis missed the {AI_ANALYSIS_DEADLINE_SECONDS}s deadline, using local analysis")
+    except Exception as analysis_error:
+        logger.error(f"Error generating AI analysis, using local analysis: {str(analysis_error)}")
+
+    return generate_local_analysis(report_data), "local"
+
 def ensure_reports_directory():
     """Ensure the reports directory exists."""
     try:
@@ -56,31 +137,27 @@ def get_report_filename(patient_id, report_type="nutrition", format="pdf"):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     return f"{patient_id}_{report_type}_{timestamp}.{format}"
 
-def store_report_metadata(patient_id, filename, report_type="nutrition", start_date=None, end_date=None, format="pdf"):
+def store_report_metadata(patient_id, filename, report_type="nutrition", start_date=None, end_date=None, format="pdf",
+                          sections=None, include_ai=None, analysis_source=None, data_read_at=None):
     """
     Store metadata about a generated report.
     
     Args:
         patient_id: ID of the patient
-        filename: Name of the report file
+        filename: Storage key of the report file
         report_type: Type of report
         start_date: Start date of report period
         end_date: End date of report period
         format: File format
+        sections: Sections requested for the report
+        include_ai: Analysis mode the report was generated with
+        analysis_source: Analysis actually used, "ai" or "local"
+        data_read_at: When the report's data was read from the database
         
     Returns:
         Report metadata dictionary
     """
     
-    metadata_file = os.path.join(REPORTS_DIR, "report_index.json")
-    
-    # Create or load the existing metadata index
-    if os.path.exists(metadata_file):
-        with open(metadata_file, "r") as f:
-            reports_index = json.load(f)
-    else:
-        reports_index = {"reports": []}
-
     # Create metadata for the new report
     report_metadata = {
         "patient_id": patient_id,
@@ -91,16 +168,16 @@ def store_report_metadata(patient_id, filename, report_type="nutrition", start_d
         "date_range": {
             "start": start_date,
             "end": end_date
-        }
+        },
+        "sections": sections,
+        "include_ai": include_ai,
+        "analysis_source": analysis_source,
+        "data_read_at": data_read_at.isoformat(timespec="seconds") if data_read_at else None
     }
     logger.info(f"Storing report metadata: {report_metadata}")
     
-    # Add to the index
-    reports_index["reports"].append(report_metadata)
-    
-    # Save the updated index
-    with open(metadata_file, "w") as f:
-        json.dump(reports_index, f, indent=2)
+    # Add to the patient's index
+    add_report_metadata(patient_id, report_metadata)
     
     return report_metadata
 
@@ -114,19 +191,7 @@ def get_reports_for_patient(patient_id):
     Returns:
         List of report metadata dictionaries
     """
-    metadata_file = os.path.join(REPORTS_DIR, "report_index.json")
-    
-    if not os.path.exists(metadata_file):
-        return []
-    
-    with open(metadata_file, "r") as f:
-        reports_index = json.load(f)
-    
-    # Filter reports for the specified patient
-    patient_reports = [
-        report for report in reports_index.get("reports", [])
-        if str(report.get("patient_id")) == str(patient_id)
-    ]
+    patient_reports = load_patient_reports(patient_id)
     
     # Sort by generated_at date (newest first)
     patient_reports.sort(
@@ -136,13 +201,114 @@ def get_reports_for_patient(patient_id):
     
     return patient_reports
 
+def _aware(value: datetime) -> datetime:
+    # Read times are taken from the database clock with a time zone; metadata stored
+    # before that has naive local times
+    return value if value.tzinfo else value.astimezone()
+
+
+def find_reusable_report(
+    patient_id,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    sections: Optional[List[str]] = None,
+    include_ai: Union[bool, str] = True
+) -> Optional[Dict[str, Any]]:
+    """
+    Find a stored PDF report that can be returned instead of generating a new one.
+
+    A report is reusable when it has the same date range, sections and analysis
+    mode, is at most REPORT_REUSE_MAX_AGE_HOURS old, its file still exists, and
+    neither transactions in its range nor any allergies (tracked per table in
+    table_versions) were written after its data was read. An AI request never
+    reuses a report that fell back to the local analysis.
+
+    Args:
+        patient_id: ID of the patient
+        start_date: Start date of the report period
+        end_date: End date of the report period
+        sections: Requested sections
+        include_ai: Requested analysis mode
+
+    Returns:
+        The newest reusable report's metadata, or None
+    """
+    if REPORT_REUSE_MAX_AGE_HOURS <= 0:
+        return None
+    oldest = datetime.now() - timedelta(hours=REPORT_REUSE_MAX_AGE_HOURS)
+    storage = get_report_storage()
+    candidates = [
+        report for report in get_reports_for_patient(patient_id)
+        if report.get("format") == "pdf"
+        and report.get("date_range") == {"start": start_date, "end": end_date}
+        and (report.get("sections") or None) == (sections or None)
+        and report.get("include_ai") == include_ai
+        and (include_ai is not True or report.get("analysis_source") == "ai")
+        and report.get("generated_at", "") >= oldest.strftime('%Y%m%d_%H%M%S')
+    ]
+    for report in candidates:  # newest first
+        if not storage.exists(report["filename"]):
+            continue
+        if report.get("data_read_at"):
+            data_read_at = datetime.fromisoformat(report["data_read_at"])
+        else:  # stored before the read time was recorded
+            data_read_at = datetime.strptime(report["generated_at"], '%Y%m%d_%H%M%S')
+        latest_write = get_latest_transaction_created_at(patient_id, start_date, end_date)
+        allergies_version = get_table_version("allergies")
+        if allergies_version is not None:
+            latest_write = max(filter(None, (latest_write, allergies_version[1])), key=_aware)
+        if latest_write is None or _aware(latest_write) < _aware(data_read_at):
+            return report
+        # Newer data makes every older candidate stale too
+        return None
+    return None
+
+def prepare_report_data(
+    patient_data: Dict[str, Any],
+    patient_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    include_ai: Union[bool, str] = True
+) -> Dict[str, Any]:
+    """
+    Build the data a report template is rendered with.
+
+    Args:
+        patient_data: Patient data dictionary
+        patient_id: ID of the patient
+        start_date: Start date for report period (format: YYYY-MM-DD)
+        end_date: End date for report period (format: YYYY-MM-DD)
+        include_ai: Analysis mode, as for generate_patient_report
+
+    Returns:
+        Formatted report data with its analysis and date range
+    """
+    # The same bundle (a patient viewed again) reuses its formatted data from the shared cache
+    data = get_cached_report_data(
+        patient_data, start_date, end_date, lambda: format_report_data(patient_data, start_date, end_date)
+    )
+
+    if include_ai:
+        logger.info(f"Generating analysis for patient {patient_id} (mode={include_ai})...")
+        data["ai_analysis"], data["analysis_source"] = get_report_analysis(data, include_ai)
+        logger.info(f"Patient data with {data['analysis_source']} analysis appended: {data}")
+
+    if 'date_range' not in data:
+        data['date_range'] = {}
+
+    # Store dates in the data
+    data['date_range']['start'] = start_date
+    data['date_range']['end'] = end_date
+    return data
+
 def generate_patient_report(
     patient_data: Dict[str, Any], 
     patient_id: Optional[str] = None, 
     start_date: Optional[str] = None, 
     end_date: Optional[str] = None,
     sections: Optional[List[str]] = None, 
-    include_ai: bool = True
+    include_ai: Union[bool, str] = True,
+    data_read_at: Optional[datetime] = None
 ) -> Dict[str, Any]:
     """
     Generate a PDF report for a patient.
@@ -153,57 +319,18 @@ def generate_patient_report(
         start_date: Start date for report period (format: YYYY-MM-DD)
         end_date: End date for report period (format: YYYY-MM-DD)
         sections: List of sections to include
-        include_ai: Whether to include AI analysis (default=True)
+        include_ai: True for AI analysis with a local fallback, "fast" for local
+            analysis only, False for none (default=True)
+        data_read_at: Database time patient_data was read at (default: the database
+            time now); transactions or allergies written later make the stored report stale
         
     Returns:
         Dictionary with report status and file information
     """
     logger = logging.getLogger(__name__)
+    data_read_at = data_read_at or get_database_time()
 
-    patient_data = format_report_data(patient_data, start_date, end_date)
-
-    # TODO: This shouldn't call another report generation function, it should only do the ai analysis and append the results to the existing patient data
-    if include_ai:
-        try:
-            logger.info(f"Generating AI analysis for patient {patient_id}...")
-            logger.info(f"Patient Data: {patient_data}")
-
-            # Create a reduced context to minimize prompt size
-            reduced_patient_data = patient_data.copy()
-            reduced_patient_data.pop("food_transactions", None)
-            logger.info(f"Reduced patient data for AI analysis: {reduced_patient_data}")
-
-            # Send reduced data to the AI
-            analysis_json = get_ai_analysis(reduced_patient_data)
-            logger.info(f"AI analysis response for patient {patient_id}: {analysis_json}")
-
-            analysis_data = json.loads(analysis_json)
-
-            # Merge analysis results into the original patient_data
-            patient_data["ai_analysis"] = {
-                key: analysis_data[key]
-                for key in ["SUMMARY", "ANALYSIS", "RECOMMENDATIONS", "HEALTH_INSIGHTS"]
-                if key in analysis_data
-            }
-
-            logger.info(f"Patient data with AI analysis appended: {patient_data}")
-        except Exception as analysis_error:
-            logger.error(f"Error generating AI analysis: {str(analysis_error)}")
-            patient_data['ai_analysis'] = {
-                "SUMMARY": "AI analysis could not be generated at this time.",
-                "ANALYSIS": "",
-                "RECOMMENDATIONS": "",
-                "HEALTH_INSIGHTS": ""
-            }
-
-    data = patient_data
-
-    if 'date_range' not in data:
-        data['date_range'] = {}
-    
-    # Store dates in the data
-    data['date_range']['start'] = start_date
-    data['date_range']['end'] = end_date
+    data = prepare_report_data(patient_data, patient_id, start_date, end_date, include_ai)
     
     # Generate filename
     if patient_id:
@@ -211,9 +338,12 @@ def generate_patient_report(
     else:
         filename = f"nutrition_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
     
-    # Set up file paths
-    pdf_path = os.path.join(REPORTS_DIR, filename)
-    html_path = os.path.join(REPORTS_DIR, f"{os.path.splitext(filename)[0]}.html")
+    # Set up storage keys and the local paths the renderer writes to
+    storage = get_report_storage()
+    pdf_key = report_key(patient_id, filename)
+    html_key = f"{os.path.splitext(pdf_key)[0]}.html"
+    pdf_path = storage.path_for_write(pdf_key)
+    html_path = storage.path_for_write(html_key)
     
     try:
         # Generate HTML version
@@ -229,35 +359,51 @@ def generate_patient_report(
             template_path=template_path
         )
         logger.info(f"HTML report created at {html_path}")
+
+        # Precompress once here so serve_report never compresses on the fly
+        try:
+            write_precompressed_sidecars(html_path)
+        except OSError as sidecar_error:
+            logger.warning(f"Could not precompress HTML report: {str(sidecar_error)}")
         
         # Generate PDF
         logger.info("Generating PDF")
         generate_pdf(html_path)
         
         logger.info(f"PDF created at {pdf_path}")
+        storage.commit(pdf_key)
+        storage.commit(html_key)
+        # The HTML was only needed as renderer input
+        apply_html_policy(html_key)
 
         # Store metadata
         if patient_id:
             logger.info("Storing report metadata")
-            logger.info(f"Storing report metadata with inputs: patient_id={patient_id}, filename={filename}, report_type='nutrition', start_date={start_date}, end_date={end_date}, format='pdf'")
+            logger.info(f"Storing report metadata with inputs: patient_id={patient_id}, filename={pdf_key}, report_type='nutrition', start_date={start_date}, end_date={end_date}, format='pdf'")
             metadata = store_report_metadata(
                 patient_id, 
-                filename, 
+                pdf_key, 
                 "nutrition", 
                 start_date, 
                 end_date,
-                format="pdf"
+                format="pdf",
+                sections=sections,
+                include_ai=include_ai,
+                analysis_source=data.get("analysis_source"),
+                data_read_at=data_read_at
             )
             logger.info(f"Metadata stored successfully: {metadata}")
 
         # # Return response
         response = {
             "status": "Report generated",
-            "file": filename,
+            "file": pdf_key,
             "path": pdf_path,
-            "html_path": html_path,
+            # None once REPORT_HTML_POLICY has removed it (compress keeps only the sidecars)
+            "html_path": html_path if storage.exists(html_key) else None,
             "format": "pdf",
             "sections_included": sections,
+            "analysis_source": data.get("analysis_source"),
         }
 
         logger.info(f"Returning response: {response}")
@@ -271,11 +417,13 @@ def generate_patient_report(
         if os.path.exists(html_path):
             logger.info(f"PDF generation failed but HTML was created at {html_path}")
             
+            storage.commit(html_key)
+
             # Store metadata for HTML report
             if patient_id:
                 metadata = store_report_metadata(
                     patient_id, 
-                    os.path.basename(html_path), 
+                    html_key, 
                     "nutrition", 
                     start_date, 
                     end_date,
@@ -284,7 +432,7 @@ def generate_patient_report(
             
             return {
                 "status": "HTML report generated (PDF failed)",
-                "file": os.path.basename(html_path),
+                "file": html_key,
                 "path": html_path,
                 "format": "html",
                 "sections_included": sections,
@@ -322,7 +470,7 @@ def format_report_data(patient_data: Dict[str, Any], start_date: Optional[str] =
     logger.info(f"Found {len(transactions)} transactions for patient: {patient_id}")
     
     # Get all nutrition references for easier lookup
-    nutrition_refs = get_nutrition_reference()
+    nutrition_refs = get_cached_nutrition_reference()
     
     # Create a lookup dictionary with proper type conversion for IDs
     nutrition_ref_dict = {}
@@ -336,13 +484,22 @@ def format_report_data(patient_data: Dict[str, Any], start_date: Optional[str] =
     # logger.info(f"Nutrition ref dict {nutrition_ref_dict}")
 
     transactions = filter_transactions(transactions, start_date, end_date)
-    
+
+    # Servings per food per day, preferring the rows grouped in the database
+    # (O(foods x days)) over walking every transaction (O(transactions))
+    daily_food_items = patient_data.get('daily_food_items')
+    if daily_food_items is not None:
+        food_rows = filter_transactions(daily_food_items, start_date, end_date)
+    else:
+        food_rows = transactions
+
     # Compute total calories and servings
     total_calories = 0
+    total_entries = 0
     food_items = []
     
-    for transaction in transactions:
-        # Try to get nutritional info for this transaction
+    for transaction in food_rows:
+        # Try to get nutritional info for this food and day
         try:
             ref_id = int(transaction.get('nutrition_ref_id', 0))
             nutrition_info = nutrition_ref_dict.get(ref_id, {})
@@ -350,11 +507,12 @@ def format_report_data(patient_data: Dict[str, Any], start_date: Optional[str] =
             logger.info(nutrition_info)
             
             food_name = nutrition_info.get('food_name', 'Unknown item')
-            serving_count = float(transaction.get('serving_count', 1))
+            serving_count = float(transaction.get('servings', transaction.get('serving_count', 1)))
             calories_per_serving = float(nutrition_info.get('calories', 0))
             
             transaction_calories = calories_per_serving * serving_count
             total_calories += transaction_calories
+            total_entries += int(transaction.get('entries', 1))
             
             # Add to food items list
             food_items.append({
@@ -367,22 +525,35 @@ def format_report_data(patient_data: Dict[str, Any], start_date: Optional[str] =
             logger.error(f"Error processing transaction nutritional data: {e}")
             continue
     
-    # Calculate macronutrient targets and actuals
-    carbs_actual = 0
-    protein_actual = 0
-    fat_actual = 0
-    fiber_actual = 0
-
-    for t in transactions:
-        if 'nutrition_ref_id' in t:
-            ref_id = int(t.get('nutrition_ref_id', 0))
-            nutrition_info = nutrition_ref_dict.get(ref_id, {})
-            serving_count = float(t.get('serving_count', 1))
+    # Calculate macronutrient actuals, preferring the pre-aggregated daily
+    # rollups (O(days)) over re-joining every transaction (O(transactions))
+    rollups = patient_data.get('daily_nutrient_rollups')
+    if rollups is not None:
+        totals = summarize_daily_rollups(rollups, start_date, end_date)
+        total_calories = totals['calories']
+        carbs_actual = totals['carbs']
+        protein_actual = totals['protein']
+        fat_actual = totals['fat']
+        fiber_actual = totals['fiber']
+        sodium_actual = totals['sodium']
+    else:
+        carbs_actual = 0
+        protein_actual = 0
+        fat_actual = 0
+        fiber_actual = 0
+        sodium_actual = 0
 
-            carbs_actual += float(nutrition_info.get('carbs_g', 0)) * serving_count
-            protein_actual += float(nutrition_info.get('protein_g', 0)) * serving_count
-            fat_actual += float(nutrition_info.get('fat_g', 0)) * serving_count
-            fiber_actual += float(nutrition_info.get('fiber_g', 0)) * serving_count
+        for t in food_rows:
+            if 'nutrition_ref_id' in t:
+                ref_id = int(t.get('nutrition_ref_id', 0))
+                nutrition_info = nutrition_ref_dict.get(ref_id, {})
+                serving_count = float(t.get('servings', t.get('serving_count', 1)))
+
+                carbs_actual += float(nutrition_info.get('carbs_g', 0)) * serving_count
+                protein_actual += float(nutrition_info.get('protein_g', 0)) * serving_count
+                fat_actual += float(nutrition_info.get('fat_g', 0)) * serving_count
+                fiber_actual += float(nutrition_info.get('fiber_g', 0)) * serving_count
+                sodium_actual += float(nutrition_info.get('sodium_mg') or 0) * serving_count
     
     # Default targets - these would normally come from a patient's profile
     calorie_target = 2000  # Default value
@@ -390,6 +561,7 @@ def format_report_data(patient_data: Dict[str, Any], start_date: Optional[str] =
     protein_target = 50    # Default value
     fat_target = 70        # Default value
     fiber_target = 25      # Default value
+    sodium_target = 2300   # Default value
     
     # Format the dashboard data
     report_data = {
@@ -419,12 +591,17 @@ def format_report_data(patient_data: Dict[str, Any], start_date: Optional[str] =
             'fiber': {
                 'actual': fiber_actual,
                 'target': fiber_target
+            },
+            'sodium': {
+                'actual': sodium_actual,
+                'target': sodium_target
             }
         },
         'food_items': food_items,
+        'allergen_exposures': find_allergen_exposures(transactions, patient_data.get('allergies', [])),
         'summary': {
             'total_calories': total_calories,
-            'total_items_consumed': len(food_items),
+            'total_items_consumed': total_entries,
             'date_range': {
                 'start': start_date or '',
                 'end': end_date or ''
@@ -0,0 +1,399 @@
+"""
+Report storage module
+
+Storage layer for generated report artifacts. Reports are sharded by patient id
+and month, each patient has its own metadata index, and a background compaction
+job applies retention policies and keeps the indexes consistent with the files
+that actually exist.
+
+Backends are pluggable through STORAGE_BACKENDS; only the local filesystem is
+implemented here.
+"""
+import os
+import json
+import fcntl
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Any
+
+from services.compression import SIDECAR_EXTENSIONS, compress_bytes, supported_encodings
+
+logger = logging.getLogger(__name__)
+
+# Resolved from the package, not the working directory, so the API, the
+# scheduler process and the CLIs all use the same tree
+REPORTS_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reports"))
+LEGACY_INDEX_KEY = "report_index.json"
+INDEX_FILENAME = "index.json"
+PATIENT_SHARDS = 1000
+
+# Days to keep reports before compaction deletes them; 0 keeps them forever
+REPORT_RETENTION_DAYS = int(os.environ.get("REPORT_RETENTION_DAYS", "0"))
+# What to do with the intermediate HTML once the PDF exists: keep, compress or delete
+REPORT_HTML_POLICY = os.environ.get("REPORT_HTML_POLICY", "compress")
+# Seconds between background compaction runs; 0 disables the worker
+REPORT_COMPACTION_INTERVAL = int(os.environ.get("REPORT_COMPACTION_INTERVAL", "3600"))
+
+HTML_POLICIES = ("keep", "compress", "delete")
+
+
+class ReportStorageBackend(ABC):
+    """
+    Interface for report artifact storage.
+
+    Keys are '/'-separated relative paths. Writers ask for a local path with
+    path_for_write(), produce the file there (the Node renderer needs a real
+    file), then call commit() so remote backends can upload it.
+    """
+
+    @abstractmethod
+    def path_for_write(self, key: str) -> str:
+        """Local path the object is written to before commit()."""
+
+    @abstractmethod
+    def commit(self, key: str) -> None:
+        """Make an object written at path_for_write(key) durable."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of a stored object, or None if the backend is remote."""
+        return None
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether an object is stored under key."""
+
+    @abstractmethod
+    def read_bytes(self, key: str) -> bytes:
+        """Contents of a stored object."""
+
+    @abstractmethod
+    def write_bytes(self, key: str, data: bytes) -> None:
+        """Store an object atomically, replacing any existing one."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove an object; a missing key is not an error."""
+
+    @abstractmethod
+    def move(self, key: str, new_key: str) -> None:
+        """Store an object under new_key and remove it from key."""
+
+    @abstractmethod
+    def list_keys(self, prefix: str = "") -> Iterator[str]:
+        """Keys of the stored objects under prefix."""
+
+    @abstractmethod
+    def lock(self, name: str):
+        """Context manager holding a named lock across every process sharing the store."""
+
+
+class LocalReportStorage(ReportStorageBackend):
+    """Report storage on the local filesystem rooted at a directory."""
+
+    def __init__(self, root: str = REPORTS_DIR):
+        self.root = root
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._thread_locks_guard = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        root = os.path.abspath(self.root)
+        path = os.path.normpath(os.path.join(root, *key.split("/")))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def path_for_write(self, key: str) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def commit(self, key: str) -> None:
+        # Files are written in place, nothing to upload
+        pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def read_bytes(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def write_bytes(self, key: str, data: bytes) -> None:
+        path = self.path_for_write(key)
+        # Write to a temp file and rename so readers never see a partial index
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _prune(self, directory: str) -> None:
+        # Remove empty shard directories up to the root
+        root = os.path.abspath(self.root)
+        while directory != root and os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+
+    def delete(self, key: str) -> None:
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+        self._prune(os.path.dirname(path))
+
+    def move(self, key: str, new_key: str) -> None:
+        path = self._path(key)
+        os.replace(path, self.path_for_write(new_key))
+        self._prune(os.path.dirname(path))
+
+    def list_keys(self, prefix: str = "") -> Iterator[str]:
+        base = self._path(prefix) if prefix else self.root
+        if not os.path.isdir(base):
+            return
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                if filename.startswith(".tmp_") or filename.startswith(".lock_"):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                yield rel.replace(os.sep, "/")
+
+    @contextmanager
+    def lock(self, name: str):
+        """Lock shared by threads in this process and, via flock, other workers."""
+        with self._thread_locks_guard:
+            thread_lock = self._thread_locks.setdefault(name, threading.Lock())
+        os.makedirs(self.root, exist_ok=True)
+        with thread_lock:
+            with open(os.path.join(self.root, f".lock_{name.replace('/', '_')}"), "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Backend registry; an S3-compatible backend can be added here later
+STORAGE_BACKENDS = {
+    "local": LocalReportStorage,
+}
+
+_storage: Optional[ReportStorageBackend] = None
+
+
+def get_report_storage() -> ReportStorageBackend:
+    """Return the configured storage backend (REPORT_STORAGE_BACKEND, default 'local')."""
+    global _storage
+    if _storage is None:
+        backend_name = os.environ.get("REPORT_STORAGE_BACKEND", "local")
+        if backend_name not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown report storage backend: {backend_name}")
+        _storage = STORAGE_BACKENDS[backend_name]()
+        logger.info(f"Using report storage backend: {backend_name}")
+    return _storage
+
+
+def patient_prefix(patient_id) -> str:
+    """Shard prefix for a patient, e.g. '042/42'."""
+    try:
+        shard = f"{int(patient_id) % PATIENT_SHARDS:03d}"
+    except (ValueError, TypeError):
+        shard = "other"
+    return f"{shard}/{patient_id}"
+
+
+def report_key(patient_id, filename: str, generated_at: Optional[datetime] = None) -> str:
+    """Storage key for a report file, sharded by patient and month."""
+    generated_at = generated_at or datetime.now()
+    return f"{patient_prefix(patient_id)}/{generated_at.strftime('%Y-%m')}/{filename}"
+
+
+def index_key(patient_id) -> str:
+    return f"{patient_prefix(patient_id)}/{INDEX_FILENAME}"
+
+
+def _load_index(storage: ReportStorageBackend, key: str) -> Dict[str, Any]:
+    if not storage.exists(key):
+        return {"reports": []}
+    return json.loads(storage.read_bytes(key))
+
+
+def _save_index(storage: ReportStorageBackend, key: str, reports_index: Dict[str, Any]) -> None:
+    storage.write_bytes(key, json.dumps(reports_index, indent=2).encode("utf-8"))
+
+
+def add_report_metadata(patient_id, report_metadata: Dict[str, Any]) -> None:
+    """Append a report's metadata to its patient's index."""
+    storage = get_report_storage()
+    key = index_key(patient_id)
+    with storage.lock(key):
+        reports_index = _load_index(storage, key)
+        reports_index["reports"].append(report_metadata)
+        _save_index(storage, key, reports_index)
+
+
+def load_patient_reports(patient_id) -> List[Dict[str, Any]]:
+    """All report metadata for a patient, including entries not yet migrated from the legacy index."""
+    storage = get_report_storage()
+    reports = list(_load_index(storage, index_key(patient_id)).get("reports", []))
+    reports.extend(
+        report for report in _load_index(storage, LEGACY_INDEX_KEY).get("reports", [])
+        if str(report.get("patient_id")) == str(patient_id)
+    )
+    return reports
+
+
+def apply_html_policy(html_key: str, policy: str = None) -> None:
+    """
+    Handle the intermediate HTML once the PDF has been produced.
+
+    'keep' leaves it alone, 'compress' keeps only the precompressed sidecars
+    (which serve_report can still deliver), 'delete' removes it and its sidecars.
+    """
+    policy = policy or REPORT_HTML_POLICY
+    if policy not in HTML_POLICIES:
+        logger.warning(f"Unknown REPORT_HTML_POLICY '{policy}', keeping HTML")
+        return
+    if policy == "keep":
+        return
+
+    storage = get_report_storage()
+    if policy == "compress":
+        if storage.exists(html_key) and not storage.exists(html_key + SIDECAR_EXTENSIONS["gzip"]):
+            html = storage.read_bytes(html_key)
+            for encoding in supported_encodings():
+                storage.write_bytes(html_key + SIDECAR_EXTENSIONS[encoding], compress_bytes(html, encoding, sidecar=True))
+        storage.delete(html_key)
+    else:
+        storage.delete(html_key)
+        for extension in SIDECAR_EXTENSIONS.values():
+            storage.delete(html_key + extension)
+
+
+def _artifact_keys(key: str) -> List[str]:
+    """A report's file plus its HTML counterpart and sidecars."""
+    base = os.path.splitext(key)[0]
+    keys = [key, base + ".pdf", base + ".html"]
+    keys.extend(base + ".html" + extension for extension in SIDECAR_EXTENSIONS.values())
+    return list(dict.fromkeys(keys))
+
+
+def _parse_generated_at(value: str) -> Optional[datetime]:
+    """Parse generated_at, which is '%Y%m%d_%H%M%S' for new reports and ISO for legacy ones."""
+    try:
+        return datetime.strptime(value, "%Y%m%d_%H%M%S")
+    except (ValueError, TypeError):
+        pass
+    try:
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _report_available(storage: ReportStorageBackend, key: str) -> bool:
+    """A report is still servable if its file or its gzip sidecar exists."""
+    return storage.exists(key) or storage.exists(key + SIDECAR_EXTENSIONS["gzip"])
+
+
+def _migrate_legacy_index(storage: ReportStorageBackend) -> int:
+    """Move flat reports listed in the legacy global index into the sharded layout."""
+    if not storage.exists(LEGACY_INDEX_KEY):
+        return 0
+
+    migrated = 0
+    with storage.lock(LEGACY_INDEX_KEY):
+        legacy_index = _load_index(storage, LEGACY_INDEX_KEY)
+        for report in legacy_index.get("reports", []):
+            patient_id = report.get("patient_id")
+            old_key = report.get("filename", "")
+            if not old_key or not _report_available(storage, old_key):
+                continue
+            generated_at = _parse_generated_at(report.get("generated_at", "")) or datetime.now()
+            new_key = report_key(patient_id, os.path.basename(old_key), generated_at)
+            for old_artifact, new_artifact in zip(_artifact_keys(old_key), _artifact_keys(new_key)):
+                if storage.exists(old_artifact):
+                    storage.move(old_artifact, new_artifact)
+            add_report_metadata(patient_id, dict(report, filename=new_key))
+            migrated += 1
+        _save_index(storage, LEGACY_INDEX_KEY, {"reports": []})
+    return migrated
+
+
+def compact_reports(now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Apply retention and HTML policies and reconcile indexes with stored files.
+
+    Returns:
+        Counts of migrated, expired and dropped (missing file) index entries
+    """
+    storage = get_report_storage()
+    now = now or datetime.now()
+    cutoff = now - timedelta(days=REPORT_RETENTION_DAYS) if REPORT_RETENTION_DAYS > 0 else None
+    stats = {"migrated": _migrate_legacy_index(storage), "expired": 0, "dropped": 0}
+
+    index_keys = [key for key in storage.list_keys() if key.endswith("/" + INDEX_FILENAME)]
+    for key in index_keys:
+        with storage.lock(key):
+            reports_index = _load_index(storage, key)
+            kept = []
+            for report in reports_index.get("reports", []):
+                filename = report.get("filename", "")
+                generated_at = _parse_generated_at(report.get("generated_at", ""))
+                if cutoff and generated_at and generated_at < cutoff:
+                    for artifact in _artifact_keys(filename):
+                        storage.delete(artifact)
+                    stats["expired"] += 1
+                    continue
+                if not _report_available(storage, filename):
+                    stats["dropped"] += 1
+                    continue
+                if report.get("format") == "pdf":
+                    html_key = os.path.splitext(filename)[0] + ".html"
+                    if storage.exists(html_key):
+                        apply_html_policy(html_key)
+                kept.append(report)
+            if kept:
+                _save_index(storage, key, {"reports": kept})
+            else:
+                storage.delete(key)
+
+    logger.info(f"Report compaction finished: {stats}")
+    return stats
+
+
+_compaction_thread: Optional[threading.Thread] = None
+_compaction_stop = threading.Event()
+
+
+def start_compaction_worker(interval: int = None) -> Optional[threading.Thread]:
+    """Start the background compaction thread once per process."""
+    global _compaction_thread
+    interval = REPORT_COMPACTION_INTERVAL if interval is None else interval
+    if interval <= 0 or (_compaction_thread and _compaction_thread.is_alive()):
+        return _compaction_thread
+
+    def run():
+        while not _compaction_stop.wait(interval):
+            try:
+                compact_reports()
+            except Exception as e:
+                logger.error(f"Report compaction failed: {str(e)}")
+
+    _compaction_stop.clear()
+    _compaction_thread = threading.Thread(target=run, name="report-compaction", daemon=True)
+    _compaction_thread.start()
+    logger.info(f"Started report compaction worker (every {interval}s)")
+    return _compaction_thread
+
+
+def stop_compaction_worker() -> None:
+    _compaction_stop.set()
@@ -0,0 +1,330 @@
+"""
+Shared cache module
+
+A cache tier shared by every worker process. It holds patient data bundles
+(collect_reporting_data results) and formatted report data, so a patient
+viewed repeatedly is read from Postgres once rather than once per worker and
+again after every restart.
+
+Backends:
+- Redis, or any server that speaks the Redis protocol, at REDIS_URL.
+- An in-process stand-in with the same interface when REDIS_URL is not set.
+
+Values are msgpack (or JSON when msgpack is not installed), zlib-compressed
+above CACHE_COMPRESS_MIN_BYTES, and stored with per-kind TTLs.
+
+Keys carry CACHE_SCHEMA_VERSION and, for bundles, a per-patient generation.
+Changing a patient's data increments the generation (write-through
+invalidation), which retires every cached bundle of that patient in all
+processes at once. Formatted report data is keyed by a digest of the bundle
+it was built from, so it follows the bundle without separate invalidation.
+
+Cache errors never fail a request; the value is computed as if it missed.
+"""
+import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # JSON is used instead
+    msgpack = None
+
+try:
+    import redis
+except ImportError:  # only needed with REDIS_URL
+    redis = None
+
+from data_access.main import get_database_time
+from services.aggregator import collect_reporting_data
+from services.invalidation import subscribe
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.environ.get("REDIS_URL", "")
+CACHE_NAMESPACE = os.environ.get("CACHE_NAMESPACE", "cw")
+# Bump when the shape of cached values changes, so old entries are never read
+CACHE_SCHEMA_VERSION = 4
+CACHE_SOCKET_TIMEOUT_SECONDS = float(os.environ.get("CACHE_SOCKET_TIMEOUT_SECONDS", "0.25"))
+CACHE_COMPRESS_MIN_BYTES = int(os.environ.get("CACHE_COMPRESS_MIN_BYTES", "1024"))
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get("CACHE_LOCAL_MAX_ENTRIES", "1024"))
+# Bounds staleness from writes made outside the API, and from nutrition reference changes
+PATIENT_BUNDLE_TTL_SECONDS = int(os.environ.get("PATIENT_BUNDLE_TTL_SECONDS", "600"))
+REPORT_DATA_TTL_SECONDS = int(os.environ.get("REPORT_DATA_TTL_SECONDS", "600"))
+
+# First byte of a stored value: serializer, upper case when zlib-compressed
+_MSGPACK, _JSON = b"m", b"j"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+
+def encode(value: Any) -> bytes:
+    """Serialize a value to the compact stored form."""
+    if msgpack is not None:
+        tag, payload = _MSGPACK, msgpack.packb(value, default=_default, use_bin_type=True)
+    else:
+        tag, payload = _JSON, json.dumps(value, default=_default, separators=(",", ":")).encode("utf-8")
+    if len(payload) >= CACHE_COMPRESS_MIN_BYTES:
+        return tag.upper() + zlib.compress(payload, 1)
+    return tag + payload
+
+
+def decode(data: bytes) -> Any:
+    """Inverse of encode; values written by either serializer can be read."""
+    tag, payload = data[:1], data[1:]
+    if tag.isupper():
+        tag, payload = tag.lower(), zlib.decompress(payload)
+    if tag == _MSGPACK:
+        if msgpack is None:
+            raise ValueError("Cached value needs msgpack")
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload)
+
+
+def digest(value: Any) -> str:
+    """Short content digest of a value, for content-addressed keys."""
+    return hashlib.blake2b(encode(value), digest_size=16).hexdigest()
+
+
+class LocalCacheBackend:
+    """In-process stand-in for Redis: bounded, least recently used first out, with expiry."""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._entries.get(key, (b"0", None))[0]) + 1
+            self._entries[key] = (str(value).encode(), None)
+            return value
+
+
+class RedisCacheBackend:
+    """The same interface over a Redis-protocol server."""
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(
+            url,
+            socket_timeout=CACHE_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=CACHE_SOCKET_TIMEOUT_SECONDS,
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        self.client.set(key, value, ex=ttl or None)
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(key)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "sets": 0, "errors": 0, "invalidations": 0, "bytes_written": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def get_cache_backend():
+    """The process-wide backend: Redis at REDIS_URL, otherwise the local stand-in."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if REDIS_URL and redis is not None:
+                _backend = RedisCacheBackend(REDIS_URL)
+            else:
+                if REDIS_URL:
+                    logger.warning("REDIS_URL is set but the redis package is not installed; using the local cache")
+                _backend = LocalCacheBackend()
+        return _backend
+
+
+def set_cache_backend(backend) -> None:
+    """Replace the backend (e.g. with a fresh LocalCacheBackend)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def cache_key(*parts: Any) -> str:
+    return ":".join([CACHE_NAMESPACE, f"v{CACHE_SCHEMA_VERSION}"] + ["" if p is None else str(p) for p in parts])
+
+
+def get_or_compute(key: str, compute: Callable[[], Any], ttl: int) -> Any:
+    """
+    Return the cached value for key, computing and storing it on a miss.
+
+    Args:
+        key: Full cache key (see cache_key)
+        compute: Produces the value on a miss
+        ttl: Seconds the stored value lives
+
+    Returns:
+        The cached or computed value; cached values are fresh copies
+    """
+    backend = get_cache_backend()
+    try:
+        data = backend.get(key)
+        if data is not None:
+            _count("hits")
+            return decode(data)
+    except Exception as e:
+        _count("errors")
+        logger.warning(f"Shared cache read failed for {key}: {str(e)}")
+    _count("misses")
+
+    value = compute()
+    try:
+        data = encode(value)
+        backend.set(key, data, ttl)
+        _count("sets")
+        _count("bytes_written", len(data))
+    except Exception as e:
+        _count("errors")
+        logger.warning(f"Shared cache write failed for {key}: {str(e)}")
+    return value
+
+
+def _patient_generation(patient_id) -> int:
+    try:
+        data = get_cache_backend().get(cache_key("patient", patient_id, "generation"))
+    except Exception as e:
+        _count("errors")
+        logger.warning(f"Shared cache generation read failed for patient {patient_id}: {str(e)}")
+        return -1
+    return int(data) if data is not None else 0
+
+
+def _read_bundle(patient_id, start_date: Optional[str], end_date: Optional[str]) -> Dict[str, Any]:
+    # Stamped before the read, so a write during it counts as newer than the data. The
+    # database clock, not ours: it is compared with created_at values Postgres wrote
+    read_at = get_database_time().isoformat()
+    return {"read_at": read_at, "bundle": collect_reporting_data(patient_id, start_date, end_date)}
+
+
+def get_patient_bundle_with_read_time(
+    patient_id, start_date: Optional[str] = None, end_date: Optional[str] = None
+) -> Tuple[Dict[str, Any], datetime]:
+    """
+    collect_reporting_data through the shared cache, with the time the data was read from Postgres.
+
+    Args:
+        patient_id: ID of the patient
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        Tuple of (patient data dictionary, database time its read started, timezone-aware);
+        a cached bundle keeps the time of its original read
+    """
+    generation = _patient_generation(patient_id)
+    if generation < 0:  # the cache is unreachable
+        entry = _read_bundle(patient_id, start_date, end_date)
+    else:
+        # The generation is read before the data, so a concurrent change can only
+        # leave a stale bundle under a generation that is already retired
+        key = cache_key("patient", patient_id, f"g{generation}", "bundle", start_date, end_date)
+        entry = get_or_compute(
+            key, lambda: _read_bundle(patient_id, start_date, end_date), PATIENT_BUNDLE_TTL_SECONDS
+        )
+    return entry["bundle"], datetime.fromisoformat(entry["read_at"])
+
+
+def get_patient_bundle(patient_id, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Any]:
+    """
+    collect_reporting_data through the shared cache.
+
+    Args:
+        patient_id: ID of the patient
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        Patient data dictionary
+    """
+    return get_patient_bundle_with_read_time(patient_id, start_date, end_date)[0]
+
+
+def get_cached_report_data(
+    patient_data: Dict[str, Any], start_date: Optional[str], end_date: Optional[str], compute: Callable[[], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Formatted report data for a bundle, keyed by the bundle's content.
+
+    Args:
+        patient_data: The bundle being formatted
+        start_date: Report start date
+        end_date: Report end date
+        compute: Formats the bundle on a miss
+
+    Returns:
+        Formatted report data
+    """
+    key = cache_key("report_data", digest(patient_data), start_date, end_date)
+    return get_or_compute(key, compute, REPORT_DATA_TTL_SECONDS)
+
+
+def invalidate_patient(patient_id) -> None:
+    """Retire every cached bundle of a patient, in every process; call after writing their data."""
+    try:
+        get_cache_backend().incr(cache_key("patient", patient_id, "generation"))
+        _count("invalidations")
+    except Exception as e:
+        _count("errors")
+        logger.error(f"Shared cache invalidation failed for patient {patient_id}: {str(e)}")
+
+
+def _on_transactions_changed(changes: Dict[int, Any]) -> None:
+    for patient_id in changes:
+        invalidate_patient(patient_id)
+
+
+def get_shared_cache_stats() -> Dict[str, Any]:
+    """Hit, miss, error and invalidation counters of this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["backend"] = "redis" if isinstance(_backend, RedisCacheBackend) else "local"
+    stats["serializer"] = "msgpack" if msgpack is not None else "json"
+    return stats
+
+
+subscribe(_on_transactions_changed)
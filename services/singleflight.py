@@ -0,0 +1,111 @@
+"""
+Singleflight module
+
+Coalesces concurrent identical requests: while a computation for a key is in
+flight, other callers with the same key wait for it and share its result or
+error instead of running their own copy. A waiter gives up after
+SINGLEFLIGHT_WAIT_TIMEOUT seconds, so a hung computation does not hold every
+request for its key forever.
+"""
+import os
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds a caller waits for another caller's in-flight computation
+SINGLEFLIGHT_WAIT_TIMEOUT = float(os.environ.get("SINGLEFLIGHT_WAIT_TIMEOUT", "300"))
+
+
+class _Call:
+    """An in-flight computation shared by the callers of one key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """A named group of coalesced computations with deduplication counters."""
+
+    def __init__(self, name: str, wait_timeout: Optional[float] = None):
+        self.name = name
+        self.wait_timeout = SINGLEFLIGHT_WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {"calls": 0, "executions": 0, "deduplicated": 0, "errors": 0, "timeouts": 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) unless a call with the same key is already running.
+
+        Args:
+            key: Hashable identity of the computation
+            fn: Function to run
+
+        Returns:
+            The result of the shared computation (re-raises its error)
+
+        Raises:
+            TimeoutError: If another caller's computation did not finish within wait_timeout
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executions"] += 1
+            else:
+                call.waiters += 1
+                self._stats["deduplicated"] += 1
+
+        if not leader:
+            logger.info(f"Singleflight '{self.name}': joining in-flight call for {key}")
+            if not call.done.wait(self.wait_timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise TimeoutError(f"Timed out after {self.wait_timeout}s waiting for the in-flight call for {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_singleflight(name: str) -> SingleFlight:
+    """Return the process-wide group with this name, creating it on first use."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def get_singleflight_stats() -> Dict[str, Dict[str, int]]:
+    """Deduplication counters for every group."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
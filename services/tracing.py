@@ -0,0 +1,265 @@
+"""
+Tracing module
+
+OpenTelemetry spans along a request's path:
+- a server span per Flask request, continuing an incoming traceparent
+- a span per Postgres connect and query
+- a span per LLM chat completion
+- a span per Node PDF render
+
+The render span's context reaches the Node process through the TRACEPARENT
+environment variable. convert-to-pdf.js reports its browser launch, page
+load, chart render and page.pdf phases on stdout, and those phases are
+recorded as child spans. Spans are exported over OTLP to
+OTEL_EXPORTER_OTLP_ENDPOINT (e.g. http://localhost:4318 for a local
+collector), and each response carries its X-Trace-Id.
+
+Tracing is off unless the endpoint is set and opentelemetry-sdk and
+opentelemetry-exporter-otlp-proto-http are installed. When off, span() costs
+one flag check.
+"""
+import os
+import json
+import logging
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import psycopg2
+import psycopg2.extensions
+from flask import Flask, g, request
+
+try:
+    from opentelemetry import context as otel_context, propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:  # tracing is optional
+    trace = None
+
+from data_access.main import set_connection_factory
+
+logger = logging.getLogger(__name__)
+
+OTEL_EXPORTER_OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "cardwatch-api")
+# Longer statements are truncated in the db.statement attribute; parameters are never recorded
+MAX_STATEMENT_LENGTH = 2000
+# Prefix of the stdout lines in which the Node renderer reports its phases
+NODE_SPAN_PREFIX = "TRACE_SPAN "
+
+_enabled = False
+_provider = None
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes) -> Iterator[Optional[Any]]:
+    """
+    Run the block in a child span of the current one.
+
+    Args:
+        name: Span name
+        kind: "internal", "client" or "server"
+        **attributes: Span attributes; None values are skipped
+
+    Yields:
+        The span, or None while tracing is off
+    """
+    if not _enabled:
+        yield None
+        return
+    tracer = trace.get_tracer(__name__)
+    with tracer.start_as_current_span(
+        name,
+        kind=getattr(SpanKind, kind.upper()),
+        attributes={key: value for key, value in attributes.items() if value is not None},
+    ) as current:
+        yield current
+
+
+def bind_context(fn: Callable) -> Callable:
+    """Wrap fn so it runs in the caller's trace context, e.g. on an executor thread."""
+    if not _enabled:
+        return fn
+    captured = otel_context.get_current()
+
+    @wraps(fn)
+    def run_in_context(*args, **kwargs):
+        token = otel_context.attach(captured)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            otel_context.detach(token)
+    return run_in_context
+
+
+def inject_env(env: Dict[str, str]) -> Dict[str, str]:
+    """Add the current trace context to a subprocess environment as TRACEPARENT/TRACESTATE."""
+    if _enabled:
+        carrier: Dict[str, str] = {}
+        propagate.inject(carrier)
+        env.update({key.upper(): value for key, value in carrier.items()})
+    return env
+
+
+def record_node_spans(stdout: str) -> str:
+    """
+    Turn the renderer's TRACE_SPAN lines into child spans of the current span.
+
+    Args:
+        stdout: Output of convert-to-pdf.js
+
+    Returns:
+        The output without the TRACE_SPAN lines
+    """
+    if NODE_SPAN_PREFIX not in stdout:
+        return stdout
+    tracer = trace.get_tracer(__name__) if _enabled else None
+    kept = []
+    for line in stdout.splitlines(keepends=True):
+        if not line.startswith(NODE_SPAN_PREFIX):
+            kept.append(line)
+            continue
+        if tracer is None:
+            continue
+        try:
+            phase = json.loads(line[len(NODE_SPAN_PREFIX):])
+            # Node reports epoch milliseconds; spans take epoch nanoseconds
+            child = tracer.start_span(f"node.{phase['name']}", start_time=int(phase["start"] * 1_000_000))
+            child.end(end_time=int(phase["end"] * 1_000_000))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed renderer span {line.strip()}: {str(e)}")
+    return "".join(kept)
+
+
+def _statement_text(cursor, query: Any) -> str:
+    if hasattr(query, "as_string"):  # psycopg2.sql.Composed
+        query = query.as_string(cursor)
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    return " ".join(str(query).split())[:MAX_STATEMENT_LENGTH]
+
+
+def _traced(method: Callable) -> Callable:
+    @wraps(method)
+    def traced(self, query, *args, **kwargs):
+        statement = _statement_text(self, query)
+        operation = statement.split(" ", 1)[0].upper() or "QUERY"
+        with span(
+            f"db {operation}",
+            kind="client",
+            **{"db.system": "postgresql", "db.name": self.connection.info.dbname, "db.statement": statement},
+        ) as current:
+            result = method(self, query, *args, **kwargs)
+            if current is not None and self.rowcount >= 0:
+                current.set_attribute("db.rows", self.rowcount)
+            return result
+    return traced
+
+
+_traced_cursor_classes: Dict[type, type] = {}
+
+
+def _traced_cursor_class(base: type) -> type:
+    traced = _traced_cursor_classes.get(base)
+    if traced is None:
+        traced = type(f"Traced{base.__name__}", (base,), {
+            "execute": _traced(base.execute),
+            "executemany": _traced(base.executemany),
+            "copy_expert": _traced(base.copy_expert),
+        })
+        _traced_cursor_classes[base] = traced
+    return traced
+
+
+class TracedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that traces connecting and every statement run on its cursors."""
+
+    def __init__(self, dsn, *args, **kwargs):
+        params = psycopg2.extensions.parse_dsn(dsn)
+        with span("db connect", kind="client", **{"db.system": "postgresql", "db.name": params.get("dbname"),
+                                                   "server.address": params.get("host")}):
+            super().__init__(dsn, *args, **kwargs)
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _traced_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+def _start_request_span() -> None:
+    route = request.url_rule.rule if request.url_rule else request.path
+    parent = propagate.extract(request.headers)
+    server_span = trace.get_tracer(__name__).start_span(
+        f"{request.method} {route}",
+        context=parent,
+        kind=SpanKind.SERVER,
+        attributes={"http.request.method": request.method, "http.route": route, "url.path": request.path},
+    )
+    g.trace_span = server_span
+    g.trace_token = otel_context.attach(trace.set_span_in_context(server_span, parent))
+
+
+def _finish_request_span(response):
+    server_span = g.get("trace_span")
+    if server_span is not None:
+        server_span.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            server_span.set_status(Status(StatusCode.ERROR))
+        response.headers["X-Trace-Id"] = format(server_span.get_span_context().trace_id, "032x")
+    return response
+
+
+def _end_request_span(error=None) -> None:
+    server_span = g.pop("trace_span", None)
+    if server_span is None:
+        return
+    if error is not None:
+        server_span.record_exception(error)
+        server_span.set_status(Status(StatusCode.ERROR, str(error)))
+    server_span.end()
+    otel_context.detach(g.pop("trace_token"))
+
+
+def init_tracing(app: Flask) -> bool:
+    """
+    Configure the OTLP exporter and instrument Flask and Postgres, if tracing is configured.
+
+    Returns:
+        True if tracing was enabled
+    """
+    global _enabled, _provider
+    if not OTEL_EXPORTER_OTLP_ENDPOINT:
+        return False
+    if trace is None:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry is not installed; tracing is off")
+        return False
+    if _provider is None:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        except ImportError as e:
+            logger.warning(f"OpenTelemetry SDK or OTLP exporter missing ({str(e)}); tracing is off")
+            return False
+        # The batch processor restarts its export thread in forked gunicorn workers
+        _provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+        _provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(_provider)
+        set_connection_factory(TracedConnection)
+        _enabled = True
+        logger.info(f"Tracing to {OTEL_EXPORTER_OTLP_ENDPOINT} as {OTEL_SERVICE_NAME}")
+
+    app.before_request(_start_request_span)
+    app.after_request(_finish_request_span)
+    app.teardown_request(_end_request_span)
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Export buffered spans; call before the process exits."""
+    if _provider is not None:
+        _provider.shutdown()
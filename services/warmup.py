@@ -0,0 +1,94 @@
+"""
+Warm-up module
+
+Work done once per server worker before it accepts traffic, so the first
+requests do not pay for cold caches: a database round trip (which also
+measures replica lag for read routing), the nutrition reference cache and
+the indexes built from it, the LLM client, and a headless Chromium launch
+for PDF reports.
+
+Run from the gunicorn post_worker_init hook (see gunicorn.conf.py). A step
+that fails is logged and skipped; the worker still starts.
+
+SDKs that are imported lazily to keep start-up fast are imported once in the
+gunicorn master instead (preload_modules), so forked workers inherit them.
+"""
+import time
+import logging
+import importlib
+from typing import Any, Callable, Dict, List, Tuple
+
+from data_access.main import get_cached_nutrition_reference, get_db_connection, get_read_connection
+from services.allergens import get_allergen_index
+from services.food_search import get_food_index
+from services.js_bridge_service import warm_pdf_renderer
+from services.prompt import get_llm_client
+
+logger = logging.getLogger(__name__)
+
+# Imported on first use by the services; optional ones may be missing
+PRELOAD_MODULES = ["openai", "tiktoken"]
+
+
+def _check_connection(connect: Callable) -> None:
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+    finally:
+        conn.close()
+
+
+def _warm_pdf_renderer() -> None:
+    if not warm_pdf_renderer():
+        raise RuntimeError("PDF renderer unavailable")
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], Any]]] = [
+    ("primary_db", lambda: _check_connection(get_db_connection)),
+    ("read_db", lambda: _check_connection(get_read_connection)),
+    ("nutrition_reference", get_cached_nutrition_reference),
+    ("food_search_index", get_food_index),
+    ("allergen_index", get_allergen_index),
+    ("llm_client", get_llm_client),
+    ("pdf_renderer", _warm_pdf_renderer),
+]
+
+
+def warm_up() -> Dict[str, Dict[str, Any]]:
+    """
+    Run every warm-up step.
+
+    Returns:
+        Dictionary of step name to {"ok", "ms"} and "error" for failed steps
+    """
+    results = {}
+    for name, step in WARMUP_STEPS:
+        started = time.monotonic()
+        try:
+            step()
+            results[name] = {"ok": True}
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+            results[name] = {"ok": False, "error": str(e)}
+        results[name]["ms"] = round((time.monotonic() - started) * 1000, 1)
+    logger.info(f"Warm-up finished: {results}")
+    return results
+
+
+def preload_modules() -> List[str]:
+    """
+    Import the lazily loaded SDKs.
+
+    Returns:
+        Names of the modules that could be imported
+    """
+    loaded = []
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError:
+            pass
+    return loaded
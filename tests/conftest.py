@@ -0,0 +1,8 @@
+import os
+
+# services.prompt builds its Azure OpenAI client at import time
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test-key")
+# Keep the background report compaction thread out of the test process
+os.environ.setdefault("REPORT_COMPACTION_INTERVAL", "0")
+# ... and the partition maintenance thread, which needs the database
+os.environ.setdefault("PARTITION_MAINTENANCE_INTERVAL", "0")
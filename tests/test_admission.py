@@ -0,0 +1,117 @@
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from services import admission
+from services.admission import BATCH, INTERACTIVE, AdmissionController, AdmissionRejected
+
+
+def hold_slot(controller, priority=INTERACTIVE):
+    """Admit a request in a thread and keep it running until the returned event is set."""
+    admitted = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            with controller.admit(priority):
+                admitted.set()
+                release.wait(5)
+        except AdmissionRejected as e:
+            errors.append(e)
+            admitted.set()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return admitted, release, errors, thread
+
+
+def wait_for_queue(controller, depth):
+    deadline = time.monotonic() + 5
+    while controller.stats()["queue_depth"] < depth and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_full_queue_rejects_with_429():
+    """Test requests beyond the limit and queue are rejected immediately"""
+    controller = AdmissionController("test", limit=1, queue_size=0, queue_timeout=5)
+    admitted, release, _, thread = hold_slot(controller)
+    admitted.wait(5)
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.admit():
+            pass
+    release.set()
+    thread.join(5)
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after >= 1
+    assert controller.stats()["rejected_queue_full"] == 1
+
+
+def test_queue_deadline_rejects_with_503():
+    """Test a queued request gives up after the queue timeout"""
+    controller = AdmissionController("test", limit=1, queue_size=1, queue_timeout=0.05)
+    admitted, release, _, thread = hold_slot(controller)
+    admitted.wait(5)
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.admit():
+            pass
+    release.set()
+    thread.join(5)
+    stats = controller.stats()
+    assert rejected.value.status == 503
+    assert (stats["rejected_timeout"], stats["queue_depth"], stats["active"]) == (1, 0, 0)
+
+
+def test_interactive_sheds_queued_batch_request():
+    """Test an interactive request takes a full queue's place from a batch request and runs first"""
+    controller = AdmissionController("test", limit=1, queue_size=1, queue_timeout=5)
+    admitted, release, _, running = hold_slot(controller)
+    admitted.wait(5)
+    batch_done, _, batch_errors, batch = hold_slot(controller, BATCH)
+    wait_for_queue(controller, 1)
+    interactive_admitted, interactive_release, interactive_errors, interactive = hold_slot(controller, INTERACTIVE)
+
+    batch_done.wait(5)
+    assert batch_errors[0].status == 503
+    release.set()
+    interactive_admitted.wait(5)
+    interactive_release.set()
+    for thread in (running, batch, interactive):
+        thread.join(5)
+    assert not interactive_errors
+    assert controller.stats()["shed"] == 1
+
+
+@patch.object(admission, "_controllers", {})
+@patch("routes.routes.generate_patient_report")
+@patch("routes.routes.find_reusable_report", return_value=None)
+@patch("routes.routes.get_patient_data", return_value={})
+def test_generate_report_over_capacity_returns_retry_after(mock_data, mock_reusable, mock_generate, monkeypatch):
+    """Test an over-capacity report request gets a fast 429 with Retry-After"""
+    monkeypatch.setitem(admission.ADMISSION_DEFAULTS, "reports", (1, 0, 1.0))
+    from app import create_app
+    client = create_app().test_client()
+    admitted, release, _, thread = hold_slot(admission.get_admission_controller("reports"))
+    admitted.wait(5)
+
+    response = client.get("/generate-report?patient_id=1")
+    release.set()
+    thread.join(5)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    mock_generate.assert_not_called()
+
+
+@patch("routes.routes.get_singleflight")
+@patch("routes.routes.find_reusable_report", return_value=None)
+def test_report_requests_coalesce_only_within_a_priority(mock_reusable, mock_singleflight):
+    """Test an interactive request never joins a batch request's generation and admission"""
+    mock_singleflight.return_value.do.return_value = {"status": "Report generated"}
+    from app import create_app
+    client = create_app().test_client()
+    client.get("/generate-report?patient_id=1&priority=batch")
+    client.get("/generate-report?patient_id=1")
+    client.get("/generate-report?patient_id=1&priority=interactive")
+    keys = [call.args[0] for call in mock_singleflight.return_value.do.call_args_list]
+    assert keys[0] != keys[1] and keys[1] == keys[2]
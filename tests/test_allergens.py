@@ -0,0 +1,88 @@
+from unittest.mock import patch
+from services.allergens import AllergenIndex, canonical_allergen, contains_allergen, get_caseload_allergen_exposures
+
+FOODS = [
+    {"id": 1, "food_name": "Peanut butter", "additional_nutrients_json": None},
+    {"id": 2, "food_name": "Yogurt, plain", "additional_nutrients_json": {"calcium": "110mg"}},
+    {"id": 3, "food_name": "Granola bar", "additional_nutrients_json": '{"ingredients": "oats, honey, almonds"}'},
+    {"id": 4, "food_name": "Pad thai", "additional_nutrients_json": {"allergens": ["Peanuts", "Shellfish"]}},
+    {"id": 5, "food_name": "Strawberries, raw", "additional_nutrients_json": {}},
+    {"id": 6, "food_name": "Salmon, baked", "additional_nutrients_json": {}},
+    {"id": 7, "food_name": "Tuna salad", "additional_nutrients_json": {"ingredients": "tuna, mayonnaise, celery"}},
+]
+
+
+def test_index_matches_names_ingredients_and_declared_allergens():
+    """Test foods are indexed from names, ingredient tags and declared allergens"""
+    index = AllergenIndex(FOODS)
+    assert index.foods_for("Peanuts") == {1, 4}
+    assert index.foods_for("Dairy") == {2}
+    assert index.foods_for("Tree nuts") == {3}
+    assert index.foods_for("Shellfish") == {4}
+    assert index.foods_for("Strawberries") == {5}
+    assert index.foods_for("") == frozenset()
+
+
+def test_fish_and_nut_allergies_flag_their_own_foods():
+    """Test Fish is not read as shellfish and Nuts covers tree nuts and peanuts"""
+    index = AllergenIndex(FOODS)
+    assert index.foods_for("Fish") == {6, 7}
+    assert index.foods_for("Shellfish") == {4}
+    assert index.foods_for("Nuts") == {1, 3, 4}
+    transactions = [{"id": 20, "nutrition_ref_id": 6, "servings": 1, "consumption_date": "2025-02-03"},
+                    {"id": 21, "nutrition_ref_id": 3, "servings": 1, "consumption_date": "2025-02-03"}]
+    exposures = index.find_exposures(transactions, [{"allergen": "Fish"}, {"allergen": "Nuts"}])
+    assert [(e["transaction_id"], e["allergen"]) for e in exposures] == [(20, "Fish"), (21, "Nuts")]
+
+
+
+def test_keywords_match_whole_words_only():
+    """Test eggplant is not an egg food and butternut squash is neither dairy nor a nut"""
+    allergies = ["Eggs", "Dairy", "Nuts", "Tree nuts"]
+    assert contains_allergen("Eggplant, grilled", allergies) == []
+    assert contains_allergen("Butternut squash, roasted", allergies) == []
+    assert contains_allergen("Scrambled eggs", allergies) == ["Eggs"]
+    assert contains_allergen("Almonds, salted", allergies) == ["Nuts", "Tree nuts"]
+
+
+def test_milk_and_wheat_allergies_map_to_their_allergen_group():
+    """Test Milk and Lactose cover dairy foods and Wheat covers gluten foods"""
+    assert canonical_allergen("Milk") == canonical_allergen("Lactose") == "dairy"
+    assert canonical_allergen("Wheat") == "gluten"
+    assert contains_allergen("Cheddar cheese", ["Milk"]) == ["Milk"]
+    assert contains_allergen("Whole grain bread", ["Wheat"]) == ["Wheat"]
+    assert AllergenIndex(FOODS).foods_for("Milk") == {2}
+
+
+def test_find_exposures_flags_each_matching_transaction():
+    """Test exposures carry the transaction, food and allergy details"""
+    index = AllergenIndex(FOODS)
+    transactions = [
+        {"id": 10, "nutrition_ref_id": 1, "servings": 2, "consumption_date": "2025-02-01"},
+        {"id": 11, "nutrition_ref_id": 5, "servings": 1, "consumption_date": "2025-02-02"},
+    ]
+    exposures = index.find_exposures(transactions, [{"allergen": "Peanuts", "severity": "Severe"}])
+    assert exposures == [{
+        "transaction_id": 10, "consumption_date": "2025-02-01", "nutrition_ref_id": 1,
+        "food_name": "Peanut butter", "servings": 2.0, "allergen": "Peanuts", "severity": "Severe",
+    }]
+
+
+@patch("services.allergens.get_food_transactions_for_foods")
+@patch("services.allergens.get_allergies")
+@patch("services.allergens.get_allergen_index")
+def test_caseload_reads_only_matching_foods(mock_index, mock_allergies, mock_transactions):
+    """Test the caseload query is limited to allergic patients and matching foods"""
+    mock_index.return_value = AllergenIndex(FOODS)
+    mock_allergies.return_value = [
+        {"patient_id": 1, "allergen": "Peanuts", "severity": "Severe"},
+        {"patient_id": 4, "allergen": "Dairy", "severity": "Moderate"},
+    ]
+    mock_transactions.return_value = [
+        {"id": 10, "patient_id": 1, "nutrition_ref_id": 4, "servings": 1, "consumption_date": "2025-02-01"},
+        {"id": 11, "patient_id": 4, "nutrition_ref_id": 1, "servings": 1, "consumption_date": "2025-02-01"},
+    ]
+    exposures = get_caseload_allergen_exposures("2025-02-01", "2025-02-28")
+    mock_transactions.assert_called_once_with([1, 2, 4], [1, 4], "2025-02-01", "2025-02-28")
+    assert list(exposures) == [1]
+    assert exposures[1][0]["food_name"] == "Pad thai"
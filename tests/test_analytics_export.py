@@ -0,0 +1,40 @@
+import pytest
+from datetime import date
+from unittest.mock import patch
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from services.analytics_export import export_cohort, transaction_schema, write_partitioned
+
+TRANSACTIONS = [
+    {"transaction_id": i, "patient_id": 1 + i % 2, "consumption_date": day, "nutrition_ref_id": 1,
+     "food_name": "Apple, raw", "servings": 1.0, "calories": 52.0, "protein_g": 0.26, "fat_g": 0.17,
+     "carbs_g": 14.0, "fiber_g": 2.4, "sodium_mg": 1.0}
+    for i, day in enumerate([date(2025, 1, 30), date(2025, 1, 31), date(2025, 2, 1), date(2025, 2, 1), date(2025, 3, 5)])
+]
+ROLLUPS = [
+    {"patient_id": 1, "rollup_date": date(2025, 2, 1), "calories": 52.0, "protein_g": 0.26, "fat_g": 0.17,
+     "carbs_g": 14.0, "fiber_g": 2.4, "sodium_mg": 1.0, "transaction_count": 1},
+]
+
+
+def test_write_partitioned_splits_months_and_chunks(tmp_path):
+    """Test rows land in one file per month, written in row groups of chunk_rows"""
+    files = write_partitioned(iter(TRANSACTIONS), str(tmp_path), transaction_schema(), "consumption_date", chunk_rows=1)
+    assert [(f["month"], f["rows"]) for f in files] == [("2025-01", 2), ("2025-02", 2), ("2025-03", 1)]
+    january = pq.ParquetFile(tmp_path / "month=2025-01" / "part-0.parquet")
+    assert january.metadata.num_row_groups == 2
+    assert january.read().column("food_name").to_pylist() == ["Apple, raw", "Apple, raw"]
+
+
+@patch("services.analytics_export.stream_daily_nutrient_rollups")
+@patch("services.analytics_export.stream_food_transactions")
+def test_export_cohort_writes_both_datasets(mock_transactions, mock_rollups, tmp_path):
+    """Test the cohort export streams transactions in date order and writes daily facts"""
+    mock_transactions.return_value = iter(TRANSACTIONS)
+    mock_rollups.return_value = iter(ROLLUPS)
+    result = export_cohort(str(tmp_path), [1, 2], "2025-01-01", "2025-03-31")
+    mock_transactions.assert_called_once_with([1, 2], "2025-01-01", "2025-03-31", order_by_date=True)
+    assert sum(f["rows"] for f in result["transactions"]) == 5
+    daily = pq.read_table(tmp_path / "daily" / "month=2025-02" / "part-0.parquet")
+    assert daily.column("transaction_count").to_pylist() == [1]
@@ -0,0 +1,69 @@
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from app import create_app
+
+
+@pytest.fixture
+def client():
+    app = create_app()
+    # Databases created before table_versions existed; tests below override it
+    with app.test_client() as client, patch("routes.routes.get_table_version", return_value=None):
+        yield client
+
+
+PAGE = [
+    {"id": 1, "first_name": "John", "last_name": "Doe", "date_of_birth": None,
+     "gender": "Male", "created_at": datetime(2025, 3, 1, 12, 0, 0)},
+    {"id": 2, "first_name": "Jane", "last_name": "Smith", "date_of_birth": None,
+     "gender": "Female", "created_at": datetime(2025, 3, 2, 12, 0, 0)},
+]
+
+
+@patch("routes.routes.get_patients_page")
+def test_clients_paginated(mock_page, client):
+    """Test /clients returns a page and passes paging params through"""
+    mock_page.return_value = (PAGE, 2)
+    response = client.get("/clients?cursor=0&limit=2&search=jo")
+    assert response.status_code == 200
+    assert [c["id"] for c in response.json["clients"]] == [1, 2]
+    assert response.json["next_cursor"] == 2
+    mock_page.assert_called_once_with(cursor=0, limit=2, name_prefix="jo", gender=None)
+    assert response.headers["ETag"]
+    assert response.headers["Last-Modified"] == "Sun, 02 Mar 2025 12:00:00 GMT"
+
+
+@patch("routes.routes.get_patients_page")
+def test_clients_limit_is_clamped(mock_page, client):
+    """Test oversized page requests are capped"""
+    mock_page.return_value = ([], None)
+    client.get("/clients?limit=100000")
+    assert mock_page.call_args.kwargs["limit"] == 500
+
+
+@patch("routes.routes.get_patients_page")
+def test_clients_if_none_match(mock_page, client):
+    """Test a matching If-None-Match is answered with 304"""
+    mock_page.return_value = (PAGE, None)
+    etag = client.get("/clients").headers["ETag"]
+    response = client.get("/clients", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+@patch("routes.routes.get_patients_page")
+def test_clients_revalidation_skips_page_query_until_patients_change(mock_page, client):
+    """Test a 304 is answered from the patients table version, and an edit changes it"""
+    mock_page.return_value = (PAGE, None)
+    modified = datetime(2025, 3, 5, 9, 30, tzinfo=timezone.utc)
+    with patch("routes.routes.get_table_version", return_value=(7, modified)):
+        first = client.get("/clients")
+        assert first.headers["Last-Modified"] == "Wed, 05 Mar 2025 09:30:00 GMT"
+        response = client.get("/clients", headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 304
+    assert mock_page.call_count == 1
+
+    with patch("routes.routes.get_table_version", return_value=(8, modified)):
+        response = client.get("/clients", headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 200
+    assert mock_page.call_count == 2
@@ -0,0 +1,65 @@
+import pytest
+from unittest.mock import patch
+from services import cohort
+from services.cohort import compute_cohort_statistics, get_cohort_summary, percentile
+from services.invalidation import publish_transactions_changed
+
+
+def row(patient_id, calories, days=2):
+    return {"patient_id": patient_id, "first_name": "P", "last_name": str(patient_id), "days_logged": days,
+            "calories_adherence": calories, "protein_adherence": None}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cohort.clear_cohort_summary_cache()
+    yield
+    cohort.clear_cohort_summary_cache()
+
+
+def test_percentile_interpolates():
+    """Test percentiles match percentile_cont interpolation"""
+    assert percentile([10, 20, 30, 40], 50) == 25
+    assert percentile([10, 20, 30, 40], 90) == pytest.approx(37)
+    assert percentile([5], 25) == 5
+
+
+def test_statistics_ranks_and_outliers():
+    """Test percentile ranks and IQR outlier flags per nutrient"""
+    rows = [row(1, 95), row(2, 100), row(3, 105), row(4, 98), row(5, 300)]
+    summary = compute_cohort_statistics(rows)
+    assert summary["nutrients"]["calories"]["p50"] == 100
+    assert "protein" not in summary["nutrients"]
+    patients = {p["patient_id"]: p for p in summary["patients"]}
+    assert patients[5]["outliers"] == [{"nutrient": "calories", "direction": "high"}]
+    assert patients[5]["percentile_rank"]["calories"] == 100
+    assert patients[1]["percentile_rank"]["calories"] == 0
+    assert patients[2]["outliers"] == []
+
+
+@patch("services.cohort.get_cohort_adherence")
+def test_summary_cached_and_refreshed_incrementally(mock_adherence):
+    """Test cached summaries only re-query patients with new transactions in range"""
+    mock_adherence.return_value = [row(1, 90), row(2, 110)]
+    first = get_cohort_summary("2025-02-01", "2025-02-28")
+    assert get_cohort_summary("2025-02-01", "2025-02-28") is first
+    mock_adherence.assert_called_once_with("2025-02-01", "2025-02-28")
+
+    # Out-of-range changes do not invalidate
+    publish_transactions_changed({1: {"2025-03-05"}})
+    assert get_cohort_summary("2025-02-01", "2025-02-28") is first
+
+    mock_adherence.return_value = [row(2, 150)]
+    publish_transactions_changed({2: {"2025-02-10"}})
+    refreshed = get_cohort_summary("2025-02-01", "2025-02-28")
+    mock_adherence.assert_called_with("2025-02-01", "2025-02-28", [2])
+    adherence = {p["patient_id"]: p["adherence"]["calories"] for p in refreshed["patients"]}
+    assert adherence == {1: 90, 2: 150}
+
+
+def test_cohort_summary_route_validates_dates():
+    """Test the endpoint rejects malformed or inverted ranges"""
+    from app import create_app
+    client = create_app().test_client()
+    assert client.get("/cohort-summary?start_date=2025-13-01&end_date=2025-02-01").status_code == 400
+    assert client.get("/cohort-summary?start_date=2025-03-01&end_date=2025-02-01").status_code == 400
@@ -0,0 +1,70 @@
+import gzip
+import os
+import pytest
+from unittest.mock import patch
+from app import create_app
+from routes import routes
+from services.compression import sidecar_path, write_precompressed_sidecars
+
+
+@pytest.fixture
+def client():
+    app = create_app()
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def report_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(routes, "REPORTS_DIR", str(tmp_path))
+    path = os.path.join(str(tmp_path), "999_nutrition_20250101_000000.html")
+    with open(path, "w") as f:
+        f.write("<html>" + "report " * 500 + "</html>")
+    return path
+
+
+@patch("routes.routes.get_patients_page")
+def test_json_response_is_gzipped(mock_page, client):
+    """Test large JSON responses are compressed when accepted"""
+    mock_page.return_value = ([{"id": i, "first_name": "Patient", "last_name": str(i)} for i in range(100)], None)
+    response = client.get("/clients", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"].startswith('W/')
+    assert b'"first_name"' in gzip.decompress(response.data)
+
+
+@patch("routes.routes.get_patients_page")
+def test_json_response_identity_without_accept_encoding(mock_page, client):
+    """Test responses are left alone when the client does not accept compression"""
+    mock_page.return_value = ([{"id": i, "first_name": "Patient"} for i in range(100)], None)
+    response = client.get("/clients")
+    assert "Content-Encoding" not in response.headers
+
+
+def test_report_served_from_sidecar(client, report_file):
+    """Test immutable reports use the precompressed sidecar and long cache headers"""
+    write_precompressed_sidecars(report_file)
+    assert os.path.exists(sidecar_path(report_file, "gzip"))
+
+    filename = os.path.basename(report_file)
+    response = client.get(f"/reports/{filename}", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.mimetype == "text/html"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert gzip.decompress(response.get_data()).startswith(b"<html>")
+    response.close()
+
+
+def test_report_range_request(client, report_file):
+    """Test range requests return a partial identity response"""
+    write_precompressed_sidecars(report_file)
+    filename = os.path.basename(report_file)
+    response = client.get(
+        f"/reports/{filename}",
+        headers={"Range": "bytes=0-5", "Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 206
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data() == b"<html>"
+    response.close()
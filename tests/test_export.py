@@ -0,0 +1,58 @@
+import csv
+import gzip
+import io
+import json
+from datetime import date
+from unittest.mock import patch
+from services.compression import gzip_stream
+from services.export import EXPORT_COLUMNS, iter_csv, iter_ndjson
+
+ROWS = [
+    {"transaction_id": i, "patient_id": 1, "consumption_date": date(2025, 2, 1), "nutrition_ref_id": 1,
+     "food_name": "Apple, raw", "servings": 2.0, "calories": 104.0, "protein_g": 0.52, "fat_g": 0.34,
+     "carbs_g": 28.0, "fiber_g": 4.8, "sodium_mg": 2.0}
+    for i in range(5)
+]
+
+
+def test_iter_ndjson_chunks_rows():
+    """Test NDJSON output batches rows into chunks of whole lines"""
+    chunks = list(iter_ndjson(iter(ROWS), chunk_rows=2))
+    assert len(chunks) == 3
+    records = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert [r["transaction_id"] for r in records] == list(range(5))
+    assert records[0]["consumption_date"] == "2025-02-01"
+
+
+def test_iter_csv_has_header_and_quotes_names():
+    """Test CSV output starts with the header row and quotes values with commas"""
+    text = "".join(iter_csv(iter(ROWS), chunk_rows=2))
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == EXPORT_COLUMNS
+    assert len(rows) == 6
+    assert rows[1][4] == "Apple, raw"
+
+
+def test_iter_csv_empty_export_is_header_only():
+    """Test an export with no rows still produces the header"""
+    assert "".join(iter_csv(iter([]))).strip() == ",".join(EXPORT_COLUMNS)
+
+
+def test_gzip_stream_round_trip():
+    """Test incremental gzip output decompresses to the original chunks"""
+    chunks = [b"a" * 1000, b"b" * 1000, b""]
+    assert gzip.decompress(b"".join(gzip_stream(chunks))) == b"".join(chunks)
+
+
+@patch("services.export.stream_food_transactions")
+def test_export_route_streams_with_filters(mock_stream):
+    """Test the export endpoint passes filters through and streams the body"""
+    from app import create_app
+    mock_stream.return_value = iter(ROWS)
+    client = create_app().test_client()
+    response = client.get("/export/transactions?format=csv&patient_ids=1,2&start_date=2025-02-01")
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == "text/csv"
+    assert len(response.data.decode().splitlines()) == 6
+    mock_stream.assert_called_once_with([1, 2], "2025-02-01", None)
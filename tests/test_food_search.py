@@ -0,0 +1,67 @@
+from unittest.mock import patch
+from services.food_search import FUZZY_WEIGHT, FoodSearchIndex, normalize, trigrams
+
+FOODS = [
+    {"id": 1, "food_name": "Chicken breast, roasted"},
+    {"id": 2, "food_name": "Chickpeas, canned"},
+    {"id": 3, "food_name": "Broccoli, raw"},
+    {"id": 4, "food_name": "Chicken thigh, fried"},
+]
+
+
+def names(results):
+    return [row["food_name"] for _, row in results]
+
+
+def test_normalize_strips_punctuation():
+    """Test names are lowercased and punctuation collapsed"""
+    assert normalize("Chicken breast, ROASTED (skinless)") == "chicken breast roasted skinless"
+
+
+def test_search_prefix_and_typos():
+    """Test prefix matches, misspellings and multi-word ranking"""
+    index = FoodSearchIndex(FOODS)
+    assert set(names(index.search("chick"))) == {"Chicken breast, roasted", "Chickpeas, canned", "Chicken thigh, fried"}
+    assert names(index.search("brocoli")) == ["Broccoli, raw"]
+    assert names(index.search("chiken brest"))[0] == "Chicken breast, roasted"
+    assert names(index.search("chicken", limit=1)) == ["Chicken thigh, fried"]
+    assert index.search("zzz") == []
+
+
+def test_update_reindexes_changed_foods_only():
+    """Test renamed and removed foods are reflected after an update"""
+    index = FoodSearchIndex(FOODS)
+    changes = index.update([dict(FOODS[0], food_name="Turkey breast, roasted")] + FOODS[1:3])
+    assert changes == {"added": 0, "removed": 1, "renamed": 1}
+    assert names(index.search("turkey")) == ["Turkey breast, roasted"]
+    assert "Chicken thigh, fried" not in names(index.search("chicken"))
+
+
+
+def test_fuzzy_score_is_trigram_jaccard_similarity():
+    """Test misspellings are scored by the similarity of the actual trigram sets"""
+    index = FoodSearchIndex([{"id": 1, "food_name": "Banana"}])
+    query, word = trigrams("bananna"), trigrams("banana")
+    expected = len(query & word) / len(query | word)
+    assert index.search("bananna")[0][0] == round(FUZZY_WEIGHT * expected, 3)
+
+
+def test_removed_words_leave_no_empty_trigram_entries():
+    """Test trigrams of words no longer in the vocabulary are pruned"""
+    index = FoodSearchIndex(FOODS)
+    index.update(FOODS[:1])
+    assert all(index._word_grams.values())
+    assert set(index._word_grams) == set().union(*(trigrams(w) for w in ("chicken", "breast", "roasted")))
+
+
+@patch("services.food_search.get_nutrition_reference_version", return_value=1)
+@patch("services.food_search.get_cached_nutrition_reference", return_value=FOODS)
+def test_food_search_route(mock_reference, mock_version):
+    """Test the endpoint requires q and returns scored rows"""
+    from app import create_app
+    client = create_app().test_client()
+    assert client.get("/foods/search").status_code == 400
+    response = client.get("/foods/search?q=brocoli&limit=5")
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert results[0]["id"] == 3 and results[0]["score"] > 0
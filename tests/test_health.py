@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import patch
+from services import health
+
+DB_OK = {"ok": True, "latency_ms": 0.3, "tables": {"food_transactions": 50000}}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    health.clear_readiness_cache()
+    yield
+    health.clear_readiness_cache()
+
+
+@patch("services.health.get_llm_status", return_value={"initialized": False, "circuit": None})
+@patch("services.health.get_renderer_status", return_value={"node": "v20", "warmed": True})
+@patch("services.health._probe_database", return_value=DB_OK)
+def test_readiness_is_cached(mock_probe, mock_renderer, mock_llm):
+    """Test repeated probes within the cache window do not touch the database"""
+    assert health.get_readiness()["status"] == "ready"
+    assert health.get_readiness()["database"]["tables"] == {"food_transactions": 50000}
+    mock_probe.assert_called_once()
+
+
+@patch("services.health.get_llm_status", return_value={"initialized": True, "circuit": "open"})
+@patch("services.health.get_renderer_status", return_value={"node": "v20", "warmed": True})
+@patch("services.health._probe_database", return_value=DB_OK)
+def test_open_breaker_is_degraded(mock_probe, mock_renderer, mock_llm):
+    """Test an open LLM circuit reports degraded rather than unavailable"""
+    assert health.get_readiness()["status"] == "degraded"
+
+
+@patch("services.health.get_llm_status", return_value={"initialized": False, "circuit": None})
+@patch("services.health.get_renderer_status", return_value={"node": None, "warmed": None})
+@patch("services.health._probe_database", return_value={"ok": False, "error": "connection refused"})
+def test_readyz_unavailable_without_database(mock_probe, mock_renderer, mock_llm):
+    """Test /readyz returns 503 when the database is unreachable while /healthz stays up"""
+    from app import create_app
+    client = create_app().test_client()
+    assert client.get("/readyz").status_code == 503
+    assert client.get("/healthz").get_json()["status"] == "ok"
+
+
+@patch("services.health.get_renderer_status", return_value={"node": "v20", "warmed": True})
+@patch("services.health._probe_database", return_value=DB_OK)
+def test_readyz_with_a_created_llm_client(mock_probe, mock_renderer):
+    """Test readiness reads the breaker state of a real client, as after worker warm-up"""
+    from unittest.mock import MagicMock
+    from services import prompt
+    from services.llm_client import LLMClient
+    from app import create_app
+    with patch.object(prompt, "_llm_client", LLMClient(MagicMock())):
+        response = create_app().test_client().get("/readyz")
+    assert response.status_code == 200
+    assert response.get_json()["llm"] == {"initialized": True, "circuit": "closed"}
@@ -0,0 +1,88 @@
+import io
+import pytest
+from unittest.mock import patch
+from services.ingestion import IngestionError, ingest_food_transactions, parse_records
+
+REFS = [{"id": 1, "food_name": "Apple, raw"}, {"id": 2, "food_name": "Banana, raw"}]
+
+
+@pytest.fixture
+def db():
+    with patch("services.ingestion.get_cached_nutrition_reference", return_value=REFS), \
+         patch("services.ingestion.invalidate_nutrition_reference_cache"), \
+         patch("services.ingestion.get_existing_patient_ids", side_effect=lambda ids: ids & {1, 2}), \
+         patch("services.ingestion.copy_food_transactions") as mock_copy:
+        mock_copy.side_effect = lambda rows, batch_id, source=None: len(rows)
+        yield mock_copy
+
+
+def test_parse_csv_and_ndjson():
+    """Test both formats yield the same records"""
+    csv_body = "patient_id,nutrition_ref_id,servings,consumption_date\n1,2,1.5,2025-02-01\n"
+    ndjson_body = '{"patient_id": 1, "nutrition_ref_id": 2, "servings": 1.5, "consumption_date": "2025-02-01"}\n\n'
+    csv_rows = list(parse_records(io.StringIO(csv_body), "csv"))
+    ndjson_rows = list(parse_records(io.StringIO(ndjson_body), "ndjson"))
+    assert len(csv_rows) == len(ndjson_rows) == 1
+    assert int(csv_rows[0]["nutrition_ref_id"]) == ndjson_rows[0]["nutrition_ref_id"]
+
+
+def test_ingest_loads_batch_and_publishes_changes(db):
+    """Test a valid batch is copied and affected patients/dates are published"""
+    records = [
+        {"patient_id": 1, "nutrition_ref_id": 1, "servings": 2, "consumption_date": "2025-02-01"},
+        {"patient_id": 2, "nutrition_ref_id": 2, "servings": "0.5", "consumption_date": "2025-02-02"},
+    ]
+    with patch("services.ingestion.publish_transactions_changed") as mock_publish:
+        result = ingest_food_transactions(records, "batch-1")
+    assert result == {"batch_id": "batch-1", "status": "loaded", "rows": 2, "patients": 2}
+    mock_publish.assert_called_once_with({1: {"2025-02-01"}, 2: {"2025-02-02"}})
+
+
+def test_ingest_rejects_whole_batch_on_invalid_rows(db):
+    """Test unknown references and bad values reject the batch without loading"""
+    records = [
+        {"patient_id": 1, "nutrition_ref_id": 1, "servings": 1, "consumption_date": "2025-02-01"},
+        {"patient_id": 1, "nutrition_ref_id": 99, "servings": 1, "consumption_date": "2025-02-01"},
+        {"patient_id": 7, "nutrition_ref_id": 1, "servings": 1, "consumption_date": "2025-02-01"},
+        {"patient_id": 1, "nutrition_ref_id": 1, "servings": 0, "consumption_date": "02/01/2025"},
+    ]
+    with pytest.raises(IngestionError) as excinfo:
+        ingest_food_transactions(records, "batch-2")
+    assert [e["row"] for e in excinfo.value.errors] == [2, 3, 4]
+    db.assert_not_called()
+
+
+def test_servings_must_fit_the_column(db):
+    """Test servings outside DECIMAL(4,2) are rejected per row instead of failing the COPY"""
+    def record(servings):
+        return {"patient_id": 1, "nutrition_ref_id": 1, "servings": servings, "consumption_date": "2025-02-01"}
+
+    records = [record("99.99"), record(100), record(150), record("1.555"), record("1.50")]
+    with pytest.raises(IngestionError) as excinfo:
+        ingest_food_transactions(records, "batch-3")
+    assert [e["row"] for e in excinfo.value.errors] == [2, 3, 4]
+    db.assert_not_called()
+
+
+def test_ingest_duplicate_batch(db):
+    """Test a batch id that was already loaded is reported as a duplicate"""
+    db.side_effect = None
+    db.return_value = None
+    records = [{"patient_id": 1, "nutrition_ref_id": 1, "servings": 1, "consumption_date": "2025-02-01"}]
+    assert ingest_food_transactions(records, "batch-1")["status"] == "duplicate"
+
+
+@patch("routes.routes.ingest_food_transactions")
+def test_ingest_route(mock_ingest):
+    """Test the route requires a batch id and a supported content type"""
+    from app import create_app
+    client = create_app().test_client()
+    mock_ingest.return_value = {"batch_id": "b", "status": "loaded", "rows": 1, "patients": 1}
+
+    assert client.post("/ingest/food-transactions", data="x", content_type="text/csv").status_code == 400
+    assert client.post("/ingest/food-transactions?batch_id=b", data="x", content_type="text/plain").status_code == 415
+    response = client.post(
+        "/ingest/food-transactions", data="patient_id\n", content_type="text/csv", headers={"X-Batch-Id": "b"}
+    )
+    assert response.status_code == 201
+    assert mock_ingest.call_args[0][1] == "b"
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+from services import prompt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(code, cwd=ROOT):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop("AZURE_OPENAI_API_KEY", None)
+    result = subprocess.run([sys.executable, "-c", f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+                            cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def test_app_and_health_check_do_not_import_openai():
+    """Test importing the app or the DB health check does not load the OpenAI SDK"""
+    assert "openai" not in loaded_modules("import app")
+    assert "openai" not in loaded_modules("import check_db_connection", cwd=os.path.join(ROOT, "data_access"))
+
+
+@patch.object(prompt, "_llm_client", None)
+def test_llm_client_created_once_on_first_use():
+    """Test the Azure client is built on first use and then reused"""
+    with patch("openai.AzureOpenAI") as mock_azure:
+        client = prompt.get_llm_client()
+        assert prompt.get_llm_client() is client
+    mock_azure.assert_called_once()
+    assert client.client is mock_azure.return_value
@@ -0,0 +1,74 @@
+import openai
+import pytest
+from unittest.mock import MagicMock, patch
+from services.llm_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMClient,
+    LLMDeadlineExceeded,
+    TokenBucket,
+    parse_retry_after,
+)
+
+
+def rate_limit_error(retry_after="0"):
+    response = MagicMock(status_code=429, headers={"retry-after": retry_after})
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def make_client(side_effect, **kwargs):
+    upstream = MagicMock()
+    upstream.chat.completions.create.side_effect = side_effect
+    return LLMClient(upstream, requests_per_minute=6000, tokens_per_minute=10 ** 7, **kwargs), upstream
+
+
+def test_token_bucket_gives_up_past_deadline():
+    """Test acquisition fails instead of waiting past the deadline"""
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.acquire(1)
+    assert not bucket.acquire(1, deadline=0)
+
+
+def test_parse_retry_after_seconds():
+    """Test Retry-After seconds are read from the error response"""
+    assert parse_retry_after(rate_limit_error("2")) == 2.0
+
+
+@patch("services.llm_client.time.sleep")
+def test_retries_honour_retry_after(mock_sleep):
+    """Test 429s are retried after at least Retry-After seconds"""
+    client, upstream = make_client([rate_limit_error("1.5"), "ok"])
+    assert client.chat_completion(messages=[{"role": "user", "content": "hi"}]) == "ok"
+    assert upstream.chat.completions.create.call_count == 2
+    assert mock_sleep.call_args.args[0] >= 1.5
+
+
+@patch("services.llm_client.time.sleep")
+def test_circuit_opens_and_fails_fast(mock_sleep):
+    """Test the breaker opens after repeated failures and rejects calls"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    client, upstream = make_client(rate_limit_error(), max_retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(openai.RateLimitError):
+            client.chat_completion(messages=[])
+    with pytest.raises(CircuitOpenError):
+        client.chat_completion(messages=[])
+    assert upstream.chat.completions.create.call_count == 2
+
+
+def test_half_open_trial_closes_breaker():
+    """Test a successful trial call after the reset timeout closes the breaker"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    client, _ = make_client(["ok"], breaker=breaker)
+    assert client.chat_completion(messages=[]) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_exceeded():
+    """Test a call with no time left is rejected without reaching upstream"""
+    client, upstream = make_client(["ok"])
+    with pytest.raises(LLMDeadlineExceeded):
+        client.chat_completion(deadline=-1, messages=[])
+    upstream.chat.completions.create.assert_not_called()
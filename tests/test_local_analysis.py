@@ -0,0 +1,102 @@
+import json
+import time
+from unittest.mock import patch
+from services import report_service
+from services.allergens import canonical_allergen, contains_allergen
+from services.local_analysis import generate_local_analysis
+from services.report_service import get_report_analysis
+
+
+REPORT_DATA = {
+    "patient": {"id": 1, "name": "John Doe", "age": 45, "allergies": ["Peanuts", "Dairy"]},
+    "nutrients": {
+        "calories": {"actual": 3000, "target": 2000},
+        "protein": {"actual": 40, "target": 50},
+        "fiber": {"actual": 10, "target": 25},
+        "sodium": {"actual": 5000, "target": 2300},
+    },
+    "food_items": [
+        {"name": "Peanut butter", "quantity": 1, "calories": 190, "date": "2025-02-01"},
+        {"name": "Yogurt, plain", "quantity": 1, "calories": 59, "date": "2025-02-02"},
+    ],
+}
+
+
+def test_local_analysis_uses_daily_averages():
+    """Test totals are averaged per logged day and compared to targets"""
+    analysis = generate_local_analysis(REPORT_DATA)
+    assert set(analysis) == {"SUMMARY", "ANALYSIS", "RECOMMENDATIONS", "HEALTH_INSIGHTS"}
+    assert "1500 kcal/day (75% of the 2000 kcal target)" in analysis["SUMMARY"]
+    assert "Protein: 20g/day vs 50g target (40%, below target)" in analysis["ANALYSIS"]
+    assert "Sodium: 2500mg/day vs 2300mg target (109%, above limit)" in analysis["ANALYSIS"]
+
+
+def test_local_analysis_flags_allergens_and_avoids_them():
+    """Test allergen exposures are flagged and not recommended"""
+    analysis = generate_local_analysis(REPORT_DATA)
+    assert "Peanut butter (Peanuts)" in analysis["HEALTH_INSIGHTS"]
+    assert "Yogurt, plain (Dairy)" in analysis["HEALTH_INSIGHTS"]
+    assert "greek yogurt" not in analysis["RECOMMENDATIONS"]
+
+
+def test_fish_nuts_and_shellfish_allergies_match_their_own_foods():
+    """Test short allergy names map to their own allergen, not a longer one containing them"""
+    assert canonical_allergen("Fish") == "fish"
+    assert canonical_allergen("Shellfish") == "shellfish"
+    assert canonical_allergen("Peanut oil") == "peanut"
+    assert contains_allergen("Salmon, baked", ["Fish"]) == ["Fish"]
+    assert contains_allergen("Shrimp cocktail", ["Fish"]) == []
+    assert contains_allergen("Shrimp cocktail", ["Shellfish"]) == ["Shellfish"]
+    assert contains_allergen("Salmon, baked", ["Shellfish"]) == []
+    assert contains_allergen("Almonds", ["Nuts"]) == ["Nuts"]
+    assert contains_allergen("Peanut butter", ["Nuts"]) == ["Nuts"]
+
+
+def test_local_analysis_without_intake():
+    """Test empty periods produce a clear message"""
+    analysis = generate_local_analysis({"patient": {"name": "Jane"}, "food_items": []})
+    assert "No food intake was recorded for Jane" in analysis["SUMMARY"]
+
+
+@patch("services.report_service.get_ai_analysis")
+def test_fast_mode_skips_llm(mock_ai):
+    """Test include_ai=fast never calls the LLM"""
+    analysis, source = get_report_analysis(REPORT_DATA, "fast")
+    assert source == "local"
+    mock_ai.assert_not_called()
+
+
+@patch("services.report_service.get_ai_analysis")
+def test_llm_result_used_when_in_time(mock_ai):
+    """Test the AI analysis is used when it returns before the deadline"""
+    mock_ai.return_value = json.dumps({"SUMMARY": "AI summary", "ANALYSIS": "", "RECOMMENDATIONS": "", "HEALTH_INSIGHTS": ""})
+    analysis, source = get_report_analysis(REPORT_DATA, True)
+    assert source == "ai"
+    assert analysis["SUMMARY"] == "AI summary"
+
+
+@patch("services.report_service.get_ai_analysis")
+def test_hedge_on_deadline(mock_ai, monkeypatch):
+    """Test the local analysis is used when the LLM misses the deadline"""
+    monkeypatch.setattr(report_service, "AI_ANALYSIS_DEADLINE_SECONDS", 0.05)
+    mock_ai.side_effect = lambda data, deadline=None: time.sleep(0.5) or "{}"
+    started = time.monotonic()
+    analysis, source = get_report_analysis(REPORT_DATA, True)
+    assert source == "local"
+    assert time.monotonic() - started < 0.4
+    assert analysis["SUMMARY"].startswith("John Doe logged")
+    # The LLM call is bounded by what was left of the report's deadline
+    assert 0 < mock_ai.call_args.kwargs["deadline"] <= 0.05
+
+
+@patch("services.report_service.get_ai_analysis")
+def test_queued_llm_call_dropped_after_deadline(mock_ai, monkeypatch):
+    """Test an LLM call still queued when the report gives up is never made"""
+    monkeypatch.setattr(report_service, "AI_ANALYSIS_DEADLINE_SECONDS", 0.05)
+    monkeypatch.setattr(report_service, "_analysis_executor", report_service.ThreadPoolExecutor(max_workers=1))
+    mock_ai.side_effect = lambda data, deadline=None: time.sleep(0.2) or "{}"
+    get_report_analysis(REPORT_DATA, True)  # occupies the only worker past its deadline
+    _, source = get_report_analysis(REPORT_DATA, True)
+    assert source == "local"
+    time.sleep(0.3)
+    assert mock_ai.call_count == 1
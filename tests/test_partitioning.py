@@ -0,0 +1,101 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+from data_access.main import copy_food_transactions, get_daily_food_items, get_food_transactions
+
+
+@patch("data_access.main.get_db_connection")
+def test_get_food_transactions_bounds_dates(mock_connection):
+    """Test a date range is pushed into the query so partitions can be pruned"""
+    cursor = mock_connection.return_value.cursor.return_value
+    cursor.fetchall.return_value = []
+    get_food_transactions(1, "2025-02-01", "2025-02-28")
+    query, params = cursor.execute.call_args[0]
+    assert "consumption_date >= %s" in query and "consumption_date <= %s" in query
+    assert params == [1, "2025-02-01", "2025-02-28"]
+
+
+@patch("data_access.main.get_db_connection")
+def test_daily_food_items_grouped_in_the_database(mock_connection):
+    """Test the report food list is grouped per food and day by the query, within the date range"""
+    cursor = mock_connection.return_value.cursor.return_value
+    cursor.fetchall.return_value = []
+    get_daily_food_items(1, "2025-02-01", "2025-02-28")
+    query, params = cursor.execute.call_args[0]
+    assert "GROUP BY consumption_date, nutrition_ref_id" in query
+    assert "consumption_date >= %s" in query and "consumption_date <= %s" in query
+    assert params == [[1], "2025-02-01", "2025-02-28"]
+
+
+@patch("data_access.main.ensure_food_transaction_partitions")
+@patch("data_access.main.get_db_connection")
+def test_copy_creates_partitions_for_batch_dates(mock_connection, mock_ensure):
+    """Test bulk loads create the partitions their dates need before copying"""
+    cursor = mock_connection.return_value.cursor.return_value
+    cursor.rowcount = 1
+    rows = [
+        (1, 1, Decimal("1"), date(2025, 3, 5)),
+        (2, 1, Decimal("2"), date(2025, 1, 9)),
+    ]
+    assert copy_food_transactions(rows, "batch") == 2
+    mock_ensure.assert_called_once_with(date(2025, 1, 9), date(2025, 3, 5))
+    cursor.copy_expert.assert_called_once()
+
+
+@patch("routes.routes.get_patient_bundle")
+def test_report_data_limited_to_valid_date_range(mock_collect):
+    """Test patient data is fetched for the report range, or in full for invalid dates"""
+    from routes.routes import get_patient_data
+    get_patient_data("3", "2025-02-01", "2025-02-28")
+    mock_collect.assert_called_with(3, "2025-02-01", "2025-02-28")
+    get_patient_data("3", "2025-02-01", "not-a-date")
+    mock_collect.assert_called_with(3, None, None)
+
+
+@patch("services.partitions.ensure_food_transaction_partitions", return_value=2)
+def test_upcoming_partitions_cover_this_month_through_months_ahead(mock_ensure):
+    """Test maintenance asks for whole months from this one through the months ahead"""
+    from services.partitions import ensure_upcoming_partitions
+    assert ensure_upcoming_partitions(date(2025, 11, 17), months_ahead=3) == 2
+    mock_ensure.assert_called_once_with(date(2025, 11, 1), date(2026, 2, 28))
+
+
+@patch("services.report_storage.REPORT_COMPACTION_INTERVAL", 60)
+@patch("services.partitions.PARTITION_MAINTENANCE_INTERVAL", 60)
+@patch("services.partitions.start_partition_worker")
+@patch("services.report_storage.start_compaction_worker")
+def test_create_app_starts_no_maintenance_workers(mock_compaction, mock_partitions):
+    """Test building the app (in the gunicorn master or a test) leaves maintenance to its own process"""
+    import threading
+    from app import create_app
+    create_app()
+    mock_compaction.assert_not_called()
+    mock_partitions.assert_not_called()
+    assert not {"report-compaction", "partition-maintenance"} & {t.name for t in threading.enumerate()}
+
+
+@patch("services.maintenance.stop_partition_worker")
+@patch("services.maintenance.stop_compaction_worker")
+@patch("services.maintenance.start_partition_worker", return_value=MagicMock())
+@patch("services.maintenance.start_compaction_worker", return_value=MagicMock())
+def test_maintenance_process_runs_workers_until_signalled(mock_compaction, mock_partitions,
+                                                          mock_stop_compaction, mock_stop_partitions):
+    """Test the maintenance process starts both workers and stops them on SIGTERM"""
+    from services import maintenance
+    # Deliver the signal as soon as its handler is installed
+    with patch("services.maintenance.signal.signal", side_effect=lambda signum, handler: handler(signum, None)):
+        with pytest.raises(SystemExit):
+            maintenance.main()
+    mock_compaction.assert_called_once_with()
+    mock_partitions.assert_called_once_with()
+    mock_stop_compaction.assert_called_once_with()
+    mock_stop_partitions.assert_called_once_with()
+
+
+@patch("services.maintenance.start_partition_worker", return_value=None)
+@patch("services.maintenance.start_compaction_worker", return_value=None)
+def test_maintenance_process_exits_when_both_workers_are_off(mock_compaction, mock_partitions):
+    """Test the process returns cleanly when both intervals are 0"""
+    from services import maintenance
+    assert maintenance.main() is None
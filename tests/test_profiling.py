@@ -0,0 +1,63 @@
+import os
+import pytest
+from flask import Flask
+from services import profiling
+from utils.utils import convert_dates_to_strings
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    app = Flask(__name__)
+
+    @app.route("/slow")
+    def slow():
+        convert_dates_to_strings({"rows": [{"n": i} for i in range(100)]})
+        return "ok"
+
+    profiling.init_profiling(app)
+    return app.test_client()
+
+
+def test_token_profiles_request_and_saves_file(client, tmp_path):
+    """Test a request with the configured token returns a summary header and a saved profile"""
+    response = client.get("/slow", headers={"X-Profile-Token": "secret"})
+    summary = dict(part.split("=") for part in response.headers["X-Profile-Summary"].split("; "))
+    assert float(summary["convert_dates_to_strings"].rstrip("ms")) > 0
+    assert set(profiling.PROFILE_BUCKETS) <= set(summary)
+    assert os.listdir(tmp_path) == [response.headers["X-Profile-File"]]
+
+
+def test_requests_without_valid_token_are_not_profiled(client, tmp_path):
+    """Test missing or wrong tokens leave the request unprofiled"""
+    assert "X-Profile-Summary" not in client.get("/slow").headers
+    assert "X-Profile-Summary" not in client.get("/slow", headers={"X-Profile-Token": "guess"}).headers
+    assert os.listdir(tmp_path) == []
+
+
+def test_profiling_disabled_without_configuration(monkeypatch):
+    """Test no hooks are registered when neither a token nor sampling is configured"""
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "")
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0.0)
+    app = Flask(__name__)
+    profiling.init_profiling(app)
+    assert not app.before_request_funcs
+
+
+def test_only_newest_profiles_are_kept(client, tmp_path, monkeypatch):
+    """Test old profile files are pruned past PROFILE_MAX_FILES"""
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 2)
+    for _ in range(4):
+        client.get("/slow", headers={"X-Profile-Token": "secret"})
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_one_profile_at_a_time(client, tmp_path, monkeypatch):
+    """Test a request is not profiled while another profile holds the process-wide lock"""
+    monkeypatch.setattr(profiling, "PROFILE_LOCK_TIMEOUT", 0.01)
+    with profiling._profile_lock:
+        assert "X-Profile-Summary" not in client.get("/slow", headers={"X-Profile-Token": "secret"}).headers
+    assert "X-Profile-Summary" in client.get("/slow", headers={"X-Profile-Token": "secret"}).headers
+    assert not profiling._profile_lock.locked()
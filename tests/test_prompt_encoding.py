@@ -0,0 +1,46 @@
+from services.prompt_encoding import count_tokens, encode_patient_context, load_template
+
+
+REPORT_DATA = {
+    "patient": {"id": 1, "name": "John Doe", "age": 45, "allergies": ["Peanuts", "Shellfish"]},
+    "nutrients": {
+        "calories": {"actual": 334.00000001, "target": 2000},
+        "protein": {"actual": "32.87", "target": 50},
+    },
+    "food_items": [
+        {"name": "Apple, raw", "quantity": 2.0, "calories": 52.0, "date": "2025-02-01"},
+        {"name": "Apple, raw", "quantity": 1.0, "calories": 52.0, "date": "2025-02-02"},
+        {"name": "Chicken Breast, roasted", "quantity": 1.0, "calories": 165.0, "date": "2025-02-01"},
+    ],
+    "summary": {"total_calories": 334.0, "date_range": {"start": "2025-02-01", "end": ""}},
+    "ai_analysis": {},
+}
+
+
+def test_encoding_is_compact_and_deterministic():
+    """Test numbers are rounded, empties dropped and foods aggregated"""
+    encoded = encode_patient_context(REPORT_DATA)
+    assert encoded == encode_patient_context(dict(REPORT_DATA))
+    assert "nutrients (actual/target): calories=334/2000 protein=32.9/50" in encoded
+    assert "- Apple, raw: 3 servings, 156 kcal, 2 days" in encoded
+    assert "allergies: Peanuts, Shellfish" in encoded
+    assert "ai_analysis" not in encoded
+    assert "end" not in encoded
+    assert count_tokens(encoded) < count_tokens(str(REPORT_DATA))
+
+
+def test_template_is_cached():
+    """Test templates are read from disk once"""
+    assert load_template("response_format.json") is load_template("response_format.json")
+
+
+def test_token_stats_are_sampled(monkeypatch):
+    """Test token counts are only taken for one in PROMPT_STATS_SAMPLE_EVERY prompts"""
+    from services import prompt_encoding
+    monkeypatch.setattr(prompt_encoding, "PROMPT_STATS_SAMPLE_EVERY", 3)
+    monkeypatch.setattr(prompt_encoding, "_stats", dict.fromkeys(prompt_encoding._stats, 0))
+    for _ in range(4):
+        encode_patient_context(REPORT_DATA)
+    stats = prompt_encoding.get_prompt_encoding_stats()
+    assert stats["prompts"] == 4 and stats["sampled_prompts"] == 2
+    assert stats["tokens_after"] == 2 * count_tokens(encode_patient_context(REPORT_DATA))
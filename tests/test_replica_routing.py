@@ -0,0 +1,67 @@
+import psycopg2
+from unittest.mock import MagicMock, patch
+from data_access.main import ReplicaRouter
+
+
+def make_connection(lag=0.0):
+    conn = MagicMock()
+    conn.cursor.return_value.fetchone.return_value = (lag,)
+    return conn
+
+
+def make_router(**kwargs):
+    primary = MagicMock(name="primary")
+    router = ReplicaRouter(["replica-a", "replica-b"], primary_connect=lambda: primary, **kwargs)
+    return router, primary
+
+
+@patch("data_access.main.psycopg2.connect")
+def test_round_robin_across_replicas(mock_connect):
+    """Test reads alternate between healthy replicas"""
+    connections = {"replica-a": make_connection(), "replica-b": make_connection()}
+    mock_connect.side_effect = lambda dsn, **kwargs: connections[dsn]
+    router, _ = make_router()
+    used = [router.connect() for _ in range(4)]
+    assert used == [connections["replica-a"], connections["replica-b"]] * 2
+
+
+@patch("data_access.main.psycopg2.connect")
+def test_lagging_and_down_replicas_fall_back_to_primary(mock_connect):
+    """Test replicas over the lag threshold or unreachable are skipped"""
+    def connect(dsn, **kwargs):
+        if dsn == "replica-a":
+            return make_connection(lag=60.0)
+        raise psycopg2.OperationalError("connection refused")
+    mock_connect.side_effect = connect
+    router, primary = make_router(max_lag=10)
+    assert router.connect() is primary
+    stats = router.stats()
+    assert stats["primary_reads"] == 1
+    assert [r["available"] for r in stats["replicas"]] == [False, False]
+
+
+@patch("data_access.main.time.monotonic")
+@patch("data_access.main.psycopg2.connect")
+def test_replica_rejoins_after_retry_period(mock_connect, mock_time):
+    """Test a skipped replica is tried again once its retry period has passed"""
+    mock_time.return_value = 100.0
+    lag = {"value": 60.0}
+    mock_connect.side_effect = lambda dsn, **kwargs: make_connection(lag=lag["value"])
+    router, primary = make_router(max_lag=10, retry_seconds=30)
+    router.replicas = router.replicas[:1]
+    assert router.connect() is primary
+
+    lag["value"] = 0.0
+    mock_time.return_value = 120.0
+    assert router.connect() is primary
+    mock_time.return_value = 131.0
+    assert router.connect() is not primary
+
+
+@patch("data_access.main.psycopg2.connect")
+def test_replica_with_disconnected_wal_receiver_is_skipped(mock_connect):
+    """Test a replica whose freshness cannot be established (infinite lag) is never read from"""
+    mock_connect.side_effect = lambda dsn, **kwargs: make_connection(lag=float("inf"))
+    router, primary = make_router(max_lag=10)
+    assert router.connect() is primary
+    assert [r["lag_seconds"] for r in router.stats()["replicas"]] == [None, None]
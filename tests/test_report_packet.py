@@ -0,0 +1,83 @@
+import json
+import zipfile
+import pytest
+from unittest.mock import patch
+from services import report_packet, report_storage
+from services.report_packet import generate_report_packet
+from services.report_storage import LocalReportStorage
+
+manifests = []
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalReportStorage(str(tmp_path))
+    monkeypatch.setattr(report_storage, "_storage", storage)
+    manifests.clear()
+    return storage
+
+
+def fake_render(manifest_path):
+    """Stand-in for render-packet.js: writes each report's PDF and the merged one."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    with open(manifest["shell"]) as f:
+        manifest["shell_html"] = f.read()
+    manifests.append(manifest)
+    for report in manifest["reports"]:
+        with open(report["pdf"], "wb") as f:
+            f.write(f"%PDF {report['title']}".encode())
+    if manifest["merged"]:
+        with open(manifest["merged"], "wb") as f:
+            f.write(b"%PDF merged")
+    return ""
+
+
+def prepared(bundle, patient_id, start_date, end_date, include_ai):
+    if patient_id == 99:
+        raise LookupError("no such patient")
+    return {"patient": {"name": f"Patient Name {patient_id}", "id": patient_id},
+            "date_range": {"start": start_date, "end": end_date}}
+
+
+@patch("services.report_packet.render_pdf_packet", side_effect=fake_render)
+@patch("services.report_packet.prepare_report_data", side_effect=prepared)
+@patch("services.report_packet.get_patient_bundle", return_value={})
+def test_pdf_packet_renders_every_patient_in_one_session(mock_bundle, mock_prepare, mock_render, storage):
+    """Test one render call covers every patient and merges into the stored packet"""
+    result = generate_report_packet([3, 1, 3], "2025-03-01", "2025-03-07")
+
+    assert mock_render.call_count == 1
+    manifest = manifests[0]
+    assert "const reportData = null;" in manifest["shell_html"]
+    assert [r["title"] for r in manifest["reports"]] == ["Patient Name 3 (ID 3)", "Patient Name 1 (ID 1)"]
+    assert manifest["merged"] == storage.local_path(result["file"])
+    assert result["file"].startswith("packets/") and result["file"].endswith(".pdf")
+    assert result["patients"] == [3, 1]
+    assert storage.read_bytes(result["file"]) == b"%PDF merged"
+    assert mock_prepare.call_args.args[4] == "fast"
+
+
+@patch("services.report_packet.render_pdf_packet", side_effect=fake_render)
+@patch("services.report_packet.prepare_report_data", side_effect=prepared)
+@patch("services.report_packet.get_patient_bundle", return_value={})
+def test_zip_packet_holds_a_pdf_per_patient_and_skips_failures(mock_bundle, mock_prepare, mock_render, storage):
+    """Test a zip packet stores each report and reports patients left out"""
+    result = generate_report_packet([1, 99, 2], format="zip", include_ai=False)
+
+    assert manifests[0]["merged"] is None
+    assert result["failed"] == [{"patient_id": 99, "error": "no such patient"}]
+    with zipfile.ZipFile(storage.local_path(result["file"])) as packet:
+        assert packet.namelist() == ["1_nutrition_report.pdf", "2_nutrition_report.pdf"]
+        assert packet.read("2_nutrition_report.pdf") == b"%PDF Patient Name 2 (ID 2)"
+
+
+def test_packet_requests_are_validated(storage, monkeypatch):
+    """Test unknown formats, empty and oversized packets are rejected before any work"""
+    monkeypatch.setattr(report_packet, "REPORT_PACKET_MAX_PATIENTS", 2)
+    with pytest.raises(ValueError):
+        generate_report_packet([1], format="docx")
+    with pytest.raises(ValueError):
+        generate_report_packet([])
+    with pytest.raises(ValueError):
+        generate_report_packet([1, 2, 3])
@@ -0,0 +1,148 @@
+import pytest
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch
+from services import report_scheduler, report_service, report_storage
+from services.report_scheduler import ReportDefinition, current_window, run_definition
+from services.report_service import find_reusable_report
+from services.report_storage import LocalReportStorage, add_report_metadata, report_key
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalReportStorage(str(tmp_path))
+    monkeypatch.setattr(report_storage, "_storage", storage)
+    return storage
+
+
+@pytest.fixture(autouse=True)
+def allergies_version():
+    with patch("services.report_service.get_table_version", return_value=None) as mock_version:
+        yield mock_version
+
+
+def store_report(storage, generated_at, sections=None, include_ai=True, analysis_source="ai", data_read_at=None):
+    key = report_key(7, f"7_nutrition_{generated_at:%Y%m%d_%H%M%S}.pdf", generated_at)
+    with open(storage.path_for_write(key), "wb") as f:
+        f.write(b"%PDF")
+    add_report_metadata(7, {
+        "patient_id": "7", "filename": key, "format": "pdf", "generated_at": f"{generated_at:%Y%m%d_%H%M%S}",
+        "date_range": {"start": "2025-03-01", "end": "2025-03-07"}, "sections": sections, "include_ai": include_ai,
+        "analysis_source": analysis_source, "data_read_at": data_read_at and data_read_at.isoformat(),
+    })
+    return key
+
+
+def test_definition_date_range_is_inclusive():
+    """Test a 7 day window ending yesterday"""
+    definition = ReportDefinition("weekly", window_days=7, end_offset_days=1)
+    assert definition.date_range(date(2025, 3, 8)) == ("2025-03-01", "2025-03-07")
+
+
+def test_definition_rejects_unknown_sections():
+    """Test definitions are validated when loaded"""
+    with pytest.raises(ValueError):
+        ReportDefinition("weekly", sections=["not_a_section"])
+
+
+def test_current_window_crosses_midnight():
+    """Test a 23:00-02:00 window is found from both sides of midnight"""
+    expected = (datetime(2025, 3, 7, 23), datetime(2025, 3, 8, 2))
+    assert current_window(datetime(2025, 3, 8, 1, 30), "23:00-02:00") == expected
+    assert current_window(datetime(2025, 3, 8, 12), "23:00-02:00") == expected
+
+
+@patch("services.report_service.get_latest_transaction_created_at")
+def test_reusable_report_requires_matching_fresh_report(mock_latest, storage):
+    """Test only a matching report with no newer transaction writes is reused"""
+    generated_at = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    key = store_report(storage, generated_at)
+
+    mock_latest.return_value = generated_at - timedelta(hours=1)
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", None, True)["filename"] == key
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", None, "fast") is None
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", ["summary"], True) is None
+
+    mock_latest.return_value = generated_at + timedelta(minutes=5)
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", None, True) is None
+
+
+@patch("services.report_service.get_latest_transaction_created_at", return_value=None)
+def test_local_fallback_not_reused_for_ai_requests(mock_latest, storage):
+    """Test a report whose AI analysis fell back to local analysis is regenerated for AI requests"""
+    store_report(storage, datetime.now().replace(microsecond=0) - timedelta(hours=1), analysis_source="local")
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", None, True) is None
+
+
+@patch("services.report_service.get_latest_transaction_created_at")
+def test_write_during_generation_makes_report_stale(mock_latest, storage):
+    """Test freshness is judged against when the data was read, not when the PDF was stamped"""
+    generated_at = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    store_report(storage, generated_at, data_read_at=generated_at - timedelta(seconds=30))
+    mock_latest.return_value = generated_at - timedelta(seconds=10)
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", None, True) is None
+
+
+@patch("services.report_service.get_latest_transaction_created_at", return_value=None)
+def test_allergy_edit_makes_report_stale(mock_latest, storage, allergies_version):
+    """Test an allergy written after the data was read, on the database clock, makes the report stale"""
+    read_at = datetime(2025, 3, 8, 1, tzinfo=timezone.utc)
+    generated_at = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    store_report(storage, generated_at, data_read_at=read_at)
+    allergies_version.return_value = (3, read_at - timedelta(days=1))
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", None, True) is not None
+    allergies_version.return_value = (4, read_at + timedelta(seconds=1))
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", None, True) is None
+
+
+@patch("services.report_service.get_latest_transaction_created_at", return_value=None)
+def test_reusable_report_expires(mock_latest, storage, monkeypatch):
+    """Test reports older than REPORT_REUSE_MAX_AGE_HOURS are regenerated"""
+    monkeypatch.setattr(report_service, "REPORT_REUSE_MAX_AGE_HOURS", 24)
+    store_report(storage, datetime.now() - timedelta(hours=25))
+    assert find_reusable_report("7", "2025-03-01", "2025-03-07", None, True) is None
+
+
+@patch("services.report_scheduler.generate_patient_report", return_value={"format": "pdf", "analysis_source": "local"})
+@patch("services.report_scheduler.get_patient_bundle_with_read_time", return_value=({}, datetime(2025, 3, 8, 1)))
+@patch("services.report_scheduler.find_reusable_report", side_effect=lambda pid, *args: pid == "2")
+def test_run_definition_skips_reusable_and_records_run(mock_reusable, mock_collect, mock_generate, storage):
+    """Test a run generates missing reports, reuses fresh ones and records itself once per window"""
+    definition = ReportDefinition("weekly", patient_ids=[1, 2, 3], include_ai="fast")
+    window_start = datetime.now() - timedelta(minutes=1)
+
+    run = run_definition(definition, window_start=window_start)
+
+    assert (run["generated"], run["reused"], run["failed"], run["deferred"]) == (2, 1, 0, 0)
+    assert {c.kwargs["patient_id"] for c in mock_generate.call_args_list} == {"1", "3"}
+    assert mock_generate.call_args.kwargs["data_read_at"] == datetime(2025, 3, 8, 1)
+    assert report_scheduler._load_state(storage)["weekly"]["generated"] == 2
+    # Another process (or a catch-up) for the same window does nothing
+    assert run_definition(definition, window_start=window_start)["skipped"]
+    assert mock_generate.call_count == 2
+
+
+def test_degraded_ai_report_counts_as_failed(storage):
+    """Test a pregenerated report that fell back to local analysis is retried by the next run"""
+    definition = ReportDefinition("weekly", patient_ids=[1], include_ai=True)
+    with patch("services.report_scheduler.find_reusable_report", return_value=None), \
+            patch("services.report_scheduler.get_patient_bundle_with_read_time", return_value=({}, datetime.now())), \
+            patch("services.report_scheduler.generate_patient_report",
+                  return_value={"format": "pdf", "analysis_source": "local"}):
+        assert run_definition(definition)["failed"] == 1
+
+
+@patch("services.report_scheduler.generate_patient_report")
+def test_run_definition_defers_after_deadline(mock_generate, storage):
+    """Test no report is started once the window has closed"""
+    definition = ReportDefinition("weekly", patient_ids=[1, 2])
+    run = run_definition(definition, deadline=datetime.now() - timedelta(seconds=1))
+    assert run["deferred"] == 2
+    mock_generate.assert_not_called()
+
+
+def test_api_process_reports_runs_recorded_by_scheduler_process(storage):
+    """Test /metrics in the API, where no scheduler runs, shows the runs the scheduler process recorded"""
+    run_definition(ReportDefinition("weekly", patient_ids=[]))
+    stats = report_scheduler.get_report_scheduler_stats()
+    assert stats["running"] is False
+    assert "weekly" in stats["last_runs"]
@@ -0,0 +1,170 @@
+import gzip
+import json
+import os
+import pytest
+from contextlib import contextmanager
+from datetime import datetime
+from services import report_storage
+from services.report_storage import (
+    LocalReportStorage,
+    add_report_metadata,
+    apply_html_policy,
+    compact_reports,
+    load_patient_reports,
+    report_key,
+)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalReportStorage(str(tmp_path))
+    monkeypatch.setattr(report_storage, "_storage", storage)
+    return storage
+
+
+def write(storage, key, content=b"data"):
+    with open(storage.path_for_write(key), "wb") as f:
+        f.write(content)
+
+
+def test_report_key_is_sharded():
+    """Test report keys are sharded by patient and month"""
+    key = report_key(1042, "1042_nutrition_20250316_104635.pdf", datetime(2025, 3, 16))
+    assert key == "042/1042/2025-03/1042_nutrition_20250316_104635.pdf"
+
+
+def test_html_compress_policy_keeps_only_sidecar(storage):
+    """Test the compress policy replaces intermediate HTML with its gzip sidecar"""
+    key = report_key(1, "1_nutrition_20250316_104635.html", datetime(2025, 3, 16))
+    write(storage, key, b"<html>report</html>")
+    apply_html_policy(key, "compress")
+    assert not storage.exists(key)
+    assert storage.exists(key + ".gz")
+
+
+def test_compaction_drops_missing_and_expired(storage, monkeypatch):
+    """Test compaction removes expired reports and index entries without files"""
+    monkeypatch.setattr(report_storage, "REPORT_RETENTION_DAYS", 30)
+    old_key = report_key(1, "1_nutrition_20240101_000000.pdf", datetime(2024, 1, 1))
+    new_key = report_key(1, "1_nutrition_20250301_000000.pdf", datetime(2025, 3, 1))
+    missing_key = report_key(1, "1_nutrition_20250302_000000.pdf", datetime(2025, 3, 2))
+    write(storage, old_key)
+    write(storage, new_key)
+    for key, generated_at in ((old_key, "20240101_000000"), (new_key, "20250301_000000"), (missing_key, "20250302_000000")):
+        add_report_metadata(1, {"patient_id": 1, "filename": key, "format": "pdf", "generated_at": generated_at})
+
+    stats = compact_reports(now=datetime(2025, 3, 10))
+
+    assert stats["expired"] == 1
+    assert stats["dropped"] == 1
+    assert not storage.exists(old_key)
+    assert [r["filename"] for r in load_patient_reports(1)] == [new_key]
+
+
+def test_compaction_migrates_legacy_flat_reports(storage):
+    """Test flat reports listed in report_index.json move into shards"""
+    write(storage, "2_nutrition_20250316_103427.pdf")
+    storage.write_bytes("report_index.json", json.dumps({"reports": [
+        {"patient_id": "2", "filename": "2_nutrition_20250316_103427.pdf", "generated_at": "2025-03-16T10:34:28"}
+    ]}).encode())
+
+    stats = compact_reports(now=datetime(2025, 3, 20))
+
+    assert stats["migrated"] == 1
+    reports = load_patient_reports(2)
+    assert reports[0]["filename"] == "002/2/2025-03/2_nutrition_20250316_103427.pdf"
+    assert storage.exists(reports[0]["filename"])
+    assert not os.path.exists(os.path.join(storage.root, "2_nutrition_20250316_103427.pdf"))
+
+
+def test_storage_backends_must_implement_the_interface():
+    """Test a backend missing part of the interface cannot be instantiated"""
+    class PartialStorage(report_storage.ReportStorageBackend):
+        def exists(self, key):
+            return False
+
+    with pytest.raises(TypeError):
+        PartialStorage()
+
+
+def test_generated_report_has_no_html_path_once_the_policy_removed_it(storage, monkeypatch):
+    """Test the response only points at the HTML while it still exists"""
+    from unittest.mock import patch
+    from services.report_service import generate_patient_report
+
+    def write_html(data, output_html_path, template_path):
+        with open(output_html_path, "w") as f:
+            f.write("<html>report</html>")
+
+    def write_pdf(html_path):
+        with open(os.path.splitext(html_path)[0] + ".pdf", "wb") as f:
+            f.write(b"%PDF")
+
+    with patch("services.report_service.prepare_report_data", return_value={}), \
+            patch("services.report_service.generate_html_file", side_effect=write_html), \
+            patch("services.report_service.generate_pdf", side_effect=write_pdf), \
+            patch("services.report_service.store_report_metadata"), \
+            patch("services.report_service.get_database_time", return_value=datetime(2025, 3, 8, 1)):
+        monkeypatch.setattr(report_storage, "REPORT_HTML_POLICY", "compress")
+        assert generate_patient_report({}, patient_id=1)["html_path"] is None
+        monkeypatch.setattr(report_storage, "REPORT_HTML_POLICY", "keep")
+        assert os.path.exists(generate_patient_report({}, patient_id=1)["html_path"])
+
+
+class MemoryStorage(report_storage.ReportStorageBackend):
+    """A backend with no local files, like a remote object store."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def path_for_write(self, key):
+        raise AssertionError("remote backends have no local path")
+
+    def commit(self, key):
+        pass
+
+    def exists(self, key):
+        return key in self.objects
+
+    def read_bytes(self, key):
+        return self.objects[key]
+
+    def write_bytes(self, key, data):
+        self.objects[key] = data
+
+    def delete(self, key):
+        self.objects.pop(key, None)
+
+    def move(self, key, new_key):
+        self.objects[new_key] = self.objects.pop(key)
+
+    def list_keys(self, prefix=""):
+        return [key for key in list(self.objects) if key.startswith(prefix)]
+
+    @contextmanager
+    def lock(self, name):
+        yield
+
+
+def test_policy_and_migration_go_through_the_backend(monkeypatch):
+    """Test HTML compaction and legacy migration never touch local paths"""
+    storage = MemoryStorage()
+    monkeypatch.setattr(report_storage, "_storage", storage)
+    storage.write_bytes("2_nutrition_20250316_103427.html", b"<html>report</html>")
+    apply_html_policy("2_nutrition_20250316_103427.html", "compress")
+    assert gzip.decompress(storage.read_bytes("2_nutrition_20250316_103427.html.gz")) == b"<html>report</html>"
+    assert not storage.exists("2_nutrition_20250316_103427.html")
+
+    storage.write_bytes("2_nutrition_20250316_103427.pdf", b"%PDF")
+    storage.write_bytes("report_index.json", json.dumps({"reports": [
+        {"patient_id": "2", "filename": "2_nutrition_20250316_103427.pdf", "generated_at": "2025-03-16T10:34:28"}
+    ]}).encode())
+    assert compact_reports(now=datetime(2025, 3, 20))["migrated"] == 1
+    assert storage.exists("002/2/2025-03/2_nutrition_20250316_103427.pdf")
+    assert storage.exists("002/2/2025-03/2_nutrition_20250316_103427.html.gz")
+
+
+def test_reports_dir_does_not_depend_on_the_working_directory():
+    """Test the default store is the package's reports/ wherever the process starts"""
+    assert os.path.isabs(report_storage.REPORTS_DIR)
+    assert os.path.dirname(report_storage.REPORTS_DIR) == os.path.dirname(os.path.dirname(report_storage.__file__))
@@ -0,0 +1,63 @@
+from unittest.mock import patch
+from services.aggregator import summarize_daily_rollups
+from services.report_service import format_report_data
+
+
+ROLLUPS = [
+    {"patient_id": 1, "rollup_date": "2025-02-01", "calories": "269.00", "protein_g": "31.52",
+     "fat_g": "3.94", "carbs_g": "28.00", "fiber_g": "4.80", "sodium_mg": "76.00", "transaction_count": 2},
+    {"patient_id": 1, "rollup_date": "2025-02-02", "calories": "65.00", "protein_g": "1.35",
+     "fat_g": "0.15", "carbs_g": "14.00", "fiber_g": "0.20", "sodium_mg": "0.50", "transaction_count": 1},
+]
+
+
+def test_summarize_daily_rollups_date_range():
+    """Test rollups are summed within the inclusive date range"""
+    totals = summarize_daily_rollups(ROLLUPS, "2025-02-02", "2025-02-28")
+    assert totals["calories"] == 65.0
+    assert totals["days"] == 1
+    assert totals["transaction_count"] == 1
+
+    totals = summarize_daily_rollups(ROLLUPS)
+    assert round(totals["protein"], 2) == 32.87
+    assert totals["days"] == 2
+
+
+@patch("services.report_service.get_cached_nutrition_reference")
+def test_format_report_data_uses_rollups(mock_refs):
+    """Test nutrient totals come from rollups rather than transactions"""
+    mock_refs.return_value = [{"id": 1, "food_name": "Apple, raw", "calories": "52"}]
+    patient_data = {
+        "patient_info": {"id": 1, "first_name": "John", "last_name": "Doe"},
+        "allergies": [],
+        "food_transactions": [
+            {"patient_id": 1, "nutrition_ref_id": 1, "servings": "2", "consumption_date": "2025-02-01"}
+        ],
+        "daily_nutrient_rollups": ROLLUPS,
+    }
+    report = format_report_data(patient_data, "2025-02-01", "2025-02-01")
+    assert report["nutrients"]["calories"]["actual"] == 269.0
+    assert report["nutrients"]["sodium"]["actual"] == 76.0
+    assert report["food_items"][0]["quantity"] == 2.0
+
+
+@patch("services.report_service.get_cached_nutrition_reference")
+def test_format_report_data_uses_daily_food_items(mock_refs):
+    """Test the food list comes from the per-day rows grouped in SQL, not from each transaction"""
+    mock_refs.return_value = [{"id": 1, "food_name": "Apple, raw", "calories": "52"}]
+    patient_data = {
+        "patient_info": {"id": 1, "first_name": "John", "last_name": "Doe"},
+        "allergies": [],
+        "food_transactions": [
+            {"patient_id": 1, "nutrition_ref_id": 1, "servings": "2", "consumption_date": "2025-02-01"},
+            {"patient_id": 1, "nutrition_ref_id": 1, "servings": "1", "consumption_date": "2025-02-01"},
+        ],
+        "daily_food_items": [
+            {"nutrition_ref_id": 1, "servings": "3", "entries": 2, "consumption_date": "2025-02-01"},
+            {"nutrition_ref_id": 1, "servings": "1", "entries": 1, "consumption_date": "2025-02-03"},
+        ],
+        "daily_nutrient_rollups": ROLLUPS,
+    }
+    report = format_report_data(patient_data, "2025-02-01", "2025-02-02")
+    assert report["food_items"] == [{"name": "Apple, raw", "quantity": 3.0, "calories": 52.0, "date": "2025-02-01"}]
+    assert report["summary"]["total_items_consumed"] == 2
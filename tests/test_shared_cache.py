@@ -0,0 +1,96 @@
+import pytest
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest.mock import patch
+from services import shared_cache
+from services.invalidation import publish_transactions_changed
+from services.shared_cache import (
+    LocalCacheBackend, decode, encode, get_cached_report_data, get_patient_bundle, get_patient_bundle_with_read_time
+)
+
+DB_TIME = datetime(2025, 3, 8, 1, 0, 5, tzinfo=timezone.utc)
+BUNDLE = {"patient_info": {"id": 3, "name": "Test"}, "food_transactions": [{"id": i, "servings": 1} for i in range(200)]}
+
+
+@pytest.fixture(autouse=True)
+def backend():
+    backend = LocalCacheBackend()
+    shared_cache.set_cache_backend(backend)
+    yield backend
+    shared_cache.set_cache_backend(None)
+
+
+@pytest.fixture(autouse=True)
+def database_time():
+    with patch("services.shared_cache.get_database_time", return_value=DB_TIME) as mock_time:
+        yield mock_time
+
+
+def test_encoding_round_trips_and_compresses_large_values():
+    """Test values survive serialization and large ones are compressed"""
+    small = {"servings": Decimal("1.5"), "name": "Oats"}
+    assert decode(encode(small)) == {"servings": 1.5, "name": "Oats"}
+    data = encode(BUNDLE)
+    assert data[:1].isupper()
+    assert len(data) < len(str(BUNDLE)) / 4
+    assert decode(data) == BUNDLE
+
+
+def test_local_backend_expires_and_evicts(backend, monkeypatch):
+    """Test the local stand-in honours TTLs and its entry limit"""
+    backend.max_entries = 2
+    backend.set("a", b"1", ttl=60)
+    backend.set("b", b"2")
+    backend.set("c", b"3")
+    assert backend.get("a") is None
+    now = [1000.0]
+    monkeypatch.setattr(shared_cache.time, "monotonic", lambda: now[0])
+    backend.set("d", b"4", ttl=10)
+    assert backend.get("d") == b"4"
+    now[0] += 11
+    assert backend.get("d") is None
+
+
+@patch("services.shared_cache.collect_reporting_data", return_value=BUNDLE)
+def test_bundle_cached_until_transactions_change(mock_collect):
+    """Test repeat views skip Postgres and a transaction change refetches"""
+    assert get_patient_bundle(3, "2025-03-01", "2025-03-07") == BUNDLE
+    assert get_patient_bundle(3, "2025-03-01", "2025-03-07") == BUNDLE
+    assert mock_collect.call_count == 1
+
+    publish_transactions_changed({3: {"2025-03-02"}})
+    get_patient_bundle(3, "2025-03-01", "2025-03-07")
+    assert mock_collect.call_count == 2
+    assert shared_cache.get_shared_cache_stats()["invalidations"] >= 1
+
+
+@patch("services.shared_cache.collect_reporting_data", return_value=BUNDLE)
+def test_cache_errors_fall_back_to_postgres(mock_collect, backend):
+    """Test an unreachable cache does not fail the request"""
+    with patch.object(backend, "get", side_effect=ConnectionError("cache down")):
+        assert get_patient_bundle(3) == BUNDLE
+        assert get_patient_bundle(3) == BUNDLE
+    assert mock_collect.call_count == 2
+
+
+def test_report_data_keyed_by_bundle_content():
+    """Test formatted data is reused for an identical bundle and rebuilt for a changed one"""
+    calls = []
+
+    def format_data():
+        calls.append(1)
+        return {"total_calories": 1800}
+
+    get_cached_report_data(BUNDLE, "2025-03-01", "2025-03-07", format_data)
+    get_cached_report_data(dict(BUNDLE), "2025-03-01", "2025-03-07", format_data)
+    assert len(calls) == 1
+    get_cached_report_data(dict(BUNDLE, allergies=[{"allergen": "Peanuts"}]), "2025-03-01", "2025-03-07", format_data)
+    assert len(calls) == 2
+
+
+@patch("services.shared_cache.collect_reporting_data", return_value=BUNDLE)
+def test_bundle_read_time_is_the_database_clock(mock_collect, database_time):
+    """Test the read time comes from Postgres and a cached bundle keeps its original one"""
+    assert get_patient_bundle_with_read_time(4) == (BUNDLE, DB_TIME)
+    database_time.return_value = datetime(2025, 3, 8, 2, tzinfo=timezone.utc)
+    assert get_patient_bundle_with_read_time(4)[1] == DB_TIME
@@ -0,0 +1,73 @@
+import time
+import threading
+import pytest
+from services.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    """Test concurrent callers with the same key run the function once"""
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"patient_id": 1}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do(1, compute)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do(1, compute))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    deadline = time.monotonic() + 5
+    while flight.stats()["deduplicated"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert results == [{"patient_id": 1}] * 4
+    stats = flight.stats()
+    assert stats["executions"] == 1
+    assert stats["deduplicated"] == 3
+    assert stats["in_flight"] == 0
+
+
+def test_errors_are_shared_and_not_cached():
+    """Test the error is raised to the caller and the key is retried afterwards"""
+    flight = SingleFlight("test")
+
+    def fail():
+        raise ValueError("database down")
+
+    with pytest.raises(ValueError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: "ok") == "ok"
+    assert flight.stats()["errors"] == 1
+
+
+def test_waiters_give_up_on_a_hung_call():
+    """Test a caller waiting on an in-flight call raises TimeoutError after wait_timeout"""
+    flight = SingleFlight("test", wait_timeout=0.05)
+    started = threading.Event()
+    release = threading.Event()
+
+    def hang():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    leader = threading.Thread(target=lambda: flight.do("k", hang))
+    leader.start()
+    started.wait(5)
+    with pytest.raises(TimeoutError):
+        flight.do("k", hang)
+    release.set()
+    leader.join(5)
+    assert flight.stats()["timeouts"] == 1
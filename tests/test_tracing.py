@@ -0,0 +1,94 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from psycopg2.extras import DictCursor
+from services import tracing
+
+sdk_trace = pytest.importorskip("opentelemetry.sdk.trace")
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+exporter = InMemorySpanExporter()
+provider = sdk_trace.TracerProvider()
+provider.add_span_processor(SimpleSpanProcessor(exporter))
+trace.set_tracer_provider(provider)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    exporter.clear()
+    monkeypatch.setattr(tracing, "_enabled", True)
+    yield
+    exporter.clear()
+
+
+def spans_by_name():
+    return {s.name: s for s in exporter.get_finished_spans()}
+
+
+def test_node_phases_become_child_spans(enabled):
+    """Test renderer TRACE_SPAN lines are removed from the output and recorded under the render span"""
+    stdout = 'HTML PATH: r.html\nTRACE_SPAN {"name": "page.pdf", "start": 1700000000000, "end": 1700000000250}\ndone\n'
+    with tracing.span("pdf render"):
+        assert tracing.record_node_spans(stdout) == "HTML PATH: r.html\ndone\n"
+
+    spans = spans_by_name()
+    phase = spans["node.page.pdf"]
+    assert phase.parent.span_id == spans["pdf render"].context.span_id
+    assert phase.end_time - phase.start_time == 250_000_000
+
+
+def test_trace_context_reaches_subprocess_env_and_executor_threads(enabled):
+    """Test TRACEPARENT is set for Node and bound executor work stays in the trace"""
+    def call_llm():
+        with tracing.span("llm chat_completion"):
+            pass
+
+    with tracing.span("report") as report:
+        env = tracing.inject_env({})
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(tracing.bind_context(call_llm)).result()
+
+    assert env["TRACEPARENT"].split("-")[1] == format(report.get_span_context().trace_id, "032x")
+    assert spans_by_name()["llm chat_completion"].parent.span_id == report.get_span_context().span_id
+
+
+def test_request_span_continues_incoming_trace(enabled, monkeypatch):
+    """Test a request with a traceparent header joins that trace and returns its id"""
+    monkeypatch.setattr(tracing, "OTEL_EXPORTER_OTLP_ENDPOINT", "http://collector:4318")
+    monkeypatch.setattr(tracing, "_provider", provider)
+    app = Flask(__name__)
+
+    @app.route("/patients/<int:patient_id>")
+    def patient(patient_id):
+        with tracing.span("db SELECT"):
+            return "ok"
+
+    tracing.init_tracing(app)
+    response = app.test_client().get("/patients/7", headers={"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"})
+
+    spans = spans_by_name()
+    server = spans["GET /patients/<int:patient_id>"]
+    assert response.headers["X-Trace-Id"] == TRACE_ID
+    assert format(server.context.trace_id, "032x") == TRACE_ID
+    assert server.attributes["http.response.status_code"] == 200
+    assert spans["db SELECT"].parent.span_id == server.context.span_id
+
+
+def test_traced_cursor_keeps_requested_cursor_class():
+    """Test traced cursors subclass the cursor factory the query asked for"""
+    traced = tracing._traced_cursor_class(DictCursor)
+    assert issubclass(traced, DictCursor)
+    assert tracing._traced_cursor_class(DictCursor) is traced
+
+
+def test_disabled_tracing_is_a_no_op():
+    """Test spans, env injection and context binding do nothing while tracing is off"""
+    fn = lambda: None
+    with tracing.span("anything") as current:
+        assert current is None
+    assert tracing.inject_env({}) == {}
+    assert tracing.bind_context(fn) is fn
@@ -0,0 +1,34 @@
+import os
+import runpy
+from unittest.mock import MagicMock, patch
+from services import warmup
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+
+
+def test_warm_up_continues_after_failed_step():
+    """Test a failing step is reported without stopping the others"""
+    calls = []
+
+    def failing():
+        raise RuntimeError("no database")
+
+    steps = [("db", failing), ("cache", lambda: calls.append("cache"))]
+    with patch.object(warmup, "WARMUP_STEPS", steps):
+        results = warmup.warm_up()
+    assert results["db"]["ok"] is False and results["db"]["error"] == "no database"
+    assert results["cache"]["ok"] is True
+    assert calls == ["cache"]
+
+
+def test_worker_recycled_when_rss_exceeds_limit():
+    """Test the post_request hook stops a worker whose RSS is over the limit"""
+    conf = runpy.run_path(GUNICORN_CONF)
+    worker = MagicMock(alive=True, pid=1)
+    conf["post_request"].__globals__["WORKER_MAX_RSS_MB"] = 10 ** 6
+    conf["post_request"](worker, None, {}, None)
+    assert worker.alive is True
+
+    conf["post_request"].__globals__["WORKER_MAX_RSS_MB"] = 1
+    conf["post_request"](worker, None, {}, None)
+    assert worker.alive is False
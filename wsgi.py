@@ -0,0 +1,4 @@
+"""WSGI entrypoint for production serving: gunicorn wsgi:app (see gunicorn.conf.py)."""
+from app import create_app
+
+app = create_app()